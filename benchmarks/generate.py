@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import random
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+from facilityid.backends.sqlite import SQLiteBackend
+
+# Where generated geodatabases are kept between benchmark runs
+DATA = os.path.join(tempfile.gettempdir(), 'facilityid-benchmarks')
+
+# The columns of every generated row
+FIELDS = ['GLOBALID', 'FACILITYID', 'created_date', 'last_edited_date',
+          'SHAPE_AREA', 'SHAPE_LENGTH']
+
+
+def facilityids(rows: int, prefix: str = 'WF', duplicates: float = 0.01,
+                nulls: float = 0.01, noise: float = 0.01,
+                sparsity: float = 0.0, outliers: int = 0, seed: int = 0):
+    """Yields synthetic FACILITYIDs with a controlled share of problems.
+
+    Parameters
+    ----------
+    rows : int
+        How many FACILITYIDs to yield
+    prefix : str, optional
+        The prefix of valid IDs, by default 'WF'
+    duplicates : float, optional
+        The share of rows that reuse an ID already handed out, by
+        default 0.01
+    nulls : float, optional
+        The share of rows without an ID, by default 0.01
+    noise : float, optional
+        The share of rows with a lowercase, foreign, or missing prefix,
+        by default 0.01
+    sparsity : float, optional
+        The chance that a run of unused IDs is skipped before an ID, by
+        default 0.0
+    outliers : int, optional
+        How many rows get IDs far above every other ID, by default 0
+    seed : int, optional
+        Seeds the random choices, by default 0
+
+    Yields
+    ------
+    str
+        A FACILITYID, or None
+    """
+
+    rnd = random.Random(seed)
+    outlier_rows = set(rnd.sample(range(rows), min(outliers, rows)))
+    noisy = [prefix.lower(), 'XX', '']
+    next_id = 1
+    for i in range(rows):
+        r = rnd.random()
+        if i in outlier_rows:
+            yield f"{prefix}{10 ** 9 + i}"
+        elif r < nulls:
+            yield None
+        elif r < nulls + duplicates and next_id > 1:
+            yield f"{prefix}{rnd.randrange(1, next_id)}"
+        elif r < nulls + duplicates + noise:
+            yield f"{rnd.choice(noisy)}{rnd.randrange(1, rows + 1)}"
+        else:
+            if sparsity and rnd.random() < sparsity:
+                next_id += rnd.randint(1, 100)
+            yield f"{prefix}{next_id}"
+            next_id += 1
+
+
+def generate(rows: int = 10000, shape: str = 'Polyline', folder: str = DATA,
+             seed: int = 0, feature: str = 'UTIL.Bench', **options) -> tuple:
+    """Creates a SQLite reference geodatabase with one synthetic feature
+    class, or reuses the one created with the same arguments.
+
+    Parameters
+    ----------
+    rows : int, optional
+        How many rows the feature class holds, by default 10000
+    shape : str, optional
+        Point, Polyline, or Polygon, by default 'Polyline'
+    folder : str, optional
+        Where geodatabases are created, by default DATA
+    seed : int, optional
+        Seeds the random values, by default 0
+    feature : str, optional
+        The name of the feature class, by default 'UTIL.Bench'
+    options
+        Passed on to facilityids, e.g. duplicates=0.05
+
+    Returns
+    -------
+    tuple
+        The system path to the feature class, like find_in_sde returns
+    """
+
+    spec = {"rows": rows, "shape": shape, "seed": seed, "feature": feature,
+            **options}
+    key = hashlib.sha1(json.dumps(spec, sort_keys=True).encode())
+    name = f"bench_{key.hexdigest()[:12]}"
+    connection = os.path.join(folder, f"{name}.sde")
+    done = os.path.join(folder, f"{name}.done")
+    if os.path.exists(done):
+        return connection, feature
+
+    # Start over if an earlier generation was interrupted
+    os.makedirs(folder, exist_ok=True)
+    for f in os.listdir(folder):
+        if f.startswith(f"{name}."):
+            os.remove(os.path.join(folder, f))
+
+    backend = SQLiteBackend()
+    connection = backend.create_geodatabase(folder, name)
+    backend.create_table(connection, feature, shape)
+
+    rnd = random.Random(seed)
+    now = datetime(2024, 1, 1)
+
+    def records():
+        for facilityid in facilityids(rows, seed=seed, **options):
+            yield ('{%s}' % str(uuid.UUID(int=rnd.getrandbits(128))).upper(),
+                   facilityid,
+                   now - timedelta(minutes=rnd.randrange(10 ** 6)),
+                   now - timedelta(minutes=rnd.randrange(10 ** 5)),
+                   rnd.random() * 1000, rnd.random() * 1000)
+
+    backend.insert_rows(connection, feature, FIELDS, records())
+    backend.clear_workspace_cache()
+    open(done, 'w').close()
+    return connection, feature
@@ -0,0 +1,137 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import facilityid.config as config
+
+from .generate import generate
+
+# Backend methods that wait on the database, as counted by the RunReport
+_QUERIES = ('execute', 'search_cursor', 'update_cursor', 'describe',
+            'list_fields', 'walk')
+
+
+class LatentBackend:
+    """Passes every call through to a backend, waiting before each query
+    as if the database were across a network.
+
+    Parameters
+    ----------
+    backend : Backend
+        The backend to slow down
+    latency : float
+        Seconds to wait before each query
+    """
+
+    def __init__(self, backend, latency: float):
+        self._backend = backend
+        self.latency = latency
+
+    def __getattr__(self, name):
+        attr = getattr(self._backend, name)
+        if name not in _QUERIES:
+            return attr
+
+        def latent(*args, **kwargs):
+            time.sleep(self.latency)
+            return attr(*args, **kwargs)
+        return latent
+
+
+def run(features: list, prefetch: int, workers: int = 1) -> float:
+    """Analyzes every feature, as the app does, with a prefetch limit and
+    a number of worker processes.
+
+    Parameters
+    ----------
+    features : list
+        System paths to the features, as returned by generate
+    prefetch : int
+        How many features ahead to send the metadata queries of
+    workers : int, optional
+        How many features to analyze at once, each in its own process,
+        by default 1
+
+    Returns
+    -------
+    float
+        Seconds taken to analyze every feature
+    """
+
+    from facilityid.app import analyses
+    from facilityid.utils.identifier import Identifier
+
+    # Start cold, as a new run would
+    Identifier.metadata.clear()
+    Identifier.grants.clear()
+    config.prefetch = prefetch
+    config.workers = workers
+    start = time.perf_counter()
+    for _ in analyses(features):
+        pass
+    return time.perf_counter() - start
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="benchmarks.latency",
+        description="Times the analysis of many features against a SQLite "
+                    "reference geodatabase that waits before each query, "
+                    "with several prefetch limits and worker processes.")
+    parser.add_argument("--features", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds to wait before each query")
+    parser.add_argument("--prefetch", default="0,1,2,4,8",
+                        help="comma separated prefetch limits to compare")
+    parser.add_argument("--workers", default="2,4",
+                        help="comma separated numbers of worker processes "
+                             "to compare, without prefetching")
+    parser.add_argument("--unchanged", action="store_true",
+                        help="time a run where every feature is skipped by "
+                             "its fingerprint, as on most days")
+    args = parser.parse_args(argv)
+
+    from facilityid import backends
+    from facilityid.backends.sqlite import SQLiteBackend
+    from facilityid.utils.report import CountedBackend
+
+    config.db = 'SQLITE'
+    config.workers = 1
+    for name in config.config['LOGGING']['loggers']:
+        config.logging.getLogger(name).setLevel(config.logging.WARNING)
+    print(f"Generating {args.features} features of {args.rows} rows...")
+    clean = dict(duplicates=0, nulls=0, noise=0) if args.unchanged else {}
+    features = [generate(args.rows, seed=i, feature=f"UTIL.Bench{i}",
+                         **clean) for i in range(args.features)]
+    config.edit = features[0][0]  # where the privileges are loaded from
+    os.chdir(tempfile.mkdtemp(prefix='facilityid-bench-'))
+    os.makedirs(os.path.join('facilityid', 'log'))
+    backends._backend = CountedBackend(
+        LatentBackend(SQLiteBackend(), args.latency))
+    if args.unchanged:
+        from facilityid.app import analyses
+        for analysis in analyses(features):
+            analysis["editor"].store_current()
+
+    # Every prefetch limit in this process, then every number of workers;
+    # the speedup is relative to the first setting
+    settings = [("prefetch", int(p), 1) for p in args.prefetch.split(",")]
+    settings += [("workers", 0, int(w)) for w in args.workers.split(",")
+                 if w and int(w) > 1]
+    print(f"{'setting':<14}{'seconds':>10}{'per feature':>14}"
+          f"{'speedup':>10}")
+    first = None
+    for name, prefetch, workers in settings:
+        seconds = run(features, prefetch, workers)
+        first = first or seconds
+        label = f"{name} {prefetch if name == 'prefetch' else workers}"
+        print(f"{label:<14}{seconds:>10.3f}"
+              f"{seconds / args.features:>14.3f}{first / seconds:>9.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
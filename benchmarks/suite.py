@@ -0,0 +1,411 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import lru_cache
+
+import facilityid.config as config
+
+from .generate import facilityids, generate
+
+# Where baseline results are stored
+BASELINES = os.path.join(os.path.dirname(__file__), 'baselines')
+
+# The root of the repository, for timing imports in a fresh interpreter
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that only the editing, emailing, or multi-worker code paths
+# need, and that importing the app should leave unloaded
+HEAVY = ['arcpy', 'yaml', 'smtplib', 'email.mime', 'cryptography',
+         'multiprocessing']
+
+# The fastest seconds each benchmark must meet, regardless of baseline
+TARGETS = {"import": 0.1}
+
+# How many synthetic FACILITYIDs bench_split parses
+SPLIT_IDS = 10 ** 6
+
+
+def _edit(feature):
+    from facilityid.utils.edit import Edit
+    editor = Edit(feature)
+    editor.analyze()
+    return editor
+
+
+def bench_rows(feature) -> dict:
+    """Streams every row of the table through a TableScan."""
+    from facilityid.utils.identifier import Identifier
+    scan = Identifier(feature).rows()
+    return {"rows": scan.count}
+
+
+@lru_cache(maxsize=1)
+def _split_values() -> list:
+    return list(facilityids(SPLIT_IDS))
+
+
+def bench_split(feature) -> dict:
+    """Parses a column of SPLIT_IDS FACILITYIDs, regardless of the
+    size of the table."""
+    from facilityid.utils.table import split_facilityids
+    values = _split_values()
+    start = time.perf_counter()
+    split_facilityids(values)
+    return {"seconds": time.perf_counter() - start, "rows": len(values)}
+
+
+def bench_duplicates(feature) -> dict:
+    """Finds the GLOBALIDs of duplicated FACILITYIDs."""
+    from facilityid.utils.identifier import Identifier
+    return {"rows": len(Identifier(feature).duplicates())}
+
+
+def bench_edit(feature) -> dict:
+    """Reads the table and works out every edit, as analyze does."""
+    return {"rows": len(_edit(feature).records)}
+
+
+def bench_allocate(feature) -> dict:
+    """Hands out new IDs for 1% of the rows, backfilling gaps."""
+    from facilityid.utils.allocator import IdAllocator
+    from facilityid.utils.identifier import Identifier
+    scan = Identifier(feature).rows()
+    ids = IdAllocator(scan.used_ids(), True, config.recycle_max_gap)
+    count = max(1, scan.count // 100)
+    for _ in range(count):
+        next(ids)
+    return {"rows": count}
+
+
+def bench_digest(feature) -> dict:
+    """Digests the (GLOBALID, FACILITYID) pairs of an edited table."""
+    editor = _edit(feature)
+    start = time.perf_counter()
+    editor.scan.digest()
+    return {"seconds": time.perf_counter() - start}
+
+
+def bench_shape_measures(feature) -> dict:
+    """Reads the length or area of every duplicated row, and before by
+    reading the shape of every row in the table."""
+    from facilityid.backends import get_backend
+    from facilityid.utils.identifier import Identifier
+    facilityid = Identifier(feature)
+    duplicates = facilityid.duplicates()
+    start = time.perf_counter()
+    facilityid.shape_measures(duplicates)
+    seconds = time.perf_counter() - start
+
+    measure = "area" if facilityid.shapeType == "Polygon" else "length"
+    start = time.perf_counter()
+    with get_backend().search_cursor(facilityid.full_path,
+                                     ['GLOBALID', 'SHAPE@']) as search:
+        shapes = {g: getattr(shape, measure) for g, shape in search
+                  if g in duplicates}
+    return {"seconds": seconds, "before": time.perf_counter() - start,
+            "rows": len(shapes)}
+
+
+def _peak_mb(build) -> float:
+    """Traces the peak memory of calling build."""
+    tracemalloc.start()
+    try:
+        build()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def bench_peak_memory(feature) -> dict:
+    """Traces the peak memory of reading and analyzing the table."""
+    return {"peak_mb": _peak_mb(lambda: _edit(feature))}
+
+
+def bench_row_table(feature) -> dict:
+    """Traces the peak memory of holding every row of the table in a
+    RowTable, and before as a list of dicts like rows once returned,
+    from the same rows read up front."""
+    from facilityid.backends import get_backend
+    from facilityid.utils.identifier import Identifier
+    from facilityid.utils.table import TableScan, split_facilityids
+    facilityid = Identifier(feature)
+    fields = ['GLOBALID', 'FACILITYID', facilityid.createdAtFieldName,
+              facilityid.editedAtFieldName]
+    with get_backend().search_cursor(facilityid.full_path, fields) as search:
+        rows = [tuple(r) for r in search]
+
+    def dicts():
+        parsed = zip(*split_facilityids(r[1] for r in rows))
+        return [{**dict(zip(fields, r)),
+                 "FACILITYID": {"prefix": p, "str_id": s, "int_id": i}}
+                for r, (p, s, i) in zip(rows, parsed)]
+
+    def table():
+        TableScan().read(rows)
+    return {"peak_mb": _peak_mb(table), "before": _peak_mb(dicts),
+            "rows": len(rows)}
+
+
+def bench_import(feature) -> dict:
+    """Times importing the app in a fresh interpreter, and lists the
+    HEAVY modules that the import loaded."""
+    code = ("import sys, time; start = time.perf_counter(); "
+            "import facilityid.app; print(time.perf_counter() - start); "
+            f"print(*[m for m in {HEAVY!r} if m in sys.modules])")
+    env = {**os.environ, "PYTHONPATH": ROOT}
+    out = subprocess.run([sys.executable, "-c", code], env=env, check=True,
+                         capture_output=True, text=True, cwd=os.getcwd())
+    seconds, *loaded = out.stdout.split()
+    return {"seconds": float(seconds), "heavy": loaded}
+
+
+# Every benchmark, by name. Cases that return "seconds" time themselves,
+# and cases that return "peak_mb" are compared by memory instead of time
+# and only run once. Cases that return "before" measure the approach they
+# replaced the same way, to report the two side by side.
+CASES = {"rows": bench_rows,
+         "split": bench_split,
+         "duplicates": bench_duplicates,
+         "edit": bench_edit,
+         "allocate": bench_allocate,
+         "digest": bench_digest,
+         "shape_measures": bench_shape_measures,
+         "peak_memory": bench_peak_memory,
+         "row_table": bench_row_table,
+         "import": bench_import}
+
+# The cases that trace memory, which are too slow to repeat
+MEMORY = ["peak_memory", "row_table"]
+
+
+def run(feature, cases: list = None, repeat: int = 5) -> dict:
+    """Runs benchmarks against a feature class.
+
+    Parameters
+    ----------
+    feature : tuple
+        The system path to the feature class, as returned by generate
+    cases : list, optional
+        Names of the benchmarks to run, by default every benchmark
+    repeat : int, optional
+        How many times to run each benchmark, by default 5
+
+    Returns
+    -------
+    dict
+        The median and fastest seconds of each benchmark, or its peak
+        memory, along with anything else the benchmark counted
+    """
+
+    results = dict()
+    for name in cases or CASES:
+        case = CASES[name]
+        times, before, extra = list(), list(), dict()
+        if name not in MEMORY:
+            case(feature)  # warm up the caches before timing
+        for _ in range(1 if name in MEMORY else repeat):
+            start = time.perf_counter()
+            extra = case(feature)
+            times.append(extra.pop("seconds", time.perf_counter() - start))
+            before.append(extra.get("before"))
+        if "peak_mb" in extra:
+            results[name] = extra
+        else:
+            results[name] = {"median": statistics.median(times),
+                             "min": min(times), **extra}
+            if "before" in extra:
+                # Compared by its fastest run, like the time itself
+                results[name]["before"] = min(before)
+    return results
+
+
+def compare(baseline: dict, current: dict, tolerance: float = 0.2) -> tuple:
+    """Compares results to a baseline. Times are compared by their
+    fastest run, which is the least disturbed by other processes.
+
+    Parameters
+    ----------
+    baseline : dict
+        Results stored by an earlier run
+    current : dict
+        Results of this run
+    tolerance : float, optional
+        How much slower, or bigger, a benchmark may get before it counts
+        as a regression, by default 0.2
+
+    Returns
+    -------
+    str
+        A table of each benchmark's baseline, current value, and change
+    bool
+        Whether any benchmark regressed
+    """
+
+    lines = [f"{'benchmark':<16}{'baseline':>12}{'current':>12}"
+             f"{'change':>9}  status"]
+    regressed = False
+    for name, result in current.items():
+        key = "peak_mb" if "peak_mb" in result else "min"
+        unit = " MB" if key == "peak_mb" else " s"
+        now = result[key]
+        before = baseline.get(name, {}).get(key)
+        if before is None:
+            lines.append(f"{name:<16}{'-':>12}{f'{now:.4f}{unit}':>12}"
+                         f"{'':>9}  new")
+            continue
+        change = (now - before) / before if before else 0.0
+        if change > tolerance:
+            status, regressed = "SLOWER" if key == "min" else "BIGGER", True
+        elif change < -tolerance:
+            status = "faster" if key == "min" else "smaller"
+        else:
+            status = "same"
+        lines.append(f"{name:<16}{f'{before:.4f}{unit}':>12}"
+                     f"{f'{now:.4f}{unit}':>12}{change:>+9.1%}  {status}")
+    return "\n".join(lines), regressed
+
+
+def before_after(results: dict) -> str:
+    """Lists the benchmarks that also measured the approach they
+    replaced, next to what they measure now.
+
+    Parameters
+    ----------
+    results : dict
+        Results of this run
+
+    Returns
+    -------
+    str
+        A line for each benchmark, with how many times smaller or faster
+        it is now
+    """
+
+    lines = list()
+    for name, result in results.items():
+        if "before" not in result:
+            continue
+        key = "peak_mb" if "peak_mb" in result else "min"
+        unit = " MB" if key == "peak_mb" else " s"
+        before, now = result["before"], result[key]
+        ratio = f"{before / now:.1f}x" if now else "-"
+        lines.append(f"{name:<16}{f'{before:.4f}{unit}':>12}"
+                     f"{f'{now:.4f}{unit}':>12}{ratio:>9}")
+    if lines:
+        lines.insert(0, f"{'benchmark':<16}{'before':>12}{'after':>12}"
+                        f"{'ratio':>9}")
+    return "\n".join(lines)
+
+
+def check_targets(results: dict) -> tuple:
+    """Checks results against TARGETS, and the import against HEAVY.
+
+    Parameters
+    ----------
+    results : dict
+        Results of this run
+
+    Returns
+    -------
+    str
+        A line for each target, and for any heavy module that was loaded
+    bool
+        Whether any target was missed
+    """
+
+    lines, missed = list(), False
+    for name, target in TARGETS.items():
+        if name not in results:
+            continue
+        now = results[name]["min"]
+        status = "met" if now <= target else "MISSED"
+        missed |= now > target
+        lines.append(f"{name:<16}{f'{target:.4f} s':>12}"
+                     f"{f'{now:.4f} s':>12}  {status}")
+    heavy = results.get("import", {}).get("heavy")
+    if heavy:
+        missed = True
+        lines.append(f"importing the app loaded {', '.join(heavy)}")
+    return "\n".join(lines), missed
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="benchmarks",
+        description="Benchmarks the core algorithms of facilityid against "
+                    "a synthetic SQLite reference geodatabase.")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--shape", default="Polyline",
+                        choices=["Point", "Polyline", "Polygon"])
+    parser.add_argument("--duplicates", type=float, default=0.01)
+    parser.add_argument("--nulls", type=float, default=0.01)
+    parser.add_argument("--noise", type=float, default=0.01)
+    parser.add_argument("--sparsity", type=float, default=0.0)
+    parser.add_argument("--outliers", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cases", default=",".join(CASES),
+                        help="comma separated benchmarks to run")
+    parser.add_argument("--baseline",
+                        help="baseline file, by default one named after "
+                             "the table options in benchmarks/baselines")
+    parser.add_argument("--save", action="store_true",
+                        help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    options = {"duplicates": args.duplicates, "nulls": args.nulls,
+               "noise": args.noise, "sparsity": args.sparsity,
+               "outliers": args.outliers}
+    label = "_".join([f"rows{args.rows}", args.shape.lower()] +
+                     [f"{k}{v}" for k, v in options.items()])
+    baseline_file = os.path.abspath(
+        args.baseline or os.path.join(BASELINES, f"{label}.json"))
+
+    # Run against the SQLite backend in a scratch working directory, so
+    # that the store of previous runs is never touched
+    config.db = 'SQLITE'
+    for name in config.config['LOGGING']['loggers']:
+        config.logging.getLogger(name).setLevel(config.logging.WARNING)
+    print(f"Generating {args.rows} rows...")
+    feature = generate(args.rows, args.shape, **options)
+    os.chdir(tempfile.mkdtemp(prefix='facilityid-bench-'))
+    os.makedirs(os.path.join('facilityid', 'log'))
+    results = run(feature, args.cases.split(","), args.repeat)
+    report = {"python": platform.python_version(),
+              "platform": platform.platform(),
+              "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "table": {"rows": args.rows, "shape": args.shape, **options},
+              "results": results}
+
+    regressed = False
+    if os.path.exists(baseline_file):
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+        table, regressed = compare(baseline["results"], results,
+                                   args.tolerance)
+        print(f"Compared to {baseline_file}:")
+        print(table)
+    else:
+        table, _ = compare(dict(), results)
+        print(table)
+    changes = before_after(results)
+    if changes:
+        print("Before and after:")
+        print(changes)
+    targets, missed = check_targets(results)
+    if targets:
+        print("Targets:")
+        print(targets)
+    if args.save:
+        os.makedirs(os.path.dirname(baseline_file), exist_ok=True)
+        with open(baseline_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved the baseline to {baseline_file}")
+    return 1 if missed or (regressed and not args.save) else 0
@@ -1,14 +1,27 @@
+import argparse
+
 import facilityid.app as app
 import facilityid.config as config
-from facilityid.utils.management import list_files
+from facilityid.utils.audit import AuditLog, CsvLog
+from facilityid.utils.management import Artifacts
+from facilityid.utils.report import RunReport
 
 # Initiate a logger for __main__
 log = config.logging.getLogger(__name__)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="facilityid")
+    parser.add_argument("--full-rescan", action="store_true",
+                        help="rescan every row of every layer, instead of "
+                             "only the rows edited since the last run")
+    args = parser.parse_args()
+
     try:
-        app.main()
+        app.main(args.full_rescan)
     except Exception:
         log.exception("Something prevented the script from running")
     finally:
-        list_files(['.sde'], delete=True)
+        CsvLog.close()
+        AuditLog.close()
+        Artifacts.delete(['.sde'])
+        RunReport.write()
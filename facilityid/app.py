@@ -1,52 +1,241 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
 import facilityid.config as config
 import facilityid.utils.edit as edit
 import facilityid.utils.identifier as identify
 import facilityid.utils.management as mgmt
+from facilityid.utils.audit import AuditLog, CsvLog
+from facilityid.utils.report import RunReport
+from facilityid.utils.snapshot import SnapshotStore
 
 # Initialize the logger for this file
 log = config.logging.getLogger(__name__)
 
 
-def main():
+def analyze(feature: tuple, incremental: bool = False,
+            prefetched: Future = None) -> dict:
+    """Runs the read-only analysis of a single feature.
+
+    Everything in here is independent between features, so it can run
+    in a worker process. Nothing is written to the database, the Pro
+    project, or the store of previous runs.
+
+    Parameters
+    ----------
+    feature : tuple
+        The system path to the feature, as returned by find_in_sde
+    incremental : bool, optional
+        Whether to only read rows edited since the last run, by default
+        False
+    prefetched : Future, optional
+        The feature's Identifier, being built by prefetch, by default
+        the Identifier is built here
+
+    Returns
+    -------
+    dict
+        "editor" is the analyzed Edit object, or None if the feature
+        needs no more work. "unchanged" flags editors that matched the
+        last run and only need to be stored again. "versioned" flags
+        editors that qualify for versioned edits. "inspected",
+        "failures", and "version_failures" hold the entries that the
+        analysis added to the class-level lists of Identifier and Edit.
+        "span" holds the timing of the analysis.
+    """
+
+    failures = len(identify.Identifier.failures)
+    version_failures = len(edit.Edit.version_failures)
+    result = {"editor": None, "unchanged": False, "versioned": False,
+              "inspected": None}
+    with RunReport.span("analyze", feature[-1]) as span:
+        _analyze(feature, incremental, result, prefetched)
+    result["span"] = span
+
+    result["failures"] = identify.Identifier.failures[failures:]
+    result["version_failures"] = edit.Edit.version_failures[
+        version_failures:]
+    return result
+
+
+def _analyze(feature: tuple, incremental: bool, result: dict,
+             prefetched: Future = None):
+    """Fills in the result of analyze for a single feature."""
+    # Initialize an identifier object, or wait for the prefetched one
+    with RunReport.span("identifier"):
+        if prefetched is None:
+            facilityid = identify.Identifier(feature)
+        else:
+            facilityid = prefetched.result()
+    log.info(f"Analyzing {facilityid.feature_name}...")
+
+    # Make preliminary checks before analyzing the feature
+    if facilityid.essentials():
+        result["inspected"] = facilityid.owner
+
+        # Compare the table's fingerprint to the previous run before reading
+        # any rows, then compare the Edit object itself
+        if facilityid.unchanged():
+            log.info(("No records have been edited in "
+                      f"{facilityid.feature_name} since the last run..."))
+        else:
+            with RunReport.span("edit_init"):
+                editor = edit.Edit(feature, incremental, facilityid.profile)
+            result["editor"] = editor
+            if editor.equals_previous():
+                log.info(("No records have been edited in "
+                          f"{editor.feature_name} since the last run..."))
+                result["unchanged"] = True
+            else:
+                # Check version requirements and work out the edits
+                result["versioned"] = editor.version_essentials()
+                editor.analyze()
+
+
+def analyses(features: list, incremental: bool = False):
+    """Analyzes features on a pool of config.workers processes, yielding
+    each result in the same order as the features. With a single worker,
+    features are analyzed in this process while the metadata of the next
+    features is prefetched.
+
+    Parameters
+    ----------
+    features : list
+        System paths to features, as returned by find_in_sde
+    incremental : bool, optional
+        Whether to only read rows edited since the last run, by default
+        False
+
+    Yields
+    ------
+    dict
+        The result of analyze for each feature
+    """
+
+    if config.workers <= 1:
+        for feature, identifier in prefetch(features):
+            yield analyze(feature, incremental, identifier)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Only keep a few analyses ahead of the edits, so that finished tables
+    # don't pile up in memory
+    with ProcessPoolExecutor(config.workers) as pool:
+        pending = deque()
+        for feature in features:
+            pending.append(pool.submit(analyze, feature, incremental))
+            if len(pending) >= 2 * config.workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _identify(feature: tuple):
+    """Builds the Identifier of a feature on a prefetch thread."""
+    with RunReport.span("prefetch", feature[-1]):
+        return identify.Identifier(feature)
+
+
+def prefetch(features: list):
+    """Builds the Identifier of each feature config.prefetch features
+    ahead, on a pool of as many threads.
+
+    Building an Identifier mostly waits on the database for the
+    describe, field, and profile queries, which are independent between
+    features, so the queries of the next features are sent while the
+    current feature is analyzed. The privileges of the editing user are
+    loaded on the pool as well. Only the SQLite backend is known to be
+    safe to call from several threads, see prefetch in config.yaml.
+
+    Parameters
+    ----------
+    features : list
+        System paths to features, as returned by find_in_sde
+
+    Yields
+    ------
+    tuple
+        Each feature, in order, and a Future of its Identifier, or None
+        if config.prefetch is 0
+    """
+
+    if config.prefetch <= 0:
+        for feature in features:
+            yield feature, None
+        return
+
+    with ThreadPoolExecutor(config.prefetch) as pool:
+        if config.versioned_edits:
+            pool.submit(identify.Identifier._grants, config.edit)
+        pending = deque()
+        for feature in features:
+            pending.append((feature, pool.submit(_identify, feature)))
+            if len(pending) > config.prefetch:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+
+
+def _collect(analysis: dict):
+    """Adds the class-level entries from an analysis to this process,
+    skipping any that an analysis in this process already added."""
+    RunReport.adopt(analysis["span"])
+    owner = analysis["inspected"]
+    if owner and owner not in identify.Identifier.inspected_users:
+        identify.Identifier.inspected_users.append(owner)
+    for entry in analysis["failures"]:
+        if entry not in identify.Identifier.failures:
+            identify.Identifier.failures.append(entry)
+    for entry in analysis["version_failures"]:
+        if entry not in edit.Edit.version_failures:
+            edit.Edit.version_failures.append(entry)
+
+
+def main(full_rescan: bool = False):
+    # Read the config file and set up logging before anything is logged
+    config.load()
     log.info(f"Started by {config.username}...")
 
     # Step 1: Delete all existing Facility ID versions and old files
     log.info("Deleting old Facility ID versions...")
     mgmt.delete_facilityid_versions(config.edit)
     exclude = ['AllEditsEver', 'GroupLayerTemplate']
-    mgmt.list_files(['.sde', '.lyrx', '.csv'], exclude, True)
+    mgmt.Artifacts.delete(['.sde', '.lyrx', '.csv'], exclude)
 
     # Step 2: Clear layers from all edit maps in Pro
     log.info("Removing layers from maps in the FacilityID Pro project...")
     mgmt.clear_map_layers()
 
     versions = dict()  # a dict to keep track of all the created versions
+    scanned = list()  # every feature found in SDE, across all procedures
     # Iterate through each configured versioned edit procedure
     for parent, options in config.procedure.items():
         # Step 3: Obtain tuples of system paths for every fc
         log.info("Evaluating which SDE items to evaluate based on filters...")
-        features = mgmt.find_in_sde(config.read, options['include'],
-                                    options['exclude'])
-
-        # Step 4: Iterate through each feature
-        for feature in features:
-            # Step 4a: Initialize an identifier object
-            facilityid = identify.Identifier(feature)
-            log.info(f"Analyzing {facilityid.feature_name}...")
+        with RunReport.span("find_in_sde", parent=parent) as span:
+            features = mgmt.find_in_sde(config.read, options['include'],
+                                        options['exclude'])
+            span["features"] = len(features)
+        scanned += [f[-1] for f in features]
 
-            # Step 4b: Make preliminary checks before analyzing the feature
-            if not facilityid.essentials():
+        # Step 4: Analyze each feature, up to config.workers at a time, and
+        # perform edits one feature at a time in the original order
+        incremental = config.incremental and not full_rescan
+        for analysis in analyses(features, incremental):
+            _collect(analysis)
+            editor = analysis["editor"]
+            if editor is None:
                 continue
 
-            # Step 4c: Compare Edit object to previous script run
-            editor = edit.Edit(feature)
-            if editor.equals_previous():
-                log.info(("No records have been edited in "
-                          f"{editor.feature_name} since the last run..."))
+            # Step 4a: Refresh the stored table if it matched the last run
+            if analysis["unchanged"]:
+                with RunReport.span("store", editor.feature_name):
+                    editor.store_current()
                 continue
 
-            # Step 4d: Check version requirements
-            if editor.version_essentials():
+            # Step 4b: Create the version if the feature qualifies
+            if analysis["versioned"]:
                 suffix = options["version_suffix"]
                 v_name = f"{editor.owner}{suffix}"
                 conn_file = mgmt.versioned_connection(parent, v_name)
@@ -55,35 +244,59 @@ def main():
             else:
                 conn_file = ""
 
-            # Step 4e: Perform edits
+            # Step 4c: Perform edits
             log.info((f"Attempting edits on {editor.feature_name} "
                      f"with prefix {editor.prefix}..."))
-            editor.edit_version(conn_file)
+            with RunReport.span("edit_version", editor.feature_name):
+                editor.edit_version(conn_file)
 
-            # Step 4f: Shelve the edited object for future comparisons
+            # Step 4d: Store the edited object for future comparisons
             log.info("Storing table for future comparisons...")
-            editor.store_current()
+            with RunReport.span("store", editor.feature_name):
+                editor.store_current()
+
+            # Step 4e: Delete object instances from memory
+            del editor, analysis
 
-            # Step 4g: Delete object instances from memory
-            del editor, facilityid
+    # Flush the edit logs, so that they are complete when they are emailed
+    CsvLog.close()
+    AuditLog.close()
 
-    # Step 5: Loop through all users that had edits performed
+    # Step 5: Add every edited layer to its map in Pro, saving the project once
+    log.info("Adding edited layers to maps in the FacilityID Pro project...")
+    with RunReport.span("add_to_aprx", layers=len(edit.Edit.aprx_layers)):
+        mgmt.add_layers_to_maps(edit.Edit.aprx_layers)
+
+    # Step 6: Drop layers that no longer exist from the stored snapshots
+    log.info("Compacting the snapshots of previous runs...")
+    with SnapshotStore() as store:
+        store.compact(keep=scanned)
+
+    # Step 7: Loop through all users that had edits performed
     e_users = edit.Edit.edited_users  # Users that needed edits
     scan_fails = identify.Identifier.failures
     edit_fails = edit.Edit.version_failures
     edit_counts = edit.Edit.edited_features
+    emails = list()
     for user in identify.Identifier.inspected_users:
-        # Step 5a: Post edits or save layer files if they have edits
+        # Step 7a: Post edits or save layer files if they have edits
         post = None
         if user in e_users:
             user_versions = {k: v for k, v in versions.items() if user in k}
             mgmt.post_and_save_layer_files(user, user_versions)
             post = [v["posted"] for v in user_versions.values()]
 
-        # Step 5b: Send an email with results
-        all_files = mgmt.list_files(['.csv', '.lyrx'])
+        # Step 7b: Write an email with results
+        user_files = (mgmt.Artifacts.find(user, '.csv')
+                      + mgmt.Artifacts.find(user, '.lyrx'))
         body, files = mgmt.email_matter(
-            user, e_users, post, all_files, scan_fails, edit_fails,
+            user, e_users, post, user_files, scan_fails, edit_fails,
             edit_counts)
-        mgmt.send_email(body, config.recipients[user], *files)
-        log.info(f"Email sent to {user} recipients...")
+        emails.append((body, config.recipients[user], files))
+
+    # Step 8: Send every email in one SMTP session
+    with RunReport.span("send_email", emails=len(emails)):
+        sent = mgmt.send_emails(emails)
+    for user, success in zip(identify.Identifier.inspected_users, sent):
+        if success:
+            log.info(f"Email sent to {user} recipients...")
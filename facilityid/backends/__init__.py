@@ -0,0 +1,33 @@
+import facilityid.config as config
+from facilityid.utils.report import CountedBackend
+
+from .base import Backend, ExecuteError
+
+_backend = None
+
+
+def get_backend() -> Backend:
+    """Returns the backend for the database platform in config.yaml,
+    creating it on first use.
+
+    The SQLITE platform runs against the SQLite reference backend, and
+    every other platform runs through arcpy. Backends are only imported
+    when they are needed, so arcpy is never imported on the SQLITE
+    platform. Queries through the backend are counted in the spans of
+    the RunReport.
+
+    Returns
+    -------
+    Backend
+        The backend shared by the whole package
+    """
+
+    global _backend
+    if _backend is None:
+        if config.db == 'SQLITE':
+            from .sqlite import SQLiteBackend
+            _backend = CountedBackend(SQLiteBackend())
+        else:
+            from .arcgis import ArcpyBackend
+            _backend = CountedBackend(ArcpyBackend())
+    return _backend
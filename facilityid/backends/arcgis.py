@@ -0,0 +1,66 @@
+import arcpy
+from arcpy.da import Editor, SearchCursor, UpdateCursor, Walk
+from arcpy.mp import ArcGISProject, LayerFile
+
+from .base import Backend, ExecuteError
+
+
+class ArcpyBackend(Backend):
+    """Reads and edits an enterprise geodatabase through arcpy."""
+
+    name = 'arcpy'
+
+    def walk(self, workspace, datatypes):
+        return Walk(workspace, datatype=datatypes)
+
+    def describe(self, path):
+        return arcpy.Describe(path)
+
+    def list_fields(self, path):
+        return arcpy.ListFields(path)
+
+    def execute(self, connection, query):
+        try:
+            return arcpy.ArcSDESQLExecute(connection).execute(query)
+        except (arcpy.ExecuteError, AttributeError) as e:
+            # ArcSDESQLExecute raises AttributeError for some failed queries
+            raise ExecuteError(str(e)) from e
+
+    def search_cursor(self, path, fields, where_clause=None):
+        return SearchCursor(path, fields, where_clause)
+
+    def update_cursor(self, path, fields, where_clause=None):
+        return UpdateCursor(path, fields, where_clause)
+
+    def editor(self, workspace):
+        return Editor(workspace)
+
+    def clear_workspace_cache(self):
+        arcpy.ClearWorkspaceCache_management()
+
+    def list_versions(self, workspace):
+        return arcpy.ListVersions(workspace)
+
+    def create_version(self, in_workspace, parent_version, version_name,
+                       access_permission):
+        arcpy.CreateVersion_management(
+            in_workspace=in_workspace, parent_version=parent_version,
+            version_name=version_name, access_permission=access_permission)
+
+    def delete_version(self, workspace, version_name):
+        arcpy.DeleteVersion_management(workspace, version_name)
+
+    def reconcile_versions(self, **kwargs):
+        try:
+            arcpy.ReconcileVersions_management(**kwargs)
+        except arcpy.ExecuteError as e:
+            raise ExecuteError(str(e)) from e
+
+    def create_connection(self, **kwargs):
+        arcpy.CreateDatabaseConnection_management(**kwargs)
+
+    def project(self, path):
+        return ArcGISProject(path)
+
+    def layer_file(self, path):
+        return LayerFile(path)
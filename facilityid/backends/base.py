@@ -0,0 +1,93 @@
+class ExecuteError(Exception):
+    """Raised by a backend when a SQL statement or geoprocessing tool
+    fails to run."""
+
+
+class Backend:
+    """The interface between this package and the geodatabase that it
+    scans and edits.
+
+    Every call that reaches the data source goes through a backend, so
+    the engine can run against ArcGIS (ArcpyBackend) or a local stand-in
+    (SQLiteBackend). Cursors, editors, projects, and describe objects
+    follow the arcpy API, so either backend can be used wherever the
+    package previously used arcpy directly.
+    """
+
+    name = None
+
+    # Listing and describing data
+
+    def walk(self, workspace: str, datatypes: list):
+        """Walks a workspace like arcpy.da.Walk, yielding (dirpath,
+        dirnames, filenames) for the workspace and each dataset."""
+        raise NotImplementedError
+
+    def describe(self, path: str):
+        """Describes a dataset like arcpy.Describe."""
+        raise NotImplementedError
+
+    def list_fields(self, path: str) -> list:
+        """Lists the fields of a table like arcpy.ListFields."""
+        raise NotImplementedError
+
+    # Reading and writing data
+
+    def execute(self, connection: str, query: str):
+        """Runs SQL against the database behind a connection, returning
+        results like ArcSDESQLExecute.execute. Raises ExecuteError if
+        the statement fails."""
+        raise NotImplementedError
+
+    def search_cursor(self, path: str, fields: list,
+                      where_clause: str = None):
+        """Opens a read cursor like arcpy.da.SearchCursor."""
+        raise NotImplementedError
+
+    def update_cursor(self, path: str, fields: list,
+                      where_clause: str = None):
+        """Opens an update cursor like arcpy.da.UpdateCursor."""
+        raise NotImplementedError
+
+    def editor(self, workspace: str):
+        """Creates an edit session like arcpy.da.Editor."""
+        raise NotImplementedError
+
+    def clear_workspace_cache(self):
+        """Releases any cached connections to the database."""
+        raise NotImplementedError
+
+    # Versions and connections
+
+    def list_versions(self, workspace: str) -> list:
+        """Lists the names of every version in the database."""
+        raise NotImplementedError
+
+    def create_version(self, in_workspace: str, parent_version: str,
+                       version_name: str, access_permission: str):
+        """Creates a version like CreateVersion_management."""
+        raise NotImplementedError
+
+    def delete_version(self, workspace: str, version_name: str):
+        """Deletes a version like DeleteVersion_management."""
+        raise NotImplementedError
+
+    def reconcile_versions(self, **kwargs):
+        """Reconciles and posts versions like
+        ReconcileVersions_management. Raises ExecuteError on failure."""
+        raise NotImplementedError
+
+    def create_connection(self, **kwargs):
+        """Creates a connection file like
+        CreateDatabaseConnection_management."""
+        raise NotImplementedError
+
+    # Pro projects
+
+    def project(self, path: str):
+        """Opens a Pro project like arcpy.mp.ArcGISProject."""
+        raise NotImplementedError
+
+    def layer_file(self, path: str):
+        """Opens a layer file like arcpy.mp.LayerFile."""
+        raise NotImplementedError
@@ -0,0 +1,819 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from copy import deepcopy
+from datetime import datetime
+from fnmatch import fnmatch
+from types import SimpleNamespace
+
+from .base import Backend, ExecuteError
+
+# The root version that every other version descends from
+DEFAULT = 'SDE.DEFAULT'
+
+# Fields of every table, with editor tracking fields named like ArcGIS
+_OID = 'OBJECTID'
+_TRACKING = {"creatorFieldName": 'created_user',
+             "createdAtFieldName": 'created_date',
+             "editorFieldName": 'last_edited_user',
+             "editedAtFieldName": 'last_edited_date'}
+_DATE_FIELDS = {'CREATED_DATE', 'LAST_EDITED_DATE'}
+_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_CATALOG = """
+CREATE TABLE IF NOT EXISTS GDB_ITEMS (
+    NAME TEXT PRIMARY KEY COLLATE NOCASE,
+    DATASET TEXT COLLATE NOCASE,
+    DATASET_TYPE TEXT NOT NULL,
+    SHAPE_TYPE TEXT,
+    IS_VERSIONED INTEGER NOT NULL DEFAULT 0,
+    EDITOR_TRACKING INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS GDB_VERSIONS (
+    NAME TEXT PRIMARY KEY COLLATE NOCASE,
+    PARENT TEXT COLLATE NOCASE,
+    ACCESS TEXT
+);
+CREATE TABLE IF NOT EXISTS ALL_TAB_PRIVS (
+    GRANTEE TEXT COLLATE NOCASE,
+    TABLE_SCHEMA TEXT COLLATE NOCASE,
+    TABLE_NAME TEXT COLLATE NOCASE,
+    PRIVILEGE TEXT
+);
+CREATE TABLE IF NOT EXISTS DBA_ROLE_PRIVS (
+    GRANTEE TEXT COLLATE NOCASE,
+    GRANTED_ROLE TEXT COLLATE NOCASE
+);
+CREATE TEMP VIEW IF NOT EXISTS SESSION_ROLES AS
+    SELECT GRANTED_ROLE AS ROLE FROM main.DBA_ROLE_PRIVS
+    WHERE GRANTEE = SESSION_USER();
+INSERT OR IGNORE INTO GDB_VERSIONS VALUES ('SDE.DEFAULT', NULL, 'PUBLIC');
+"""
+
+
+def _regexp_substr(value, pattern, position=1, occurrence=1, flags=None,
+                   subexpr=0):
+    """Oracle's REGEXP_SUBSTR, returning None when nothing matches."""
+    if value is None:
+        return None
+    matches = re.compile(pattern).finditer(str(value), position - 1)
+    for match in matches:
+        occurrence -= 1
+        if not occurrence:
+            return match.group(subexpr) or None
+    return None
+
+
+def _ora_hash(value):
+    """A stand-in for Oracle's ORA_HASH, within the same 32-bit range."""
+    if value is None:
+        return None
+    return zlib.crc32(str(value).encode('utf-8'))
+
+
+def _split(path: str):
+    """Splits the path to a dataset into the connection file and the
+    names of the items inside it."""
+    head, parts = path, list()
+    while not head.lower().endswith('.sde'):
+        head, part = os.path.split(head)
+        if not part:
+            raise OSError(f"{path} is not inside a connection file")
+        parts.insert(0, part)
+    return head, parts
+
+
+def _quote(value: str) -> str:
+    """Quotes a string for use as a SQL literal."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+class _Geometry(SimpleNamespace):
+    """The measures of a shape, standing in for an arcpy Geometry."""
+
+
+class _Database:
+    """A connection to the SQLite files behind a connection file.
+
+    The catalog of items, versions, privileges, and roles is kept in
+    the main database. SESSION_ROLES lists the roles of the user that
+    the last query was run as, like Oracle's view of the same name. Each
+    data owner is a separate database file attached under the owner's
+    name, so tables can be queried as OWNER.TABLE.
+    Versioned tables keep the DEFAULT version in the table itself and
+    the edits of every other version in a delta table.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.create_function('REGEXP_SUBSTR', -1, _regexp_substr,
+                                  deterministic=True)
+        self.conn.create_function('ORA_HASH', 1, _ora_hash,
+                                  deterministic=True)
+        self.conn.create_function('SESSION_USER', 0, lambda: self.user)
+        self.conn.executescript(_CATALOG)
+        self.editing = False
+        self.user = None
+        self.owners = set()
+        for (name,) in self.conn.execute("SELECT NAME FROM GDB_ITEMS"):
+            self.attach(name.split('.')[0])
+
+    def attach(self, owner: str):
+        """Attaches the database file of a data owner."""
+        owner = owner.upper()
+        if owner not in self.owners:
+            stem = os.path.splitext(self.path)[0]
+            self.conn.execute("ATTACH DATABASE ? AS " + owner,
+                              (f"{stem}.{owner}.sqlite",))
+            self.owners.add(owner)
+
+    def commit(self):
+        """Commits, unless an edit session will commit later."""
+        if not self.editing:
+            self.conn.commit()
+
+    def item(self, name: str):
+        """The catalog entry of an item, or None if it does not exist."""
+        row = self.conn.execute(
+            "SELECT NAME, DATASET, DATASET_TYPE, SHAPE_TYPE, IS_VERSIONED, "
+            "EDITOR_TRACKING FROM GDB_ITEMS WHERE NAME = ?",
+            (name,)).fetchone()
+        if row is None:
+            return None
+        keys = ('name', 'dataset', 'type', 'shape', 'versioned', 'tracking')
+        return dict(zip(keys, row))
+
+    def version(self, name: str) -> str:
+        """Resolves a version name, with or without its owner, to the
+        name stored in the catalog."""
+        if not name:
+            return DEFAULT
+        rows = [r[0] for r in self.conn.execute("SELECT NAME FROM "
+                                                "GDB_VERSIONS")]
+        for stored in rows:
+            if stored.upper() == name.upper():
+                return stored
+        for stored in rows:
+            if stored.split('.', 1)[-1].upper() == name.upper():
+                return stored
+        raise ExecuteError(f"Version {name} does not exist")
+
+    def lineage(self, version: str) -> list:
+        """A version followed by each of its ancestors, excluding
+        DEFAULT."""
+        lineage = list()
+        version = self.version(version)
+        while version and version.upper() != DEFAULT:
+            lineage.append(version)
+            version = self.conn.execute(
+                "SELECT PARENT FROM GDB_VERSIONS WHERE NAME = ?",
+                (version,)).fetchone()[0]
+        return lineage
+
+    @staticmethod
+    def table(name: str, suffix: str = '') -> str:
+        """The SQL name of the table behind an item."""
+        owner, table = name.split('.', 1)
+        return f'{owner.upper()}."{table}{suffix}"'
+
+    def columns(self, name: str) -> list:
+        """The columns of the table behind an item."""
+        owner, table = name.split('.', 1)
+        return [r[1] for r in self.conn.execute(
+            f'PRAGMA {owner.upper()}.table_info("{table}")')]
+
+    def source(self, item: dict, version: str) -> str:
+        """A SQL expression for the rows of an item as seen by a
+        version, overlaying the edits of the version and its ancestors
+        onto DEFAULT."""
+        base = self.table(item['name'])
+        lineage = self.lineage(version) if item['versioned'] else []
+        if not lineage:
+            return base
+
+        delta = self.table(item['name'], '__DELTA')
+        columns = ", ".join(f'"{c}"' for c in self.columns(item['name']))
+        selects, seen = list(), list()
+        for v in lineage + [None]:
+            if seen:
+                hidden = (f"{_OID} NOT IN (SELECT {_OID} FROM {delta} "
+                          f"WHERE VERSION IN ({', '.join(seen)}))")
+            else:
+                hidden = "1 = 1"
+            if v is None:
+                selects.append(f"SELECT {columns} FROM {base} WHERE {hidden}")
+            else:
+                selects.append(f"SELECT {columns} FROM {delta} "
+                               f"WHERE VERSION = {_quote(v)} AND {hidden}")
+                seen.append(_quote(v))
+        return "(" + " UNION ALL ".join(selects) + ")"
+
+
+class _Cursor:
+    """A read cursor over the rows of an item, like
+    arcpy.da.SearchCursor."""
+
+    def __init__(self, db: _Database, item: dict, version: str, fields: list,
+                 where_clause: str = None):
+        self._db = db
+        self._item = item
+        self._version = version
+        self.fields = tuple(fields)
+
+        columns, self._readers = [_OID], list()
+        for field in fields:
+            token = field.upper()
+            start = len(columns)
+            if token == 'SHAPE@':
+                columns += ['SHAPE_AREA', 'SHAPE_LENGTH']
+                self._readers.append(
+                    lambda r, i=start: _Geometry(area=r[i], length=r[i + 1]))
+            else:
+                column = {'SHAPE@AREA': 'SHAPE_AREA',
+                          'SHAPE@LENGTH': 'SHAPE_LENGTH',
+                          'OID@': _OID}.get(token, field)
+                columns.append(column)
+                if column.upper() in _DATE_FIELDS:
+                    self._readers.append(lambda r, i=start: (
+                        datetime.fromisoformat(r[i]) if r[i] else None))
+                else:
+                    self._readers.append(lambda r, i=start: r[i])
+
+        query = (f"SELECT {', '.join(columns)} "
+                 f"FROM {db.source(item, version)} AS ROWS_")
+        if where_clause:
+            query += f" WHERE {where_clause}"
+        try:
+            self._rows = db.conn.execute(query)
+        except sqlite3.Error as e:
+            raise RuntimeError(f"{item['name']}: {e}") from e
+        self._oid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._rows = iter(())
+
+    def __iter__(self):
+        for row in self._rows:
+            self._oid = row[0]
+            yield [read(row) for read in self._readers]
+
+
+class _UpdateCursor(_Cursor):
+    """An update cursor over the rows of an item, like
+    arcpy.da.UpdateCursor. Edits to versions other than DEFAULT are
+    written to the delta table of the item, and editor tracking fields
+    are maintained when they are enabled."""
+
+    def __init__(self, db, item, version, fields, where_clause=None,
+                 username=None):
+        super().__init__(db, item, version, fields, where_clause)
+        # Read everything up front, since the table changes underneath
+        self._rows = self._rows.fetchall()
+        self._username = username
+
+    def __exit__(self, *exc):
+        super().__exit__(*exc)
+        self._db.commit()
+
+    def updateRow(self, row):
+        values = dict()
+        for field, value in zip(self.fields, row):
+            if field.upper() in ('OID@', 'SHAPE@', 'SHAPE@AREA',
+                                 'SHAPE@LENGTH', _OID):
+                continue
+            if isinstance(value, datetime):
+                value = value.strftime(_DATE_FORMAT)
+            values[field] = value
+        if self._item['tracking']:
+            values[_TRACKING["editorFieldName"]] = self._username
+            values[_TRACKING["editedAtFieldName"]] = datetime.now().strftime(
+                _DATE_FORMAT)
+
+        name = self._item['name']
+        lineage = self._db.lineage(self._version) if self._item[
+            'versioned'] else []
+        assignments = ", ".join(f'"{k}" = ?' for k in values)
+        try:
+            if lineage:
+                # Copy the row as the version sees it into its delta table
+                delta = self._db.table(name, '__DELTA')
+                columns = ", ".join(f'"{c}"' for c in self._db.columns(name))
+                self._db.conn.execute(
+                    f"INSERT OR REPLACE INTO {delta} (VERSION, {columns}) "
+                    f"SELECT ?, {columns} "
+                    f"FROM {self._db.source(self._item, self._version)} "
+                    f"WHERE {_OID} = ?", (lineage[0], self._oid))
+                self._db.conn.execute(
+                    f"UPDATE {delta} SET {assignments} "
+                    f"WHERE VERSION = ? AND {_OID} = ?",
+                    (*values.values(), lineage[0], self._oid))
+            else:
+                self._db.conn.execute(
+                    f"UPDATE {self._db.table(name)} SET {assignments} "
+                    f"WHERE {_OID} = ?", (*values.values(), self._oid))
+        except sqlite3.Error as e:
+            raise RuntimeError(f"{name}: {e}") from e
+
+
+class _Editor:
+    """An edit session, like arcpy.da.Editor. Edits are committed when
+    editing stops and saved, or rolled back otherwise."""
+
+    def __init__(self, db: _Database):
+        self._db = db
+
+    def startEditing(self, with_undo=True, multiuser_mode=True):
+        self._db.editing = True
+
+    def startOperation(self):
+        pass
+
+    def stopOperation(self):
+        pass
+
+    def abortOperation(self):
+        self._db.conn.rollback()
+
+    def stopEditing(self, save_changes=True):
+        if save_changes:
+            self._db.conn.commit()
+        else:
+            self._db.conn.rollback()
+        self._db.editing = False
+
+
+class _Layer:
+    """A layer inside a project or layer file, like arcpy.mp.Layer."""
+
+    def __init__(self, spec: dict):
+        self._spec = spec
+
+    @property
+    def name(self):
+        return self._spec['name']
+
+    @name.setter
+    def name(self, value):
+        self._spec['name'] = value
+
+    @property
+    def dataSource(self):
+        return self._spec.get('dataSource', '')
+
+    @property
+    def isGroupLayer(self):
+        return self._spec.get('isGroupLayer', False)
+
+    @property
+    def isBasemapLayer(self):
+        return self._spec.get('isBasemapLayer', False)
+
+    def saveACopy(self, file_name: str):
+        with open(file_name, 'w') as f:
+            json.dump({"layers": [self._spec]}, f, indent=2)
+
+
+def _list_layers(specs: list, wildcard: str = None) -> list:
+    """Lists layers and the layers nested inside group layers."""
+    layers = list()
+    for spec in specs:
+        if wildcard is None or fnmatch(spec['name'].lower(),
+                                       wildcard.lower()):
+            layers.append(_Layer(spec))
+        layers += _list_layers(spec.get('layers', []), wildcard)
+    return layers
+
+
+class _Map:
+    """A map inside a project, like arcpy.mp.Map."""
+
+    def __init__(self, spec: dict):
+        self._spec = spec
+
+    @property
+    def name(self):
+        return self._spec['name']
+
+    def listLayers(self, wildcard: str = None) -> list:
+        return _list_layers(self._spec['layers'], wildcard)
+
+    def addDataFromPath(self, data_path: str):
+        spec = {"name": os.path.basename(data_path), "dataSource": data_path}
+        self._spec['layers'].insert(0, spec)
+        return _Layer(spec)
+
+    def addLayer(self, add_layer_or_layerfile, add_position='AUTO_ARRANGE'):
+        for layer in add_layer_or_layerfile.listLayers():
+            self._spec['layers'].insert(0, deepcopy(layer._spec))
+
+    def addLayerToGroup(self, target_group_layer, add_layer_or_layerfile,
+                        add_position='AUTO_ARRANGE'):
+        target_group_layer._spec.setdefault('layers', []).insert(
+            0, deepcopy(add_layer_or_layerfile._spec))
+
+    def removeLayer(self, remove_layer):
+        def remove(specs):
+            for spec in specs:
+                if spec is remove_layer._spec:
+                    specs.remove(spec)
+                    return True
+                if remove(spec.get('layers', [])):
+                    return True
+            return False
+        remove(self._spec['layers'])
+
+
+class _Project:
+    """A Pro project stored as JSON, like arcpy.mp.ArcGISProject."""
+
+    def __init__(self, path: str):
+        self.filePath = path
+        with open(path) as f:
+            self._spec = json.load(f)
+
+    def listMaps(self, wildcard: str = None) -> list:
+        return [_Map(m) for m in self._spec['maps'] if wildcard is None
+                or fnmatch(m['name'].lower(), wildcard.lower())]
+
+    def save(self):
+        with open(self.filePath, 'w') as f:
+            json.dump(self._spec, f, indent=2)
+
+
+class _LayerFile:
+    """A layer file stored as JSON, like arcpy.mp.LayerFile."""
+
+    def __init__(self, path: str):
+        self.filePath = path
+        with open(path) as f:
+            self._spec = json.load(f)
+
+    def listLayers(self, wildcard: str = None) -> list:
+        return _list_layers(self._spec['layers'], wildcard)
+
+
+class SQLiteBackend(Backend):
+    """A reference geodatabase made of local SQLite files, so that the
+    package can run and be profiled without ArcGIS.
+
+    Connection files (.sde) are small JSON files that name the SQLite
+    database, the version, and the user of the connection. Versioned
+    tables, editor tracking fields, privileges, and Pro projects are
+    modeled closely enough to run every step of app.main. The SQL
+    dialect is SQLite's, extended with the Oracle functions
+    REGEXP_SUBSTR and ORA_HASH. SQLite connections can't be shared
+    between threads, so each thread opens the databases it uses.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self):
+        self._local = threading.local()
+
+    @property
+    def _databases(self) -> dict:
+        """The databases opened by the calling thread, by path."""
+        try:
+            return self._local.databases
+        except AttributeError:
+            self._local.databases = dict()
+            return self._local.databases
+
+    @_databases.setter
+    def _databases(self, databases: dict):
+        self._local.databases = databases
+
+    def _connection(self, connection: str) -> dict:
+        """Reads a connection file."""
+        with open(connection) as f:
+            info = json.load(f)
+        database = os.path.join(os.path.dirname(os.path.abspath(connection)),
+                                info["database"])
+        return {"database": os.path.normpath(database),
+                "version": info.get("version") or DEFAULT,
+                "username": info.get("username")}
+
+    def _database(self, connection: str):
+        """Opens, or reuses, the database behind a connection file."""
+        info = self._connection(connection)
+        db = self._databases.get(info["database"])
+        if db is None:
+            db = _Database(info["database"])
+            self._databases[info["database"]] = db
+        return db, info
+
+    def _item(self, path: str):
+        """Finds the database and catalog entry of a dataset."""
+        connection, parts = _split(path)
+        db, info = self._database(connection)
+        item = db.item(parts[-1]) if parts else None
+        if item is None:
+            raise OSError(f"{path} does not exist")
+        return db, item, info
+
+    def walk(self, workspace, datatypes):
+        db, _ = self._database(workspace)
+        items = db.conn.execute(
+            "SELECT NAME, DATASET, DATASET_TYPE FROM GDB_ITEMS "
+            "ORDER BY NAME").fetchall()
+        datasets = [n for n, _, t in items if t == 'FeatureDataset']
+
+        def listed(dataset):
+            return [n for n, d, t in items if t in datatypes and t !=
+                    'FeatureDataset' and (d or None) == dataset]
+
+        yield workspace, datasets, listed(None)
+        for dataset in datasets:
+            yield os.path.join(workspace, dataset), [], listed(dataset)
+
+    def describe(self, path):
+        db, item, _ = self._item(path)
+        desc = SimpleNamespace(name=item['name'], catalogPath=path,
+                               datasetType=item['type'],
+                               isVersioned=bool(item['versioned']))
+        if item['type'] == 'FeatureDataset':
+            return desc
+        desc.shapeType = item['shape']
+        desc.OIDFieldName = _OID
+        desc.editorTrackingEnabled = bool(item['tracking'])
+        for key, field in _TRACKING.items():
+            setattr(desc, key, field if item['tracking'] else '')
+        return desc
+
+    def list_fields(self, path):
+        db, item, _ = self._item(path)
+        if item['type'] == 'FeatureDataset':
+            raise RuntimeError(f"{path} has no fields")
+        names = db.columns(item['name'])
+        if item['type'] == 'FeatureClass':
+            names.insert(1, 'SHAPE')
+        return [SimpleNamespace(name=n) for n in names]
+
+    def execute(self, connection, query):
+        db, info = self._database(connection)
+        db.user = info["username"]
+        try:
+            cursor = db.conn.execute(query)
+            rows = cursor.fetchall()
+        except sqlite3.Error as e:
+            raise ExecuteError(str(e)) from e
+        if cursor.description is None or not rows:
+            db.commit()
+            return True
+        if len(rows) == 1 and len(rows[0]) == 1:
+            return rows[0][0]
+        return [list(r) for r in rows]
+
+    def search_cursor(self, path, fields, where_clause=None):
+        db, item, info = self._item(path)
+        return _Cursor(db, item, info["version"], fields, where_clause)
+
+    def update_cursor(self, path, fields, where_clause=None):
+        db, item, info = self._item(path)
+        return _UpdateCursor(db, item, info["version"], fields, where_clause,
+                             info["username"])
+
+    def editor(self, workspace):
+        db, _ = self._database(workspace)
+        return _Editor(db)
+
+    def clear_workspace_cache(self):
+        for db in self._databases.values():
+            if not db.editing:
+                db.conn.close()
+        self._databases = {k: v for k, v in self._databases.items()
+                           if v.editing}
+
+    def list_versions(self, workspace):
+        db, _ = self._database(workspace)
+        return [r[0] for r in db.conn.execute("SELECT NAME FROM "
+                                              "GDB_VERSIONS ORDER BY NAME")]
+
+    def create_version(self, in_workspace, parent_version, version_name,
+                       access_permission):
+        db, info = self._database(in_workspace)
+        parent = db.version(parent_version)
+        owner = (info["username"] or 'SDE').upper()
+        try:
+            with db.conn:
+                db.conn.execute("INSERT INTO GDB_VERSIONS VALUES (?, ?, ?)",
+                                (f"{owner}.{version_name}", parent,
+                                 access_permission))
+        except sqlite3.IntegrityError as e:
+            raise ExecuteError(f"Version {version_name} already exists") \
+                from e
+
+    def _versioned(self, db):
+        return [r[0] for r in db.conn.execute(
+            "SELECT NAME FROM GDB_ITEMS WHERE IS_VERSIONED = 1")]
+
+    def delete_version(self, workspace, version_name):
+        db, _ = self._database(workspace)
+        version = db.version(version_name)
+        if version.upper() == DEFAULT:
+            raise ExecuteError("The DEFAULT version cannot be deleted")
+        with db.conn:
+            for name in self._versioned(db):
+                db.conn.execute(f"DELETE FROM {db.table(name, '__DELTA')} "
+                                "WHERE VERSION = ?", (version,))
+            db.conn.execute("DELETE FROM GDB_VERSIONS WHERE NAME = ?",
+                            (version,))
+
+    def reconcile_versions(self, input_database, target_version,
+                           edit_versions, with_post='NO_POST',
+                           with_delete='KEEP_VERSION', **kwargs):
+        """Posts the edits of each version to the target version.
+        Conflicts are not detected, so the edits of a version always
+        replace those of the target."""
+        db, _ = self._database(input_database)
+        if isinstance(edit_versions, str):
+            edit_versions = [edit_versions]
+        target = db.version(target_version)
+        versions = [db.version(v) for v in edit_versions]
+        if with_post != 'POST':
+            return
+
+        with db.conn:
+            for name in self._versioned(db):
+                delta = db.table(name, '__DELTA')
+                columns = ", ".join(f'"{c}"' for c in db.columns(name))
+                for version in versions:
+                    if target.upper() == DEFAULT:
+                        db.conn.execute(
+                            f"INSERT OR REPLACE INTO {db.table(name)} "
+                            f"SELECT {columns} FROM {delta} "
+                            "WHERE VERSION = ?", (version,))
+                    else:
+                        db.conn.execute(
+                            f"INSERT OR REPLACE INTO {delta} "
+                            f"SELECT ?, {columns} FROM {delta} "
+                            "WHERE VERSION = ?", (target, version))
+                    db.conn.execute(f"DELETE FROM {delta} WHERE VERSION = ?",
+                                    (version,))
+        if with_delete == 'DELETE_VERSION':
+            for version in versions:
+                self.delete_version(input_database, version)
+
+    def create_connection(self, out_folder_path, out_name, database,
+                          version=None, username=None, **kwargs):
+        info = {"database": os.path.abspath(database),
+                "version": version or DEFAULT,
+                "username": username}
+        with open(os.path.join(out_folder_path, out_name), 'w') as f:
+            json.dump(info, f, indent=2)
+
+    def project(self, path):
+        return _Project(path)
+
+    def layer_file(self, path):
+        return _LayerFile(path)
+
+    # Building reference geodatabases
+
+    def create_geodatabase(self, folder: str, name: str = 'gis',
+                           username: str = 'gis') -> str:
+        """Creates an empty geodatabase and a connection file to it.
+
+        Returns
+        -------
+        str
+            The path to the connection file
+        """
+
+        database = os.path.join(folder, f"{name}.sqlite")
+        connection = os.path.join(folder, f"{name}.sde")
+        self.create_connection(folder, f"{name}.sde", database,
+                               username=username)
+        self._database(connection)
+        return connection
+
+    def create_dataset(self, connection: str, name: str):
+        """Creates a feature dataset, named like OWNER.DATASET."""
+        db, _ = self._database(connection)
+        with db.conn:
+            db.conn.execute("INSERT INTO GDB_ITEMS (NAME, DATASET_TYPE) "
+                            "VALUES (?, 'FeatureDataset')", (name,))
+
+    def create_table(self, connection: str, name: str,
+                     shape_type: str = None, dataset: str = None,
+                     versioned: bool = True, editor_tracking: bool = True,
+                     facilityid: bool = True):
+        """Creates a feature class, or a table if there is no shape type,
+        named like OWNER.NAME.
+
+        Parameters
+        ----------
+        connection : str
+            The path to the connection file
+        name : str
+            The name of the item, including its owner
+        shape_type : str, optional
+            Point, Polyline, or Polygon, by default None for a table
+        dataset : str, optional
+            The name of the feature dataset, by default None
+        versioned : bool, optional
+            Whether the item is registered as versioned, by default True
+        editor_tracking : bool, optional
+            Whether editor tracking is enabled, by default True
+        facilityid : bool, optional
+            Whether the item has a FACILITYID field, by default True
+        """
+
+        db, _ = self._database(connection)
+        owner, table = name.split('.', 1)
+        db.attach(owner)
+        fields = ["GLOBALID TEXT"]
+        if facilityid:
+            fields.append("FACILITYID TEXT")
+        if editor_tracking:
+            fields += [f"{f} TEXT" for f in _TRACKING.values()]
+        if shape_type:
+            fields += ["SHAPE_AREA REAL", "SHAPE_LENGTH REAL"]
+        indexed = 'FACILITYID' if facilityid else 'GLOBALID'
+
+        with db.conn:
+            db.conn.execute(
+                f"CREATE TABLE {db.table(name)} "
+                f"({_OID} INTEGER PRIMARY KEY, {', '.join(fields)})")
+            db.conn.execute(f"CREATE UNIQUE INDEX {db.table(name, '_GUID')} "
+                            f'ON "{table}" (GLOBALID)')
+            db.conn.execute(f"CREATE INDEX {db.table(name, '_FACID')} "
+                            f'ON "{table}" ({indexed})')
+            if versioned:
+                db.conn.execute(
+                    f"CREATE TABLE {db.table(name, '__DELTA')} "
+                    f"(VERSION TEXT NOT NULL, {_OID} INTEGER NOT NULL, "
+                    f"{', '.join(fields)}, PRIMARY KEY (VERSION, {_OID}))")
+                db.conn.execute(f"CREATE VIEW {db.table(name, '_EVW')} AS "
+                                f'SELECT * FROM "{table}"')
+            db.conn.execute("INSERT INTO GDB_ITEMS VALUES (?, ?, ?, ?, ?, ?)",
+                            (name, dataset,
+                             'FeatureClass' if shape_type else 'Table',
+                             shape_type, int(versioned), int(editor_tracking)))
+
+    def insert_rows(self, connection: str, name: str, fields: list, rows):
+        """Adds rows to the DEFAULT version of an item.
+
+        Parameters
+        ----------
+        connection : str
+            The path to the connection file
+        name : str
+            The name of the item, including its owner
+        fields : list
+            The names of the columns in each row
+        rows : iterable
+            Sequences of values, with datetimes for date fields
+        """
+
+        db, _ = self._database(connection)
+
+        def formatted(row):
+            return [v.strftime(_DATE_FORMAT) if isinstance(v, datetime)
+                    else v for v in row]
+
+        with db.conn:
+            db.conn.executemany(
+                f"INSERT INTO {db.table(name)} ({', '.join(fields)}) "
+                f"VALUES ({', '.join('?' * len(fields))})",
+                map(formatted, rows))
+
+    def grant(self, connection: str, grantee: str, name: str,
+              privileges=("SELECT", "UPDATE")):
+        """Grants privileges on an item to a database user."""
+        db, _ = self._database(connection)
+        owner, table = name.split('.', 1)
+        with db.conn:
+            db.conn.executemany(
+                "INSERT INTO ALL_TAB_PRIVS VALUES (?, ?, ?, ?)",
+                [(grantee, owner.upper(), table.upper(), p)
+                 for p in privileges])
+
+    def grant_role(self, connection: str, grantee: str, role: str):
+        """Grants a role to a database user. Privileges are granted to
+        the role itself with grant."""
+        db, _ = self._database(connection)
+        with db.conn:
+            db.conn.execute("INSERT INTO DBA_ROLE_PRIVS VALUES (?, ?)",
+                            (grantee, role))
+
+    @staticmethod
+    def create_project(path: str, maps: list):
+        """Creates a Pro project with an empty map for each name."""
+        with open(path, 'w') as f:
+            json.dump({"maps": [{"name": m, "layers": []} for m in maps]}, f,
+                      indent=2)
+
+    @staticmethod
+    def create_group_layer_file(path: str, name: str):
+        """Creates a layer file holding a single, empty group layer."""
+        with open(path, 'w') as f:
+            json.dump({"layers": [{"name": name, "isGroupLayer": True,
+                                   "layers": []}]}, f, indent=2)
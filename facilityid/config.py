@@ -1,51 +1,186 @@
 import getpass
 import logging
-import logging.config
-import logging.handlers
-
-import yaml
+import os
+from collections import namedtuple
 
 username = getpass.getuser()
 user_email = f"{username}@bouldercolorado.gov"
 
-with open(r'.\facilityid\config.yaml') as config_file:
-    config = yaml.safe_load(config_file.read())
-    config['LOGGING']['handlers']['email']['toaddrs'] = user_email
-    logging.config.dictConfig(config['LOGGING'])
+config_path = os.path.join(os.path.dirname(__file__), 'config.yaml')
+
+# Every setting, as read from config.yaml by load
+Settings = namedtuple('Settings', [
+    'config', 'aprx', 'lyr', 'db', 'database', 'recycle', 'recycle_max_gap',
+    'snapshot_rows', 'incremental', 'full_rescan_days', 'id_engine',
+    'grants_ttl', 'edit_batch_size', 'edit_retries', 'workers', 'prefetch',
+    'read', 'edit', 'db_params', 'db_creds', 'versioned_edits', 'post_edits',
+    'single_parent', 'procedure', 'recipients', 'smtp'])
+
+# The type of each setting in config.yaml, and a test of its value
+_RULES = {
+    "aprx": (str, None),
+    "template_lyr": (str, None),
+    "recycle_ids": (bool, None),
+    "recycle_max_gap": ((int, type(None)), lambda v: v is None or v >= 0),
+    "snapshot_rows": (bool, None),
+    "incremental": (bool, None),
+    "full_rescan_days": ((int, float), lambda v: v >= 0),
+    "id_engine": (str, lambda v: v in ('python', 'database')),
+    "grants_ttl": ((int, float), lambda v: v >= 0),
+    "edit_batch_size": (int, lambda v: v >= 1),
+    "edit_retries": (int, lambda v: v >= 0),
+    "workers": (int, lambda v: v >= 1),
+    "prefetch": (int, lambda v: v >= 0),
+    "platform": (str, None),
+    "authorization": (dict, None),
+    "single_parent": (bool, None),
+    "single": (dict, None),
+    "multiple": (dict, None),
+    "recipients": (dict, None),
+    "smtp": (dict, lambda v: {"host", "port", "sender"} <= set(v)),
+    "DATABASES": (dict, None),
+    "LOGGING": (dict, None),
+}
+
+_settings = None
+
+
+class ConfigError(Exception):
+    """Raised when config.yaml is missing a setting, or a setting has a
+    value the package can't use."""
+
+
+def _native(path: str) -> str:
+    """Converts a relative Windows path from config.yaml into a path on
+    the current platform, so the package can also run off Windows."""
+    if os.sep == '\\':
+        return path
+    return os.path.join(*path.split('\\'))
+
 
-# Pro project location
-aprx = config["aprx"]
-lyr = config["template_lyr"]
+def _validate(config: dict):
+    """Checks every setting of config.yaml at once.
 
-# Which database?
-db = config["platform"]
-database = config["DATABASES"][db]
+    Raises
+    ------
+    ConfigError
+        Listing every setting that is missing or can't be used
+    """
 
-# Recycle IDs?
-recycle = config["recycle_ids"]
+    problems = list()
+    for key, (kind, test) in _RULES.items():
+        if key not in config:
+            problems.append(f"{key} is missing")
+        elif not isinstance(config[key], kind) or (
+                test is not None and not test(config[key])):
+            problems.append(f"{key} can't be {config[key]!r}")
 
-# Database connections
-read = database["connections"]["read"]
-edit = database["connections"]["edit"]
+    platform = config.get("platform")
+    database = config.get("DATABASES", dict()).get(platform)
+    if not isinstance(database, dict):
+        problems.append(f"DATABASES has no {platform!r} platform")
+    elif not ({"connections", "info", "credentials"} <= set(database)
+              and {"read", "edit"} <= set(database["connections"] or ())):
+        problems.append(f"DATABASES {platform!r} needs read and edit "
+                        "connections, info, and credentials")
 
-# Database properties
-db_params = database["info"]
-db_creds = database["credentials"]
+    if problems:
+        raise ConfigError(f"{config_path}: " + "; ".join(problems))
 
-# Data owners that authorize versioned edits
-versioned_edits = [
-    k for k, v in config["authorization"].items() if v["versioned_edits"]]
 
-# Data owners that authorize posting edits
-post_edits = [k for k, v in config["authorization"].items()
-              if v["post_edits"]]
+def load() -> Settings:
+    """Reads config.yaml and sets up logging.
+
+    Nothing is read when this module is imported. The file is parsed and
+    validated the first time a setting is used, e.g. config.db, or when
+    this is called, and the settings are cached for the rest of the run.
+    A setting can still be overridden by assigning to it, e.g.
+    config.db = 'SQLITE'.
+
+    Returns
+    -------
+    Settings
+        Every setting read from config.yaml
+
+    Raises
+    ------
+    ConfigError
+        If a setting is missing or can't be used
+    """
+
+    global _settings
+    if _settings is not None:
+        return _settings
+
+    import logging.config
+    import logging.handlers  # noqa: F401 (the email handler lives here)
+
+    import yaml
+
+    with open(config_path) as config_file:
+        config = yaml.safe_load(config_file.read())
+    _validate(config)
+
+    config['LOGGING']['handlers']['email']['toaddrs'] = user_email
+    file_handler = config['LOGGING']['handlers']['file']
+    file_handler['filename'] = _native(file_handler['filename'])
+    # Modules create their loggers when imported, before this is called
+    logging.config.dictConfig({"disable_existing_loggers": False,
+                               **config['LOGGING']})
 
-# Filters for analysis
-single_parent = config["single_parent"]
+    database = config["DATABASES"][config["platform"]]
+    authorization = config["authorization"]
+    _settings = Settings(
+        config=config,
+        # Pro project location
+        aprx=_native(config["aprx"]),
+        lyr=_native(config["template_lyr"]),
+        # Which database?
+        db=config["platform"],
+        database=database,
+        # Recycle IDs?
+        recycle=config["recycle_ids"],
+        recycle_max_gap=config["recycle_max_gap"],
+        # Store every (GLOBALID, FACILITYID) pair between runs?
+        snapshot_rows=config["snapshot_rows"],
+        # Rescan only rows edited since the last run, and how often to
+        # rescan in full
+        incremental=config["incremental"],
+        full_rescan_days=config["full_rescan_days"],
+        # Work out new IDs in the script (python) or in the database
+        id_engine=config["id_engine"],
+        # How many seconds to reuse the privileges of the editing user
+        grants_ttl=config["grants_ttl"],
+        # How many edited rows to write per edit session, and how often
+        # to retry
+        edit_batch_size=config["edit_batch_size"],
+        edit_retries=config["edit_retries"],
+        # How many features to analyze at once, and how many features
+        # ahead to send the metadata queries of
+        workers=config["workers"],
+        prefetch=config["prefetch"],
+        # Database connections
+        read=_native(database["connections"]["read"]),
+        edit=_native(database["connections"]["edit"]),
+        # Database properties
+        db_params={k: _native(v) for k, v in database["info"].items()},
+        db_creds=database["credentials"],
+        # Data owners that authorize versioned edits and posting edits
+        versioned_edits=[k for k, v in authorization.items()
+                         if v["versioned_edits"]],
+        post_edits=[k for k, v in authorization.items() if v["post_edits"]],
+        # Filters for analysis
+        single_parent=config["single_parent"],
+        procedure=config["single" if config["single_parent"]
+                         else "multiple"],
+        recipients=config['recipients'],
+        # How to send emails
+        smtp=config['smtp'])
+    return _settings
 
-if single_parent:
-    procedure = config["single"]
-else:
-    procedure = config["multiple"]
 
-recipients = config['recipients']
+def __getattr__(name: str):
+    """Reads config.yaml the first time a setting is used."""
+    if name in Settings._fields:
+        return getattr(load(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
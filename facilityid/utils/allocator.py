@@ -0,0 +1,80 @@
+from itertools import islice
+
+
+class IdAllocator:
+    """Hands out new integer IDs based on the IDs already used in a
+    table.
+
+    New IDs are either backfilled into the gaps between used IDs or
+    incremented from the maximum used ID. Gaps are found lazily by
+    walking the sorted used IDs, so the range between the minimum and
+    maximum IDs is never materialized.
+
+    Parameters
+    ----------
+    used : iterable
+        Integer IDs that are already used in the table
+    recycle : bool, optional
+        Whether to backfill gaps between the minimum and maximum used
+        IDs before incrementing from the maximum, by default False
+    max_gap : int, optional
+        When recycling, gaps with more unused IDs than this are assumed
+        to be caused by outliers and are skipped rather than backfilled.
+        None backfills every gap, by default None
+    """
+
+    def __init__(self, used, recycle: bool = False, max_gap: int = None):
+        self.recycle = recycle
+        self.max_gap = max_gap
+        if recycle:
+            self.used = sorted(set(used))
+            self.max = self.used[-1] if self.used else 0
+        else:
+            # Only the maximum is needed to increment from, so the used
+            # IDs are never held in memory
+            self.used = list()
+            self.max = max(used, default=0)
+        self._unused = self._iter_unused() if recycle else iter(())
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> int:
+        """Finds the next best ID to apply to a row with missing or
+        duplicated IDs.
+
+        Returns
+        -------
+        int
+            The smallest unused ID left in an eligible gap, or one more
+            than the largest ID handed out so far
+        """
+
+        for new_id in self._unused:
+            return new_id
+
+        self.max += 1
+        return self.max
+
+    def gaps(self):
+        """Yields ranges of unused IDs between consecutive used IDs,
+        from lowest to highest, skipping gaps wider than max_gap.
+
+        Yields
+        ------
+        range
+            Unused IDs between two used IDs
+        """
+
+        for low, high in zip(self.used, islice(self.used, 1, None)):
+            width = high - low - 1
+            if width < 1:
+                continue
+            if self.max_gap is not None and width > self.max_gap:
+                continue
+            yield range(low + 1, high)
+
+    def _iter_unused(self):
+        """Yields every unused ID inside the eligible gaps."""
+        for gap in self.gaps():
+            yield from gap
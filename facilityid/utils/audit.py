@@ -0,0 +1,222 @@
+import csv
+import os
+import sqlite3
+from collections import OrderedDict
+
+import facilityid.config as config
+
+# Where the history of every edit is partitioned, one file per month
+EDITS = os.path.join('.', 'facilityid', 'log', 'edits')
+
+# The flat csv that held the history of every edit before it was partitioned
+LEGACY = os.path.join('.', 'facilityid', 'log', 'AllEditsEver.csv')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS edits (
+    date TEXT NOT NULL,
+    time TEXT,
+    owner TEXT,
+    feature TEXT,
+    globalid TEXT,
+    old_facilityid TEXT,
+    new_facilityid TEXT
+);
+CREATE INDEX IF NOT EXISTS edits_owner ON edits (owner, feature);
+CREATE INDEX IF NOT EXISTS edits_feature ON edits (feature);
+CREATE INDEX IF NOT EXISTS edits_globalid ON edits (globalid);
+"""
+
+# The keys of an edited record, in the order of the edits table
+_FIELDS = ["DATE", "TIME", "OWNER", "FEATURE", "GLOBALID", "OLDFACILITYID",
+           "NEWFACILITYID"]
+
+# Initialize the logger for this file
+log = config.logging.getLogger(__name__)
+
+
+class CsvLog:
+    """Csv files that stay open for the whole run, so that each is opened
+    once and written in large blocks.
+
+    Files are opened in append mode, and a header is written when a file
+    is new. Only the most recently written files are kept open; close
+    flushes and closes the rest.
+    """
+
+    buffering = 1 << 20  # bytes buffered before a file is written to disk
+    max_open = 64  # how many files may be open at once
+    files = OrderedDict()  # Open files and their writers, by path
+
+    @classmethod
+    def write(cls, csv_file: str, rows: list):
+        """Writes dict-like rows to a csv file.
+
+        Parameters
+        ----------
+        csv_file : str
+            File path to the csv file
+        rows : list
+            Each item in the list is a dictionary representing a row
+        """
+
+        if csv_file in cls.files:
+            cls.files.move_to_end(csv_file)
+            _, writer = cls.files[csv_file]
+        else:
+            if len(cls.files) >= cls.max_open:
+                _, (oldest, _) = cls.files.popitem(last=False)
+                oldest.close()
+            new = not os.path.exists(csv_file)
+            f = open(csv_file, 'a', newline='', buffering=cls.buffering)
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            if new:
+                writer.writeheader()
+            cls.files[csv_file] = (f, writer)
+        writer.writerows(rows)
+
+    @classmethod
+    def close(cls):
+        """Flushes and closes every open file."""
+        while cls.files:
+            _, (f, _) = cls.files.popitem()
+            f.close()
+
+
+class AuditLog:
+    """The history of every edit ever made, partitioned into one SQLite
+    file per month.
+
+    Each partition holds the same columns as the edit csv files, indexed
+    by owner, feature, and GLOBALID, so that the history can be queried
+    without reading every month. Connections stay open for the run and
+    edits are committed in large blocks. The first time the partitions
+    are created, any rows in the legacy AllEditsEver.csv are imported.
+
+    Parameters
+    ----------
+    folder : str, optional
+        Folder holding the partitions, by default EDITS
+    """
+
+    block = 50000  # edits buffered before they are committed
+    connections = dict()  # Open partitions, by folder and month
+    pending = dict()  # Edits not yet committed, by folder and month
+
+    def __init__(self, folder: str = EDITS):
+        self.folder = folder
+
+    def _connect(self, month: str) -> sqlite3.Connection:
+        key = (self.folder, month)
+        if key not in self.connections:
+            path = os.path.join(self.folder, f"edits_{month}.sqlite")
+            conn = sqlite3.connect(path)
+            conn.executescript(_SCHEMA)
+            self.connections[key] = conn
+        return self.connections[key]
+
+    def _partitions(self, start: str = None, end: str = None) -> list:
+        """Lists the months that have been partitioned, limited to those
+        between the start and end dates, as 'YYYY-MM-DD' strings."""
+        if not os.path.isdir(self.folder):
+            return list()
+        months = sorted(x.name[6:13] for x in os.scandir(self.folder)
+                        if x.name.startswith("edits_")
+                        and x.name.endswith(".sqlite"))
+        return [m for m in months if (start is None or m >= start[:7])
+                and (end is None or m <= end[:7])]
+
+    def append(self, records: list):
+        """Adds edited rows to the partition of the month they were made.
+
+        Parameters
+        ----------
+        records : list
+            Dicts describing each edited row, keyed like the edit csv
+            files
+        """
+
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+            if os.path.exists(LEGACY):
+                self._import(LEGACY)
+        for record in records:
+            key = (self.folder, record["DATE"][:7])
+            self.pending.setdefault(key, list()).append(
+                tuple(record[f] for f in _FIELDS))
+        if sum(map(len, self.pending.values())) >= self.block:
+            self.flush()
+
+    def _import(self, csv_file: str):
+        """Adds every row of a flat edit csv to the partitions."""
+        log.info(f"Importing {csv_file} into monthly partitions...")
+        with open(csv_file, newline='') as c:
+            for row in csv.DictReader(c):
+                key = (self.folder, row["DATE"][:7])
+                self.pending.setdefault(key, list()).append(
+                    tuple(row.get(f) for f in _FIELDS))
+                if len(self.pending[key]) >= self.block:
+                    self.flush()
+        self.flush()
+
+    @classmethod
+    def flush(cls):
+        """Commits every pending edit to its partition."""
+        for (folder, month), rows in cls.pending.items():
+            conn = cls(folder)._connect(month)
+            with conn:
+                conn.executemany(
+                    "INSERT INTO edits VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        cls.pending.clear()
+
+    @classmethod
+    def close(cls):
+        """Commits every pending edit and closes every partition."""
+        cls.flush()
+        while cls.connections:
+            _, conn = cls.connections.popitem()
+            conn.close()
+
+    def query(self, owner: str = None, feature: str = None,
+              globalid: str = None, start: str = None,
+              end: str = None) -> list:
+        """Finds edits in the history. Only the partitions of the months
+        between start and end are read.
+
+        Parameters
+        ----------
+        owner : str, optional
+            Only edits to layers owned by this user, by default None
+        feature : str, optional
+            Only edits to this feature, by default None
+        globalid : str, optional
+            Only edits to this row, by default None
+        start : str, optional
+            Only edits made on or after this 'YYYY-MM-DD' date, by default
+            None
+        end : str, optional
+            Only edits made on or before this 'YYYY-MM-DD' date, by default
+            None
+
+        Returns
+        -------
+        list
+            Dicts describing each edit, keyed like the edit csv files, in
+            the order they were made
+        """
+
+        self.flush()
+        filters = {"owner = ?": owner, "feature = ?": feature,
+                   "globalid = ?": globalid, "date >= ?": start,
+                   "date <= ?": end}
+        where = [k for k, v in filters.items() if v is not None]
+        params = [v for v in filters.values() if v is not None]
+        sql = "SELECT * FROM edits"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY date, time, rowid"
+
+        edits = list()
+        for month in self._partitions(start, end):
+            rows = self._connect(month).execute(sql, params)
+            edits += [dict(zip(_FIELDS, row)) for row in rows]
+        return edits
@@ -1,137 +1,260 @@
 import os
-import shelve
-from datetime import date, datetime, timezone
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from functools import partial
+from itertools import chain, groupby
 
 import facilityid.config as config
-from arcpy import ClearWorkspaceCache_management
-from arcpy.da import Editor, UpdateCursor
-from arcpy.mp import ArcGISProject, LayerFile
+from facilityid.backends import ExecuteError, get_backend
 
+from .allocator import IdAllocator
+from .audit import AuditLog
 from .identifier import Identifier
 from .management import write_to_csv
+from .report import RunReport
+from .snapshot import SnapshotStore
+from .table import TableScan
 
 # Initialize the logger for this file
 log = config.logging.getLogger(__name__)
 
 
-def _merge(x):
-    """Concatenate an ID back together."""
-
-    p = x['FACILITYID']['prefix']
-    i = x['FACILITYID']['str_id']
-    return p + i
-
-
 class Edit(Identifier):
     """A class meant to be used once a table has been slated for edits.
 
     Parameters
     ----------
-    rows : list
-        A list of dictionaries, where each dict represents a row of the
-        table
-    duplicates : list
-        A list of GLOBALIDs that have duplicated FACILITYIDs
-    used : list
-        A reverse sorted list of used IDs in the table
-    unused : list
-        A reverse sorted list of unused IDs between the min and max of
-        used IDs
+    scan : TableScan
+        The single pass over the table's rows
+    rows : RowTable
+        The rows of the table that may need edits, stored column by
+        column
+    duplicates : set
+        A set of GLOBALIDs that have duplicated FACILITYIDs
+    ids : IdAllocator
+        Hands out new IDs based on the IDs used in the table
+    measures : dict
+        The area or length of duplicated rows in polygon and polyline
+        layers, keyed by GLOBALID, once the table is analyzed
+    records : list
+        Dicts describing each edited row, once the table is analyzed
+    count : dict
+        How many of each kind of edit the table needs, all zero until
+        the table is analyzed
+    written : int
+        How many of the records have been saved in a version
+    server_side : bool
+        Whether the database works out the edits instead of the rows
+        being read, see _assignment_query
     """
 
     edited_users = list()  # Data owners that had edits performed
     edited_features = list()  # Counts of edits required for each layer
     version_failures = list()  # Layers that can't have versioned edits done
-
-    def __init__(self, tuple_path):
-        super().__init__(tuple_path)
-        self.rows = self.rows()
-        self.duplicates = self.duplicates()
-        self.used = self._used()
-        self.unused = self._unused() if config.recycle else None
+    aprx_layers = list()  # Edited layers waiting to be added to the aprx
+
+    def __init__(self, tuple_path, incremental: bool = False,
+                 profile: dict = None):
+        super().__init__(tuple_path, profile)
+        self.read_fingerprint = self.fingerprint()
+        self.server_side = self._server_side()
+        if self.server_side:
+            # No rows are read; the database works out the edits
+            self.since, self.incremental = None, False
+            self.scan = self.ids = None
+        else:
+            self._read(incremental)
+        self.measures = dict()
+        self.records = None
+        self.written = 0
+        self.count = self._new_count()
 
     def __hash__(self):
         return hash(self.__key())
 
     def __key(self):
-        guid_facid_pairs = [(x['GLOBALID'], _merge(x)) for x in self.rows]
-        key = tuple(sorted(guid_facid_pairs, key=lambda y: y[0]))
-        return key
+        return self.scan.digest()
 
-    def add_edit_metadata(self):
-        self.edited_features.append(self.count)
-        if self.owner not in self.edited_users:
-            self.edited_users.append(self.owner)
+    def _server_side(self) -> bool:
+        """Whether the database should work out the edits of the layer.
 
-    def _used(self):
-        """Extracts a list of used ids in rows, sorted in reverse order.
+        Only layers whose new IDs are incremented from the largest ID,
+        and whose prefix is in upper case, can be edited in a single
+        query. Every other layer is read into the script.
+        """
+        if config.id_engine != 'database':
+            return False
+        if config.recycle or not (self.prefix and self.prefix.isupper()):
+            log.debug((f"The edits of {self.feature_name} will be worked "
+                       "out by the script..."))
+            return False
+        return True
+
+    def _read(self, incremental: bool):
+        """Reads the rows of the table that may need edits, along with
+        every ID in use.
+
+        Parameters
+        ----------
+        incremental : bool
+            Whether to only read rows edited since the last run
+        """
+
+        with SnapshotStore() as store:
+            self.since = self._since(store) if incremental else None
+            self.incremental = bool(
+                self.since and self._read_changes(store, self.since))
+            if self.incremental:
+                # The IDs of rows that were read again replace the IDs
+                # they were stored with
+                read = self.scan.rows.globalids
+                used = chain(store.used_ids(self.feature_name, read),
+                             self.scan.used_ids())
+            else:
+                # Stream every row once, keeping only those that may need
+                # edits and staging the rest in the store
+                self.duplicates = self.duplicates()
+                stage = None
+                if config.snapshot_rows:
+                    stage = partial(store.stage, self.feature_name)
+                self.scan = self.rows(scan=TableScan(self._needs_edit),
+                                      sink=stage)
+                self.scan.keep = None
+                used = self.scan.used_ids()
+            self.rows = self.scan.rows
+            self.ids = IdAllocator(used, config.recycle,
+                                   config.recycle_max_gap)
+
+    def _needs_edit(self, globalid: str, pfix: str, str_id: str) -> bool:
+        """Whether _edit could change a row, based on its values as
+        read. Only these rows are kept in memory."""
+        if globalid in self.duplicates and pfix == self.prefix:
+            return True
+        return (not pfix or not pfix.isupper() or pfix != self.prefix
+                or not str_id)
+
+    def _records(self):
+        """Yields the (GLOBALID, FACILITYID, int ID) of every kept
+        row."""
+        return zip(self.rows.globalids, map(self.rows.merged, self.rows),
+                   map(self.rows.int_id, self.rows))
+
+    def _date_literal(self, value: datetime) -> str:
+        """Formats a date for use inside a where clause."""
+        text = value.strftime('%Y-%m-%d %H:%M:%S')
+        if self.database == 'ORACLE':
+            return f"TIMESTAMP '{text}'"
+        return f"'{text}'"
+
+    def _since(self, store):
+        """Finds the edit date that an incremental rescan can pick up
+        from.
+
+        A layer can only be rescanned incrementally if its rows were
+        stored by the previous run, it needed no edits at the time, and
+        its last full scan is more recent than the configured schedule.
+
+        Parameters
+        ----------
+        store : SnapshotStore
+            The open store of previous runs
 
         Returns
         -------
-        list
-            Used IDs between min and max utilized IDs
+        datetime
+            The latest edit date read by the previous run, or None if
+            the layer must be scanned in full
         """
-        all_used = sorted(
-            [x["FACILITYID"]["int_id"]
-             for x in self.rows if x["FACILITYID"]["int_id"] is not None],
-            reverse=True)
-        return all_used
 
-    def _unused(self) -> list:
-        """Extracts a list of unused ids that lie between the minimum
-        and maximum ids in order to backfill gaps in ID sequences.
+        layer = store.layer(self.feature_name)
+        if not (layer.get("fingerprint") and layer.get("watermark")
+                and layer.get("row_count") is not None):
+            return None
+
+        full_scan_at = datetime.fromisoformat(layer["full_scan_at"])
+        if datetime.now() - full_scan_at > timedelta(
+                days=config.full_rescan_days):
+            log.debug(f"{self.feature_name} is due for a full rescan...")
+            return None
+
+        return datetime.fromisoformat(layer["watermark"])
+
+    def _read_changes(self, store, since: datetime) -> bool:
+        """Reads only the rows created or edited since the previous run,
+        plus any stored rows that share an ID with them.
+
+        Parameters
+        ----------
+        store : SnapshotStore
+            The open store of previous runs
+        since : datetime
+            The latest edit date read by the previous run
 
         Returns
         -------
-        list
-            Unused IDs between the minimum and maximum utilized IDs
+        bool
+            Whether the rows could be read incrementally. If False, rows
+            were deleted since the previous run and the layer must be
+            scanned in full.
         """
 
-        min_id = self.used[-1]
-
-        # initiate a try block in case the max id is too large to compute a set
-        # and overflows computer memory
-        for m in self.used:
-            try:
-                set_of_all = set(range(min_id, m))
-                set_of_used = set(self.used)
-                unused = sorted(list(set_of_all - set_of_used), reverse=True)
-                break
-            except (OverflowError, MemoryError):
-                continue
+        stamp = self._date_literal(since)
+        query = (f"{self.editedAtFieldName} >= {stamp} OR "
+                 f"{self.createdAtFieldName} >= {stamp}")
+        scan = self.rows(query)
+        table = scan.rows
+        changed = set(table.globalids)
+
+        # Rows are only ever added or changed between incremental runs, so
+        # a row count that doesn't add up means rows were deleted
+        new = changed - store.known(self.feature_name, changed)
+        expected = store.layer(self.feature_name)["row_count"] + len(new)
+        if (self.read_fingerprint is None
+                or int(self.read_fingerprint[0]) != expected):
+            log.debug((f"Rows were deleted from {self.feature_name} since "
+                       "the last run, so it will be scanned in full..."))
+            return False
+
+        # Group every changed row with the stored rows that share its ID
+        groups = defaultdict(set)
+        for i in table:
+            facid = table.merged(i)
+            if facid:
+                groups[facid].add(table.globalids[i])
+        stored = store.lookup(self.feature_name, groups)
+        for facid, globalids in stored.items():
+            groups[facid].update(g for g in globalids if g not in changed)
+        self.duplicates = set(
+            chain.from_iterable(g for g in groups.values() if len(g) > 1))
+
+        # Read the unchanged rows needed to settle duplicates
+        partners = self.duplicates - changed
+        if partners:
+            guids = ", ".join(f"'{x}'" for x in partners)
+            self.rows(f"GLOBALID IN ({guids})", scan)
+
+        log.debug((f"Rescanning {len(changed)} rows of {self.feature_name} "
+                   f"created or edited since {since}..."))
+        self.scan = scan
+        return True
 
-        return unused
+    def add_edit_metadata(self):
+        self.edited_features.append(self.count)
+        if self.owner not in self.edited_users:
+            self.edited_users.append(self.owner)
 
     def _new_id(self) -> int:
         """Finds the next best ID to apply to a row with missing or
         duplicated IDs.
 
-        This function modifies both inputs by either popping the last
-        item off the end of the unused list or incrementing the used
-        list by 1
-
-        Parameters
-        ----------
-        used : list
-            A list of used IDs in the table, sorted in reverse order.
-        unused : list
-            A list of unused IDs between the minimum and maximum IDs in
-            the feature class, sorted in reverse order.
-
         Returns
         -------
         int
             An integer number representing the next logical ID to assign
         """
 
-        if self.unused:
-            new_id = self.unused.pop()
-        else:
-            max_id = self.used[0] + 1
-            new_id = max_id
-            self.used.insert(0, max_id)
-
-        return new_id
+        return next(self.ids)
 
     def _sorter(self, x):
         """A function meant to be used in the builtin sort function for
@@ -142,8 +265,8 @@ class Edit(Identifier):
 
         Parameters
         ----------
-        x : dict
-            Represents a single row from the list of rows
+        x : int
+            The position of a single row in the table of rows
 
         Returns
         -------
@@ -151,45 +274,48 @@ class Edit(Identifier):
             A tuple that dictates how to multi-sort
         """
 
-        # Define date to replace Null values in the sort
-        # Null values first, followed byt oldest to newest
-        _null_date = datetime(1400, 1, 1, tzinfo=timezone.utc)
         geo = self.shapeType if self.datasetType == 'FeatureClass' else ''
 
         def geom_sorter(g):
             """Determines the proper field to sort on based
             on the spatial data type."""
 
-            if g == 'Polygon':
-                return x['SHAPE@'].area
-            elif g == 'Polyline':
-                return x['SHAPE@'].length
+            if g in ('Polygon', 'Polyline'):
+                return self.measures.get(self.rows.globalids[x]) or 0
             else:
-                return -(x[self.createdAtFieldName] or _null_date).timestamp()
+                return -self.rows.created[x]
 
-        sort_1 = _merge(x)
-        sort_2 = -(x[self.editedAtFieldName] or _null_date).timestamp()
+        sort_1 = self.rows.merged(x)
+        sort_2 = -self.rows.edited[x]
         sort_3 = geom_sorter(geo)
 
         return (sort_1, sort_2, sort_3)
 
-    def _format_edit_row(self, row, old_facid):
+    def _format_edit_row(self, globalid, old_facid, new_facid):
         result = {"DATE": str(date.today()),
                   "TIME": datetime.now().strftime("%H:%M:%S"),
                   "OWNER": self.owner,
                   "FEATURE": self.name,
-                  "GLOBALID": row["GLOBALID"],
+                  "GLOBALID": globalid,
                   "OLDFACILITYID": old_facid,
-                  "NEWFACILITYID": _merge(row)}
+                  "NEWFACILITYID": new_facid}
         return result
 
+    def _new_count(self) -> dict:
+        """A dict that will count the kinds of edits required."""
+        return {"0 - Feature": self.feature_name,
+                "1 - # Empty IDs": 0,
+                "2 - # Incorrect IDs": 0,
+                "3 - # Duplicated IDs": 0,
+                "4 - Total Edits": 0}
+
     def _edit(self):
         """Iterates through a list of rows, editing incorrect or
         duplicated entries along the way.
 
         This method edits duplicated FACILITYIDs first, followed by
-        incorrect or missing FACILITYIDs. It also modifies the used and
-        unused attributes of the class. Ultimately the edited attribute
+        incorrect or missing FACILITYIDs. It also draws new IDs from the
+        ids attribute of the class. Ultimately the edited attribute
         will be populated if edits were made to the table.
 
         The method knows to edit incorrect IDs based on the following
@@ -210,26 +336,26 @@ class Edit(Identifier):
         """
 
         # Initialize a dict that will count the kinds of edits required
-        self.count = {"0 - Feature": self.feature_name,
-                      "1 - # Empty IDs": 0,
-                      "2 - # Incorrect IDs": 0,
-                      "3 - # Duplicated IDs": 0,
-                      "4 - Total Edits": 0}
+        self.count = self._new_count()
 
         edited = list()
         if self.duplicates:
             log.debug("Identifying duplicated Facility IDs...")
             # Identify rows that contain duplicate FACILITYIDs with the correct
             # prefix
-            dup_rows = [row for row in self.rows if row['GLOBALID']
-                        in self.duplicates and row['FACILITYID']['prefix']
+            dup_rows = [x for x in self.rows if self.rows.globalids[x]
+                        in self.duplicates and self.rows.prefix(x)
                         == self.prefix]
-            # Perform the sort
+            # Only read the geometry measures that the sort needs
+            self.measures = self.shape_measures(
+                self.rows.globalids[x] for x in dup_rows)
+            # Perform the sort, which also brings identical IDs together
             dup_rows.sort(key=self._sorter)
+            # Group the duplicated rows by their ID before any are edited
+            groups = [(i, list(chunk)) for i, chunk in
+                      groupby(dup_rows, key=self.rows.merged)]
             # Iterate through each unique ID in the duplicated rows
-            distinct = set([_merge(r) for r in dup_rows])
-            for i in distinct:
-                chunk = [x for x in dup_rows if _merge(x) == i]
+            for i, chunk in groups:
                 # The last ID of the list (e.g. 'chunk[-1]'), does not need to
                 # be edited, since all of its dupes have been replaced
                 for c in chunk[:-1]:
@@ -237,24 +363,20 @@ class Edit(Identifier):
                     self.count["3 - # Duplicated IDs"] += 1
                     self.count["4 - Total Edits"] += 1
 
-                    edit_row = self.rows[self.rows.index(c)]
                     new_id = self._new_id()
-                    edit_row["FACILITYID"]["int_id"] = new_id
-                    edit_row["FACILITYID"]["str_id"] = str(new_id)
-                    r = self._format_edit_row(edit_row, i)
+                    self.rows.set_id(c, new_id)
+                    r = self._format_edit_row(self.rows.globalids[c], i,
+                                              self.rows.merged(c))
                     edited.append(r)
 
         log.debug("Inspecting all other rows in the table...")
         for edit_row in self.rows:
-            if edit_row in edited:
-                continue
             # Flag whether edits need to be made to the row
             # Assume no edits to start
             edits = False
-            old_facid = _merge(edit_row)
-            pfix = edit_row["FACILITYID"]["prefix"]
-            str_id = edit_row["FACILITYID"]["str_id"]
-            # int_id = edit_row["FACILITYID"]["int_id"]
+            old_facid = self.rows.merged(edit_row)
+            pfix = self.rows.prefix(edit_row)
+            str_id = self.rows.str_id(edit_row)
             empty = not pfix and not str_id
 
             # Count whether the ID is empty
@@ -263,7 +385,7 @@ class Edit(Identifier):
 
             # PREFIX EDITS
             if not pfix or not pfix.isupper() or pfix != self.prefix:
-                edit_row["FACILITYID"]["prefix"] = self.prefix
+                self.rows.set_prefix(edit_row, self.prefix)
                 edits = True
 
             # ID EDITS
@@ -273,8 +395,7 @@ class Edit(Identifier):
             # if not str_id or len(str_id) != len(str(int_id)):
             if not str_id or (pfix != self.prefix and pfix):
                 new_id = self._new_id()
-                edit_row["FACILITYID"]["int_id"] = new_id
-                edit_row["FACILITYID"]["str_id"] = str(new_id)
+                self.rows.set_id(edit_row, new_id)
                 edits = True
 
             if edits:
@@ -286,11 +407,197 @@ class Edit(Identifier):
                 if not empty:
                     self.count["2 - # Incorrect IDs"] += 1
 
-                r = self._format_edit_row(edit_row, old_facid)
+                r = self._format_edit_row(self.rows.globalids[edit_row],
+                                          old_facid,
+                                          self.rows.merged(edit_row))
                 edited.append(r)
 
         return edited
 
+    def _assignment_query(self) -> str:
+        """Builds the platform's SQL statement for _edit_in_database.
+
+        The statement works out the same edits as _edit does when IDs are
+        not recycled, without sending any unedited rows back. Duplicated
+        rows with the layer's prefix are ranked within their ID like
+        _sorter, and all but the last are renumbered. Every other row
+        with a missing, lowercase, or foreign prefix, or a missing ID, is
+        then fixed in ObjectID order, the order _edit reads rows in. New
+        IDs count up from the largest ID in the table with ROW_NUMBER(),
+        leaving out IDs too large for a 64-bit integer.
+
+        Returns
+        -------
+        str
+            A query returning the GLOBALID, old FACILITYID, new
+            FACILITYID, and kind of edit of every edited row, in the
+            order _edit edits them
+        """
+
+        table = self.database_name
+        prefix = f"'{self.prefix}'"
+        if self.database in ('ORACLE', 'SQLITE'):
+            guid = "GLOBALID"
+            pfix = "REGEXP_SUBSTR(FACILITYID, '^[^0-9]*')"
+            str_id = ("REGEXP_SUBSTR(FACILITYID, '^[^0-9]*([0-9]+)$', "
+                      "1, 1, NULL, 1)")
+            # Only IDs that fit in 64 bits count towards the largest ID,
+            # like BIGINT on SQL Server
+            digits = "COALESCE(LENGTH(LTRIM(STR_ID, '0')), 0)"
+            fits = (f"{digits} < 19 OR ({digits} = 19 AND "
+                    f"LTRIM(STR_ID, '0') <= '{2 ** 63 - 1}')")
+            if self.database == 'ORACLE':
+                int_id = f"CASE WHEN {fits} THEN TO_NUMBER(STR_ID) END"
+                present = "FACILITYID IS NOT NULL"  # '' is NULL in Oracle
+                measure = {'Polygon': "SDE.ST_AREA(SHAPE)",
+                           'Polyline': "SDE.ST_LENGTH(SHAPE)"}
+            else:
+                int_id = f"CASE WHEN {fits} THEN CAST(STR_ID AS INTEGER) END"
+                present = "FACILITYID IS NOT NULL AND FACILITYID <> ''"
+                measure = {'Polygon': "SHAPE_AREA",
+                           'Polyline': "SHAPE_LENGTH"}
+
+            def concat(a, b):
+                return f"COALESCE({a}, '') || COALESCE({b}, '')"
+
+            def binary(x):
+                return x
+
+            def same(x, literal):
+                return f"{x} = {literal}"
+        else:
+            guid = "CAST(GLOBALID AS NVARCHAR(40))"
+            digit = "PATINDEX('%[0-9]%', FACILITYID)"
+            tail = f"SUBSTRING(FACILITYID, {digit}, 255)"
+            pfix = (f"NULLIF(CASE WHEN {digit} = 0 THEN FACILITYID "
+                    f"ELSE LEFT(FACILITYID, {digit} - 1) END, '')")
+            str_id = (f"CASE WHEN {digit} > 0 AND {tail} NOT LIKE "
+                      f"'%[^0-9]%' THEN {tail} END")
+            int_id = "TRY_CAST(STR_ID AS BIGINT)"
+            present = "FACILITYID IS NOT NULL AND FACILITYID <> ''"
+            measure = {'Polygon': "SHAPE.STArea()",
+                       'Polyline': "SHAPE.STLength()"}
+
+            def concat(a, b):
+                return f"CONCAT({a}, {b})"
+
+            def binary(x):
+                # Order like Python does, by code point and case
+                return f"{x} COLLATE Latin1_General_BIN2"
+
+            def same(x, literal):
+                # = ignores trailing spaces, so 'WF ' would equal 'WF'
+                # unless a sentinel is appended to both sides
+                return (f"({x} + '|') COLLATE Latin1_General_BIN2 = "
+                        f"{literal} + '|'")
+
+        # How _sorter orders the rows of a duplicated ID, as (expression,
+        # descending) pairs; null edit dates are the oldest
+        order = [("CASE WHEN EDITED_AT IS NULL THEN 1 ELSE 0 END", False),
+                 ("EDITED_AT", True)]
+        if self.shape in measure:
+            tiebreak = f"{measure[self.shape]} AS TIEBREAK"
+            order += [("COALESCE(TIEBREAK, 0)", False)]
+        else:
+            tiebreak = f"{self.createdAtFieldName} AS TIEBREAK"
+            order += [("CASE WHEN TIEBREAK IS NULL THEN 1 ELSE 0 END", False),
+                      ("TIEBREAK", True)]
+        order += [("ROW_OID", False)]
+
+        # The last row of each duplicated ID keeps it, so rank them in
+        # reverse; edits are made in sorted order, then in ObjectID order
+        last = [(x, not desc) for x, desc in order]
+        sequence = ([("RENUMBER", True),
+                     (binary("CASE WHEN RENUMBER = 1 THEN MERGED END"),
+                      False)]
+                    + [(f"CASE WHEN RENUMBER = 1 THEN {x} END", desc)
+                       for x, desc in order[:-1]] + [("ROW_OID", False)])
+
+        def by(keys):
+            return ", ".join(x + (" DESC" if desc else "") for x, desc in keys)
+
+        foreign = f"NOT ({same('PFIX', prefix)})"
+        new_id = concat(prefix, "COALESCE(MAX_ID, 0) + ROW_NUMBER() OVER "
+                        f"(PARTITION BY NEW_ID ORDER BY {by(sequence)})")
+        return f"""WITH parsed AS (
+                    SELECT {guid} AS GUID, {pfix} AS PFIX,
+                           {str_id} AS STR_ID,
+                           {self.editedAtFieldName} AS EDITED_AT,
+                           {tiebreak}, {self.OIDFieldName} AS ROW_OID,
+                           CASE WHEN {present} AND COUNT(*) OVER (
+                               PARTITION BY FACILITYID) > 1
+                           THEN 1 ELSE 0 END AS SHARED
+                    FROM {table}
+                ), keyed AS (
+                    SELECT p.*, {concat('PFIX', 'STR_ID')} AS MERGED,
+                           {int_id} AS INT_ID,
+                           CASE WHEN SHARED = 1 AND {same('PFIX', prefix)}
+                           THEN 1 ELSE 0 END AS DUP
+                    FROM parsed p
+                ), ranked AS (
+                    SELECT k.*,
+                           CASE WHEN DUP = 1 AND ROW_NUMBER() OVER (
+                               PARTITION BY DUP, {binary('MERGED')}
+                               ORDER BY {by(last)}) > 1
+                           THEN 1 ELSE 0 END AS RENUMBER,
+                           MAX(INT_ID) OVER () AS MAX_ID
+                    FROM keyed k
+                ), edits AS (
+                    SELECT r.*,
+                           CASE WHEN RENUMBER = 1 OR STR_ID IS NULL OR
+                               (PFIX IS NOT NULL AND {foreign})
+                           THEN 1 ELSE 0 END AS NEW_ID
+                    FROM ranked r
+                    WHERE RENUMBER = 1 OR PFIX IS NULL OR {foreign}
+                        OR STR_ID IS NULL
+                )
+                SELECT GUID, MERGED,
+                       CASE WHEN NEW_ID = 1 THEN {new_id}
+                       ELSE {concat(prefix, 'STR_ID')} END,
+                       CASE WHEN RENUMBER = 1 THEN 'duplicate'
+                       WHEN PFIX IS NULL AND STR_ID IS NULL THEN 'empty'
+                       ELSE 'incorrect' END
+                FROM edits
+                ORDER BY {by(sequence)}"""
+
+    def _edit_in_database(self):
+        """Has the database work out the edits of the table in a single
+        query, instead of reading its rows into _edit.
+
+        Only the edited rows are sent back. The counts of each kind of
+        edit are kept in the count attribute, like _edit does.
+
+        Returns
+        -------
+        list
+            A list of dicts, where each dict represents a row that has
+            had its FACILITYID changed.
+
+        Raises
+        ------
+        ExecuteError
+            If the database could not run the query
+        """
+
+        self.count = self._new_count()
+        kinds = {"empty": "1 - # Empty IDs",
+                 "incorrect": "2 - # Incorrect IDs",
+                 "duplicate": "3 - # Duplicated IDs"}
+
+        log.debug("Working out the edits in the database...")
+        result = get_backend().execute(self.connection,
+                                       self._assignment_query())
+        edited = list()
+        if result is True:  # no rows needed edits
+            return edited
+        for guid, old_facid, new_facid, kind in result:
+            self.count[kinds[kind]] += 1
+            self.count["4 - Total Edits"] += 1
+            globalid = '{' + str(guid).strip('{}') + '}'
+            edited.append(self._format_edit_row(globalid, old_facid or "",
+                                                new_facid))
+        return edited
+
     def version_essentials(self) -> bool:
         """Tests whether the feature is eligible for versioned edits.
 
@@ -322,111 +629,189 @@ class Edit(Identifier):
         return result
 
     def add_to_aprx(self):
-        """Adds the input layer to a .aprx Map based on the owner of the
-        data. For example, the UTIL.wFitting feature would be added to the
-        "UTIL" map of the designated .aprx file. The file path to the Pro
-        project is set in the config file.
+        """Queues the input layer to be added to a .aprx Map based on the
+        owner of the data. For example, the UTIL.wFitting feature would be
+        added to the "UTIL" map of the designated .aprx file. Queued layers
+        are added in one project session by mgmt.add_layers_to_maps.
         """
 
-        log.debug("Adding the layer to its edit aprx...")
-        aprx = ArcGISProject(config.aprx)
-        user_map = aprx.listMaps(f"{self.owner}")[0]
-        user_map.addDataFromPath(self.aprx_connection)
-        for map_lyr in user_map.listLayers():
-            if self.feature_name in map_lyr.dataSource:
-                layer = map_lyr
-                break
-        aprx.save()
-
-        # Create group layer if it does not exist
-        lyr_realpath = os.path.realpath(config.lyr)
-        lyr_basename = os.path.basename(config.lyr)
-        if self.version_name not in [x.name for x in
-                                     user_map.listLayers()]:
-            # Add to the map
-            user_map.addLayer(LayerFile(lyr_realpath))
-            aprx.save()
-            # Rename the group layer to match the version name
-            layer_name = lyr_basename.strip('.lyrx')
-            for lyr in user_map.listLayers():
-                if lyr.name == layer_name:
-                    lyr.name = self.version_name
-                    break
-
-        # Move the data layer into the group layer
-        group_layer = user_map.listLayers(self.version_name)[0]
-        user_map.addLayerToGroup(group_layer, layer)
-        user_map.removeLayer(layer)
-        aprx.save()
+        log.debug("Queueing the layer for its edit aprx...")
+        Edit.aprx_layers.append({"owner": self.owner,
+                                 "version": self.version_name,
+                                 "path": self.aprx_connection})
+
+    def analyze(self):
+        """Works out every edit the table needs without writing anything,
+        storing the edited rows in the records attribute."""
+        with RunReport.span("edits") as span:
+            if self.server_side:
+                try:
+                    self.records = self._edit_in_database()
+                except ExecuteError:
+                    log.exception((f"Could not work out the edits of "
+                                   f"{self.feature_name} in the database, "
+                                   "reading its rows instead..."))
+                    self.server_side = False
+                    self._read(False)
+            if not self.server_side:
+                self.records = self._edit()
+            span["rows"] = len(self.records)
 
     def edit_version(self, connection_file: str):
 
-        records = self._edit()
+        if self.records is None:
+            self.analyze()
+        records = self.records
         if records:
             log.debug("Writing edited rows to a csv...")
-            csv_file = f'.\\facilityid\\log\\{self.feature_name}_Edits.csv'
-            write_to_csv(csv_file, records)
+            csv_file = os.path.join('.', 'facilityid', 'log',
+                                    f'{self.feature_name}_Edits.csv')
+            write_to_csv(csv_file, records, self.owner)
 
             self.add_edit_metadata()
 
-            guid_facid = {x['GLOBALID']: x["NEWFACILITYID"] for x in records}
             if connection_file:
                 edit_conn = os.path.join(connection_file, *self.tuple_path[1:])
                 try:
-                    # Start an arc edit session
-                    log.debug("Entering an arc edit session...")
-                    editor = Editor(connection_file)
-                    editor.startEditing(False, True)
-                    editor.startOperation()
-
-                    log.debug("Filtering the table to editted records only...")
-                    # Query only the entries that need editing
-                    guids = ", ".join(f"'{x}'" for x in guid_facid.keys())
-                    query = f"GLOBALID IN ({guids})"
-
-                    # Open an update cursor and perform edits
-                    log.debug("Opening an update cursor to perform edits...")
-                    fields = ["GLOBALID", "FACILITYID"]
-                    with UpdateCursor(edit_conn, fields, query) as cursor:
-                        for row in cursor:
-                            row[1] = guid_facid[row[0]]
-                            cursor.updateRow(row)
-
-                    # Stop the edit operation
-                    log.debug("Closing the edit session...")
-                    editor.stopOperation()
-                    editor.stopEditing(True)
-                    del editor
-                    ClearWorkspaceCache_management()
-
+                    self._write_batches(connection_file, edit_conn)
                     log.info(("Successfully performed versioned edits on "
                               f"{self.feature_name}..."))
+                except RuntimeError:
+                    resume = records[self.written]['GLOBALID']
+                    log.exception(("Could not perform versioned edits on "
+                                   f"{self.feature_name}; {self.written} of "
+                                   f"{len(records)} edits were saved; the "
+                                   f"first unsaved edit is GLOBALID "
+                                   f"{resume}..."))
+                if self.written:
                     # Reset the aprx connection to the versioned connection
                     self.aprx_connection = edit_conn
                     self.version_name = os.path.basename(
                         connection_file).strip(".sde")
                     self.add_to_aprx()
-                except RuntimeError:
-                    log.exception(("Could not perform versioned edits "
-                                   f"on {self.feature_name}..."))
-            log.debug("Logging edits to csv file containing all edits ever...")
-            all_edits = r'.\\facilityid\\log\\AllEditsEver.csv'
-            write_to_csv(all_edits, records)
+            log.debug("Logging edits to the history of all edits ever...")
+            AuditLog().append(records)
         else:
             log.info("No edits were necessary...")
 
-    def store_current(self):
-        with shelve.open('.\\facilityid\\log\\previous_run', 'c') as db:
-            db[self.feature_name] = self.__key()
+    def _write_batches(self, connection_file: str, edit_conn: str):
+        """Writes the new FACILITYIDs in batches of config.edit_batch_size
+        rows, each saved in its own edit session.
 
-    def equals_previous(self):
+        Every batch filters the table with its own bounded GLOBALID IN
+        list. A batch that fails is retried config.edit_retries times in
+        a new edit session. Saved batches are counted in self.written, so
+        the next call picks up at the first unsaved edit.
+
+        Parameters
+        ----------
+        connection_file : str
+            The versioned connection to edit in
+        edit_conn : str
+            The path to the feature through the versioned connection
+
+        Raises
+        ------
+        RuntimeError
+            If a batch still fails after every retry
+        """
+
+        backend = get_backend()
+        size = max(1, config.edit_batch_size)
+        total = len(self.records)
+        with RunReport.span("update_cursor", rows=0) as span:
+            while self.written < total:
+                batch = {x['GLOBALID']: x["NEWFACILITYID"] for x in
+                         self.records[self.written:self.written + size]}
+                for attempt in range(config.edit_retries + 1):
+                    try:
+                        self._write_batch(backend, connection_file,
+                                          edit_conn, batch)
+                        break
+                    except RuntimeError:
+                        backend.clear_workspace_cache()
+                        if attempt == config.edit_retries:
+                            raise
+                        log.warning((f"Writing edits {self.written + 1} to "
+                                     f"{self.written + len(batch)} of "
+                                     f"{total} on {self.feature_name} "
+                                     "failed, retrying..."), exc_info=True)
+                        time.sleep(2 ** attempt)
+                self.written += len(batch)
+                span["rows"] += len(batch)
+                log.debug(f"Saved {self.written} of {total} edits...")
+        backend.clear_workspace_cache()
+
+    @staticmethod
+    def _write_batch(backend, connection_file: str, edit_conn: str,
+                     batch: dict):
+        """Writes one batch of new FACILITYIDs, keyed by GLOBALID, in its
+        own edit session and operation."""
+        log.debug(f"Writing a batch of {len(batch)} edits...")
+        editor = backend.editor(connection_file)
+        editor.startEditing(False, True)
+        editor.startOperation()
         try:
-            with shelve.open('.\\facilityid\\log\\previous_run', 'c') as db:
-                previous = db[self.feature_name]
-            if hash(self) == hash(previous):
-                return True
+            # Query only the entries that need editing
+            guids = ", ".join(f"'{x}'" for x in batch)
+            query = f"GLOBALID IN ({guids})"
+            fields = ["GLOBALID", "FACILITYID"]
+            with backend.update_cursor(edit_conn, fields, query) as cursor:
+                for row in cursor:
+                    row[1] = batch[row[0]]
+                    cursor.updateRow(row)
+        except RuntimeError:
+            editor.abortOperation()
+            editor.stopEditing(False)
+            raise
+        editor.stopOperation()
+        editor.stopEditing(True)
+
+    def store_current(self):
+        # Only layers that needed no edits may be skipped by fingerprint or
+        # rescanned incrementally next run; edited layers must be re-read
+        # until the edits are posted
+        edits = self.count["4 - Total Edits"]
+        fingerprint = None if edits else self.read_fingerprint
+        latest = None
+        if not self.server_side:
+            latest = max(filter(None, [self.scan.latest(), self.since]),
+                         default=None)
+        watermark = latest.isoformat() if latest else None
+        with SnapshotStore() as store:
+            if self.server_side:
+                # No rows were read to digest or store
+                store.store(self.feature_name, None, fingerprint)
+            elif self.incremental:
+                store.update(self.feature_name, self._records(), fingerprint,
+                             watermark)
+            elif config.snapshot_rows:
+                # Staged rows are stored along with the edited rows
+                store.promote(self.feature_name, self.__key(), fingerprint,
+                              self._records(), watermark)
             else:
+                store.store(self.feature_name, self.__key(), fingerprint,
+                            None, watermark)
+
+    def equals_previous(self):
+        if self.incremental or self.server_side:
+            # Only changed rows were read, which already differ, or no rows
+            # were read at all
+            return False
+
+        with SnapshotStore() as store:
+            previous = store.digest(self.feature_name)
+            if previous is None:
+                log.debug(f"{self.feature_name} has never been scanned...")
                 return False
-        except KeyError:
-            log.debug(f"{self.feature_name} has never been scanned...")
-            pass  # Gets stored later in the script, no need to store at error
+            if previous == self.__key():
+                return True
+
+            if config.snapshot_rows and store.has_rows(self.feature_name):
+                changes = store.diff(self.feature_name)
+                log.debug((f"{self.feature_name} has "
+                           f"{len(changes['added'])} added, "
+                           f"{len(changes['removed'])} removed, and "
+                           f"{len(changes['changed'])} changed records "
+                           "since the last run..."))
+            return False
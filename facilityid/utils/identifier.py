@@ -1,27 +1,57 @@
 import os
-import re
+import time
+from collections import namedtuple
 
 import facilityid.config as config
-from arcpy import ArcSDESQLExecute, Describe, ExecuteError, ListFields
-from arcpy.da import SearchCursor
+from facilityid.backends import ExecuteError, get_backend
+
+from .report import RunReport
+from .snapshot import SnapshotStore
+from .table import TableScan
 
 # Initialize the logger for this file
 log = config.logging.getLogger(__name__)
 
+# Describe properties used by this package, frozen when a feature is described
+_DESCRIBED = ('datasetType', 'shapeType', 'isVersioned',
+              'editorTrackingEnabled', 'createdAtFieldName',
+              'editedAtFieldName', 'OIDFieldName')
+Described = namedtuple('Described', _DESCRIBED)
+
+# Everything read from the catalog about a feature
+Metadata = namedtuple('Metadata', ['describe', 'fields'])
+
 
 class Identifier:
     """A class intended to deal with the specifics of controlling for
     the quality of Facility IDs. This class inherits the functionality
-    of the arcpy.Describe function.
+    of the backend's describe function, through a frozen copy of the
+    properties this package uses.
+
+    The describe properties and field names of each feature are cached
+    by full path for the run, so an Edit built after an Identifier of the
+    same feature makes no calls to the catalog. Passing the profile of
+    that Identifier along skips the profile query as well.
+
+    Parameters
+    ----------
+    tuple_path : tuple
+        The system path to the feature, as returned by find_in_sde
+    profile : dict, optional
+        The result of the profile query, if it was already run, by
+        default the query is run
     """
 
     inspected_users = list()  # list all users that were inspected
     failures = list()  # list of all layers that failed evaluation
+    grants = dict()  # privileges of the editing user, by connection
+    metadata = dict()  # Metadata of each feature, by full path
 
-    def __init__(self, tuple_path):
+    def __init__(self, tuple_path, profile: dict = None):
         self.tuple_path = tuple_path
         self.full_path = os.path.join(*self.tuple_path)
-        self._desc = Describe(self.full_path)
+        cached = self.metadata.get(self.full_path)
+        self._desc = cached.describe if cached else self._describe()
 
         self.connection = self.tuple_path[0]
         self.database = config.db  # Database platform from config file
@@ -32,17 +62,31 @@ class Identifier:
         self.database_name = self._database_name()
 
         self.is_fc = self.datasetType == 'FeatureClass'
-        self.fields = self._fields()
+        self.fields = list(cached.fields) if cached else self._fields()
         self.has_facilityid = "FACILITYID" in self.fields
         self.has_globalid = "GLOBALID" in self.fields
-        self.prefix = self._prefix()
+        self.profile = self._profile() if profile is None else profile
+        self.prefix = self.profile.get("prefix")
         self.shape = self._shape()
+        if cached is None:
+            self.metadata[self.full_path] = Metadata(self._desc,
+                                                     tuple(self.fields))
 
     def __getattr__(self, item):
-        """Pass any other attribute or method calls through to the
-        underlying Describe object"""
+        """Pass lookups of the describe properties through to their
+        frozen copy"""
+        # Only the properties themselves, not tuple methods such as count,
+        # and not _desc while it is unset, e.g. while unpickling
+        if item not in _DESCRIBED:
+            raise AttributeError(item)
         return getattr(self._desc, item)
 
+    def _describe(self) -> Described:
+        """Describes the feature, keeping only the properties this
+        package uses"""
+        desc = get_backend().describe(self.full_path)
+        return Described(*(getattr(desc, k, None) for k in _DESCRIBED))
+
     def _dataset(self):
         """Return the name of the dataset, if it exists"""
         return self.tuple_path[1] if len(self.tuple_path) == 3 else None
@@ -90,47 +134,114 @@ class Identifier:
     def _shape(self):
         return self.shapeType if self.datasetType == 'FeatureClass' else ''
 
-    def _prefix(self):
-        """Determines the prefix of the feature class based on the most
-        prevalent occurrence."""
-        if self.has_facilityid:
-            # Initialize an executor object for SDE
-            execute_object = ArcSDESQLExecute(self.connection)
-            if self.database == 'ORACLE':
-                query = ("SELECT REGEXP_SUBSTR(FACILITYID, '^[a-zA-Z]+') as "
-                         "PREFIXES, "
-                         "COUNT(*) as PFIXCOUNT "
-                         f"FROM {self.database_name} "
-                         "GROUP BY REGEXP_SUBSTR(FACILITYID, '^[a-zA-Z]+') "
-                         "ORDER BY PFIXCOUNT DESC "
-                         "FETCH FIRST ROW ONLY")
-            else:
-                query = ("SELECT TOP 1 SUBSTRING(FACILITYID, 0, "
-                         "PATINDEX('%[^a-zA-Z]%', FACILITYID)), "
-                         "COUNT(*) "
-                         f"FROM {self.database_name} "
-                         "WHERE SUBSTRING(FACILITYID, 0, "
-                         "PATINDEX('%[^a-zA-Z]%', FACILITYID)) IS NOT NULL "
-                         "GROUP BY SUBSTRING(FACILITYID, 0, "
-                         "PATINDEX('%[^a-zA-Z]%', FACILITYID)) "
-                         "ORDER BY COUNT(*) DESC")
-            try:
-                result = execute_object.execute(query)
-                return result[0][0]
-            except (ExecuteError, AttributeError, TypeError):
-                # AttributeError is raised when the regex expression inside
-                # the SQL statement fails to find the pattern, and a type
-                # other than sting is returned
-                # TypeError is raised when result is boolean
-                return None
+    def _profile_query(self, fingerprint: bool = True) -> str:
+        """Builds the platform's SQL statement for profile, taking the
+        fingerprint of the table as well unless told not to."""
+        table = self.database_name
+        if self.database == 'ORACLE':
+            prefix = "REGEXP_SUBSTR(FACILITYID, '^[a-zA-Z]+')"
+            top, limit, where = "", " FETCH FIRST ROW ONLY", ""
+            present = "FACILITYID IS NOT NULL"  # '' is NULL in Oracle
+            int_id = ("TO_NUMBER(REGEXP_SUBSTR(FACILITYID, "
+                      "'^[^0-9]*([0-9]+)$', 1, 1, NULL, 1))")
+            checksum = "SUM(ORA_HASH(GLOBALID || '|' || FACILITYID))"
+        elif self.database == 'SQLITE':
+            prefix = "REGEXP_SUBSTR(FACILITYID, '^[a-zA-Z]+')"
+            top, limit, where = "", " LIMIT 1", ""
+            present = "FACILITYID IS NOT NULL AND FACILITYID <> ''"
+            int_id = ("CAST(REGEXP_SUBSTR(FACILITYID, "
+                      "'^[^0-9]*([0-9]+)$', 1, 1, NULL, 1) AS INTEGER)")
+            checksum = "SUM(ORA_HASH(GLOBALID || '|' || FACILITYID))"
         else:
+            prefix = ("SUBSTRING(FACILITYID, 0, "
+                      "PATINDEX('%[^a-zA-Z]%', FACILITYID))")
+            top, limit, where = "TOP 1 ", "", f" WHERE {prefix} IS NOT NULL"
+            present = "FACILITYID IS NOT NULL AND FACILITYID <> ''"
+            int_id = ("TRY_CAST(SUBSTRING(FACILITYID, "
+                      "PATINDEX('%[0-9]%', FACILITYID), 255) AS BIGINT)")
+            checksum = "CHECKSUM_AGG(CHECKSUM(GLOBALID, FACILITYID))"
+
+        columns = [
+            # The most prevalent prefix
+            f"(SELECT {top}{prefix} FROM {table}{where} "
+            f"GROUP BY {prefix} ORDER BY COUNT(*) DESC{limit})",
+            "COUNT(*)",
+            f"SUM(CASE WHEN {present} THEN 0 ELSE 1 END)",
+            # Rows whose FACILITYID is shared with another row
+            "(SELECT COALESCE(SUM(N), 0) FROM "
+            f"(SELECT COUNT(*) AS N FROM {table} WHERE {present} "
+            "GROUP BY FACILITYID HAVING COUNT(*) > 1) dups)",
+            f"MAX(CASE WHEN {present} THEN {int_id} END)"]
+        if fingerprint and self.has_globalid and self.editorTrackingEnabled:
+            columns += [f"MAX({self.editedAtFieldName})",
+                        f"MAX({self.OIDFieldName})", checksum]
+
+        return f"SELECT {', '.join(columns)} FROM {table}"
+
+    def _profile(self) -> dict:
+        """Profiles the FACILITYIDs of the table in a single query. If
+        the query fails, it is run again without the fingerprint columns,
+        so the layer is still analyzed, as a changed layer.
+
+        Returns
+        -------
+        dict
+            "prefix" is the most prevalent prefix, "count" the number of
+            rows, "empty" the number of rows without a FACILITYID,
+            "duplicates" the number of rows whose FACILITYID is shared
+            with another row, "max_id" the largest numeric ID, and
+            "fingerprint" the fingerprint of the table, if one could be
+            taken. Empty if the table has no FACILITYID field or the
+            query failed.
+        """
+
+        if not self.has_facilityid:
+            return dict()
+
+        row = self._profile_row(fingerprint=True)
+        if row is None and self.has_globalid and self.editorTrackingEnabled:
+            # Profile the layer without its fingerprint, so that it is
+            # treated as changed rather than skipped
+            log.warning((f"Could not take the fingerprint of "
+                         f"{self.feature_name}, profiling it without..."))
+            row = self._profile_row(fingerprint=False)
+        if row is None:
+            log.warning(f"Could not profile {self.feature_name}...")
+            return dict()
+
+        prefix, count, empty, duplicates, max_id = row[:5]
+        profile = {"prefix": prefix if isinstance(prefix, str) else None,
+                   "count": int(count or 0),
+                   "empty": int(empty or 0),
+                   "duplicates": int(duplicates or 0),
+                   "max_id": int(max_id) if max_id is not None else None,
+                   "fingerprint": None}
+        if len(row) > 5:
+            profile["fingerprint"] = tuple(str(x) for x in
+                                           [count, *row[5:]])
+        return profile
+
+    def _profile_row(self, fingerprint: bool):
+        """Runs the profile query, returning its row, or None if the
+        query failed."""
+        try:
+            with RunReport.span("profile"):
+                result = get_backend().execute(
+                    self.connection, self._profile_query(fingerprint))
+            return result[0]
+        except (ExecuteError, AttributeError, TypeError, IndexError):
+            # TypeError is raised when result is boolean, and arcpy raises
+            # AttributeError for some failed queries
+            log.debug(f"The profile query of {self.feature_name} failed...",
+                      exc_info=True)
             return None
 
     def _fields(self):
         """Determines the field names in the table
         """
         try:
-            result = [f.name.upper() for f in ListFields(self.full_path)]
+            result = [f.name.upper() for f in
+                      get_backend().list_fields(self.full_path)]
         # If a feature is a network dataset or topology, no fields exist
         # and a RuntimeError is raised
         except RuntimeError:
@@ -140,14 +251,41 @@ class Identifier:
     def record_count(self) -> int:
         """Determines if there are any records in the feature class to
         analyze."""
-        execute_object = ArcSDESQLExecute(self.connection)
-        try:
-            query = f"""SELECT COUNT(*) FROM {self.database_name}"""
-            result = execute_object.execute(query)
-            return int(result)
-        except ExecuteError:
-            # TODO: Add info logging
-            return 0
+        return self.profile.get("count", 0)
+
+    def fingerprint(self):
+        """Summarizes the state of the table, so that unchanged layers
+        can be skipped before any rows are read.
+
+        The fingerprint is taken by the profile query, and is made up of
+        the row count, the latest edit date, the largest ObjectID, and a
+        server-side checksum of every GLOBALID and FACILITYID pair.
+
+        Returns
+        -------
+        tuple
+            The fingerprint as strings, or None if it could not be taken
+        """
+
+        return self.profile.get("fingerprint")
+
+    def unchanged(self) -> bool:
+        """Compares the fingerprint of the table to the one stored at the
+        end of the previous run.
+
+        Returns
+        -------
+        bool
+            Whether the table is known to be unchanged since the
+            previous run
+        """
+
+        current = self.fingerprint()
+        if current is None:
+            return False
+        with SnapshotStore() as store:
+            previous = store.fingerprint(self.feature_name)
+        return current == previous
 
     def essentials(self) -> bool:
         """Tests whether the feature is eligible for a Facility ID scan.
@@ -193,9 +331,19 @@ class Identifier:
 
         return result
 
-    def duplicates(self):
-        # Initialize an executor object for SDE
-        execute_object = ArcSDESQLExecute(self.connection)
+    def duplicates(self) -> set:
+        """Finds the GLOBALIDs of rows whose FACILITYID is shared with at
+        least one other row.
+
+        Returns
+        -------
+        set
+            GLOBALIDs of rows with duplicated FACILITYIDs
+        """
+
+        if self.profile and not self.profile["duplicates"]:
+            return set()
+
         query = f"""SELECT CAST(a.GLOBALID as NVARCHAR(40)),
                            a.FACILITYID
                     FROM {self.database_name} a
@@ -208,104 +356,163 @@ class Identifier:
                     ON dups.FACILITYID = a.FACILITYID"""
 
         try:
-            result = execute_object.execute(query)
-            globalids = ['{' + r[0] + '}' for r in result if r[1]]
+            with RunReport.span("duplicates") as span:
+                result = get_backend().execute(self.connection, query)
+                globalids = {'{' + r[0].strip('{}') + '}' for r in result
+                             if r[1]}
+                span["rows"] = len(globalids)
             return globalids
         except (ExecuteError, TypeError):
-            return list()
-
-    def rows(self):
-        """Extracts a feature's table for analysis
-
-        Extracts FACILITYID, GLOBALID, edit metadata, and SHAPE fields
-        of a feature class or table. Edit metadata fields are
-        dynamically assigned based on attributes of a fc's describe obj.
-        FACILITYIDs are further broken into {"prefix": x, "str_id": y,
-        "int_id": z}.
+            return set()
+
+    def rows(self, where_clause: str = None, scan: TableScan = None,
+             sink=None):
+        """Streams a feature's table through a single pass
+
+        Reads FACILITYID, GLOBALID, and edit date fields of a feature
+        class or table through a TableScan, which keeps the rows it is
+        told to in a column-oriented RowTable and summarizes the rest.
+        Edit date fields are dynamically assigned based on attributes of
+        a fc's describe obj. FACILITYIDs are broken into a prefix, an ID
+        as a string, and an ID as an integer. Geometry is not read; see
+        shape_measures.
+
+        Parameters
+        ----------
+        where_clause : str, optional
+            Limits the rows that are extracted, by default None
+        scan : TableScan, optional
+            A scan to add the rows to, by default a new TableScan that
+            keeps every row
+        sink : callable, optional
+            Called with an iterable of the (GLOBALID, FACILITYID, int ID)
+            of every row read, such as SnapshotStore.stage, by default
+            None
 
         Returns
         -------
-        tuple
-            rows represented as dicitionaries
+        TableScan
+            The scan of the table's rows
         """
 
-        edit_fields = [self.creatorFieldName,
-                       self.createdAtFieldName,
-                       self.editorFieldName,
-                       self.editedAtFieldName]
-        fields = ['GLOBALID', 'FACILITYID'] + edit_fields
-        if self.datasetType == 'FeatureClass':
-            fields.append('SHAPE@')
-
-        row_list = []
-        with SearchCursor(self.full_path, fields) as search:
-            for row in search:
-                row_list.append({fields[i]: row[i]
-                                 for i in range(len(fields))})
-
-        # Transform the output of the FACILITYID field by breaking apart
-        # the value into prefix, id as string, and id as integer
-        for row in row_list:
-            if row["FACILITYID"]:
-                f_id = str(row["FACILITYID"])
-                # Use regex to find the prefix of the row's FACILITYID
-                try:
-                    pfix = re.findall(r"^\D+", f_id)[0]
-                # re.findall returns [] if the pattern doesn't exist
-                except IndexError:
-                    pfix = ""
-
-                # Define the ID as everything following the prefix
-                id_str = f_id[len(pfix):]
-
-                # Convert the string ID to integer
-                try:
-                    id_int = int(id_str)
-                # if id_str has non-numeric chars, assume no ID
-                except ValueError:
-                    id_str = ""
-                    id_int = None
-
-                row["FACILITYID"] = {"prefix": pfix,
-                                     "str_id": id_str,
-                                     "int_id": id_int}
+        fields = ['GLOBALID', 'FACILITYID',
+                  self.createdAtFieldName, self.editedAtFieldName]
+
+        scan = TableScan() if scan is None else scan
+        with RunReport.span("rows", rows=-scan.count) as span, \
+                get_backend().search_cursor(self.full_path, fields,
+                                            where_clause) as search:
+            if sink is None:
+                scan.read(search)
             else:
-                row["FACILITYID"] = {"prefix": "",
-                                     "str_id": "",
-                                     "int_id": None}
+                sink(scan.consume(search))
+            span["rows"] += scan.count
 
-        return tuple(row_list)
+        return scan
 
-    def can_gisscr_edit(self, connection) -> bool:
-        """Reveals if the feature class is editable through the GISSCR connection.
+    def shape_measures(self, globalids, chunk: int = 1000) -> dict:
+        """Reads the area of polygons or the length of polylines for
+        specific rows, without building their geometries.
 
-        :param connection: File path to an SDE connection with the GISSCR user
-        :return: Boolean
+        Parameters
+        ----------
+        globalids : iterable
+            GLOBALIDs of the rows to measure
+        chunk : int, optional
+            How many GLOBALIDs to put in each where clause, by default
+            1000, the limit of an Oracle IN list
+
+        Returns
+        -------
+        dict
+            The area or length of each row keyed by GLOBALID, or empty if
+            the layer is not a polygon or polyline feature class
         """
 
-        if self.database == 'ORACLE':
-            query = f"""SELECT PRIVILEGE
-                        FROM ALL_TAB_PRIVS
-                        WHERE TABLE_NAME = '{self.name.upper()}'
-                        AND TABLE_SCHEMA = '{self.owner.upper()}'"""
+        token = {'Polygon': 'SHAPE@AREA',
+                 'Polyline': 'SHAPE@LENGTH'}.get(self.shape)
+        measures = dict()
+        if token is None:
+            return measures
+
+        globalids = list(dict.fromkeys(globalids))
+        with RunReport.span("shape_measures", rows=len(globalids)):
+            for start in range(0, len(globalids), chunk):
+                guids = ", ".join(f"'{x}'" for x in
+                                  globalids[start:start + chunk])
+                with get_backend().search_cursor(
+                        self.full_path, ['GLOBALID', token],
+                        f"GLOBALID IN ({guids})") as search:
+                    measures.update((g, m) for g, m in search)
+        return measures
+
+    @classmethod
+    def _grants(cls, connection: str) -> dict:
+        """Loads every table privilege granted to the editing user, to
+        its roles, or to PUBLIC in a single query, reusing the result for
+        config.grants_ttl seconds. A query that fails is not run again
+        until then either.
+
+        Parameters
+        ----------
+        connection : str
+            File path to an SDE connection with the GISSCR user
+
+        Returns
+        -------
+        dict
+            Sets of privileges keyed by (OWNER, TABLE), in upper case
+        """
+
+        loaded_at, grants = cls.grants.get(connection, (None, None))
+        if loaded_at is not None and (
+                time.monotonic() - loaded_at < config.grants_ttl):
+            return grants
+
+        user = config.db_params["username"]
+        if config.db in ('ORACLE', 'SQLITE'):
+            query = ("SELECT TABLE_SCHEMA, TABLE_NAME, PRIVILEGE "
+                     "FROM ALL_TAB_PRIVS "
+                     f"WHERE GRANTEE IN ('{user.upper()}', 'PUBLIC') "
+                     "OR GRANTEE IN (SELECT ROLE FROM SESSION_ROLES)")
         else:
-            query = ("SELECT PERMISSION_NAME AS PermissionGranted, "
-                     "OBJECT_SCHEMA_NAME(major_id) AS Owner, "
-                     "OBJECT_NAME(major_id) AS TableName "
+            query = ("SELECT OBJECT_SCHEMA_NAME(major_id) AS Owner, "
+                     "OBJECT_NAME(major_id) AS TableName, "
+                     "PERMISSION_NAME AS PermissionGranted "
                      "FROM sys.database_permissions AS DP "
                      "INNER JOIN sys.database_principals AS P ON "
                      "P.principal_id = DP.grantee_principal_id "
-                     "WHERE P.name='gisscr' "
-                     f"AND OBJECT_NAME(major_id) LIKE '{self.name}%'")
-        execute_object = ArcSDESQLExecute(connection)
-        result = execute_object.execute(query)
-        editable = False  # Assume GISSCR user cannot edit by default
+                     "WHERE DP.class = 1 AND "
+                     f"(P.name IN ('{user}', 'public') OR P.principal_id IN "
+                     "(SELECT RM.role_principal_id "
+                     "FROM sys.database_role_members AS RM "
+                     "INNER JOIN sys.database_principals AS M ON "
+                     "M.principal_id = RM.member_principal_id "
+                     f"WHERE M.name = '{user}'))")
+        grants = dict()
+        try:
+            result = get_backend().execute(connection, query)
+        except ExecuteError:
+            log.exception(f"Could not load the privileges of {user}...")
+            cls.grants[connection] = (time.monotonic(), grants)
+            return grants
+
         try:
-            for row in result:
-                if row[0] in ("UPDATE", "INSERT", "DELETE"):
-                    editable = True
-                    break
+            for owner, table, privilege in result:
+                key = (str(owner).upper(), str(table).upper())
+                grants.setdefault(key, set()).add(privilege)
         except TypeError:
-            pass  # result = True when the table cannot be accessed by GISSCR
+            pass  # result = True when no privileges have been granted
+        cls.grants[connection] = (time.monotonic(), grants)
+        return grants
+
+    def can_gisscr_edit(self, connection) -> bool:
+        """Reveals if the feature class is editable through the GISSCR connection.
+
+        :param connection: File path to an SDE connection with the GISSCR user
+        :return: Boolean
+        """
 
-        return editable
+        privileges = self._grants(connection).get(
+            (self.owner.upper(), self.name.upper()), set())
+        return not privileges.isdisjoint({"UPDATE", "INSERT", "DELETE"})
@@ -1,29 +1,113 @@
-import csv
+import json
 import os
-import smtplib
-from email import encoders
-from email.mime.base import MIMEBase
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from cryptography.fernet import Fernet
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import facilityid.config as config
-from arcpy import (CreateDatabaseConnection_management,
-                   CreateVersion_management, DeleteVersion_management,
-                   ExecuteError, ListVersions, ReconcileVersions_management)
-from arcpy.da import Walk
-from arcpy.mp import ArcGISProject
+from facilityid.backends import ExecuteError, get_backend
+
+from .audit import CsvLog
+from .report import RunReport
+from .snapshot import SnapshotStore
 
 # Initialize the logger for this file
 log = config.logging.getLogger(__name__)
 
 
+def catalog_signature(sde_path: str):
+    """Summarizes the catalog of a geodatabase, so that changes to which
+    feature classes exist, or where, can be noticed without walking it.
+
+    Parameters
+    ----------
+    sde_path : str
+        The file path to the sde connection file
+
+    Returns
+    -------
+    str
+        The number of catalog items and a checksum of their paths, or
+        None if the catalog could not be read
+    """
+
+    if config.db == 'ORACLE':
+        query = "SELECT COUNT(*), SUM(ORA_HASH(PATH)) FROM SDE.GDB_ITEMS"
+    elif config.db == 'SQLITE':
+        query = ("SELECT COUNT(*), SUM(ORA_HASH(COALESCE(DATASET, '') || "
+                 "'\\' || NAME)) FROM GDB_ITEMS")
+    else:
+        query = ("SELECT COUNT(*), CHECKSUM_AGG(CHECKSUM(Path)) "
+                 "FROM sde.GDB_ITEMS")
+    try:
+        result = get_backend().execute(sde_path, query)
+    except ExecuteError:
+        log.exception("Could not read the signature of the catalog...")
+        return None
+    return json.dumps(result)
+
+
+def catalog_inventory(sde_path: str) -> list:
+    """Lists every feature class within the sde connection provided.
+
+    The catalog is only walked when its signature differs from the one
+    stored with the inventory of a previous run, or of an earlier call.
+
+    Parameters
+    ----------
+    sde_path : str
+        The file path to the sde connection file
+
+    Returns
+    -------
+    list
+        Tuples representing (sde, dataset, feature) or (sde, feature)
+    """
+
+    signature = catalog_signature(sde_path)
+    with SnapshotStore() as store:
+        items = None
+        if signature is not None:
+            items = store.inventory(sde_path, signature)
+        if items is not None:
+            log.debug("Reusing the stored inventory of the catalog...")
+            return items
+
+        log.debug("Walking the catalog...")
+        with RunReport.span("walk_catalog"):
+            walker = get_backend().walk(sde_path,
+                                        ['FeatureDataset', 'FeatureClass'])
+            items = list()
+            for directory, _, files in walker:
+                for f in files:
+                    if directory.endswith(".sde"):
+                        items.append((directory, f))
+                    else:
+                        root = os.path.dirname(directory)
+                        dataset = os.path.basename(directory)
+                        items.append((root, dataset, f))
+            del walker
+
+        if signature is not None:
+            store.store_inventory(sde_path, signature, items)
+    return items
+
+
+def _matcher(patterns: list):
+    """Compiles keywords into one case-insensitive regular expression that
+    finds any of them, or None if there are no keywords."""
+    if not patterns:
+        return None
+    return re.compile("|".join(map(re.escape, patterns)), re.IGNORECASE)
+
+
 def find_in_sde(sde_path: str, includes: list = [], excludes: list = []):
     """Finds all possible feature classes within the sde connection
     provided,  based on lists of pattern matches.
 
    If no patterns are provided, the function will return all feature
-   classes in the sde_path.
+   classes in the sde_path. The feature classes are listed by
+   catalog_inventory, so every call shares a single walk of the catalog.
 
     Parameters
     ----------
@@ -42,27 +126,19 @@ def find_in_sde(sde_path: str, includes: list = [], excludes: list = []):
         Tuples representing (sde, dataset, feature) or (sde, feature)
     """
 
-    walker = Walk(sde_path, ['FeatureDataset', 'FeatureClass'])
-    items = list()
-    for directory, _, files in walker:
-        for f in files:
-            if directory.endswith(".sde"):
-                items.append((directory, f))
-            else:
-                root = os.path.dirname(directory)
-                dataset = os.path.basename(directory)
-                items.append((root, dataset, f))
-    del walker
-
     # Make sure that the output includes or excludes the keywords provided at
     # function call
     assert set(includes).isdisjoint(set(excludes))
-    if includes:
-        items = [i for i in items if any(
-            arg.lower() in os.path.join(*i).lower() for arg in includes)]
-    if excludes:
-        items = [i for i in items if not any(
-            arg.lower() in os.path.join(*i).lower() for arg in excludes)]
+    include = _matcher(includes)
+    exclude = _matcher(excludes)
+    items = list()
+    for i in catalog_inventory(sde_path):
+        path = os.path.join(*i)
+        if include and not include.search(path):
+            continue
+        if exclude and exclude.search(path):
+            continue
+        items.append(i)
 
     items.sort(key=lambda x: x[-1])
     return items
@@ -84,7 +160,9 @@ def decrypt(key, token):
         Decrypted plain text
     """
 
-    decrypted = ""
+    from cryptography.fernet import Fernet
+
+    decrypted = b""
     try:
         f = Fernet(key)
         decrypted = f.decrypt(bytes(token, 'utf-8'))
@@ -110,7 +188,7 @@ def versioned_connection(parent: str, version_name: str):
         A file path to the proper connection file
     """
 
-    conn_file = os.path.join(".\\.esri", f"{version_name}.sde")
+    conn_file = os.path.join(".", ".esri", f"{version_name}.sde")
     full_conn_path = os.path.realpath(conn_file)
 
     if os.path.exists(conn_file):
@@ -126,18 +204,19 @@ def versioned_connection(parent: str, version_name: str):
                    "parent_version": parent,
                    "version_name": version_name,
                    "access_permission": "PRIVATE"}
-        CreateVersion_management(**version)
+        get_backend().create_version(**version)
 
         # Create the database connection file
         key = config.db_creds["key"]
         token = config.db_creds["token"]
         log.debug(f"Creating a versioned db connection at {conn_file}...")
-        connect = {"out_folder_path": ".\\.esri",
+        connect = {"out_folder_path": os.path.join(".", ".esri"),
                    "out_name": f"{version_name}.sde",
                    "version": full_version_name,
                    "password": decrypt(key, token),
                    **config.db_params}
-        CreateDatabaseConnection_management(**connect)
+        get_backend().create_connection(**connect)
+        Artifacts.record(conn_file)
 
     return full_conn_path
 
@@ -170,7 +249,7 @@ def reconcile_post(parent: str, version: str) -> dict:
 
     try:
         log.info(f"Posting edits in {version} to {parent}...")
-        ReconcileVersions_management(**post_kwargs)
+        get_backend().reconcile_versions(**post_kwargs)
         return True
     except ExecuteError:
         log.exception("Could not reconcile and post...")
@@ -186,17 +265,18 @@ def delete_facilityid_versions(connection: str) -> None:
         location of the sde connection file
     """
 
-    del_versions = [v for v in ListVersions(
+    backend = get_backend()
+    del_versions = [v for v in backend.list_versions(
         connection) if "FACILITYID" in v.upper()]
     for d in del_versions:
-        DeleteVersion_management(connection, d)
+        backend.delete_version(connection, d)
 
 
 def clear_map_layers():
     """Removes layers from maps within the ArcGIS Pro project template.
     Does not remove the layers if they are group layers or basemaps.
     """
-    aprx = ArcGISProject(config.aprx)
+    aprx = get_backend().project(config.aprx)
     for map_ in aprx.listMaps():
         del_layers = [x for x in map_.listLayers(
         ) if not x.isGroupLayer and not x.isBasemapLayer]
@@ -206,7 +286,52 @@ def clear_map_layers():
     aprx.save()
 
 
-def save_layer_file(user: str, lyr_file_name: str):
+def add_layers_to_maps(layers: list):
+    """Adds edited layers to the maps of the ArcGIS Pro project in a single
+    project session. Each layer is moved into a group layer named after
+    its version, which is created from the template layer file when the
+    map doesn't have one yet.
+
+    Parameters
+    ----------
+    layers : list
+        Dicts with the "owner" whose map gets the layer, the "version"
+        name of its group layer, and the "path" to its data, in the order
+        they should be added
+    """
+
+    if not layers:
+        return
+    start = time.perf_counter()
+    backend = get_backend()
+    aprx = backend.project(config.aprx)
+    lyr_realpath = os.path.realpath(config.lyr)
+    layer_name = os.path.basename(config.lyr).strip('.lyrx')
+    owners = list(dict.fromkeys(x["owner"] for x in layers))
+    for owner in owners:
+        user_map = aprx.listMaps(f"{owner}")[0]
+        groups = {x.name: x for x in user_map.listLayers() if x.isGroupLayer}
+        for layer in (x for x in layers if x["owner"] == owner):
+            # Create group layer if it does not exist
+            if layer["version"] not in groups:
+                user_map.addLayer(backend.layer_file(lyr_realpath))
+                # Rename the group layer to match the version name
+                group_layer = user_map.listLayers(layer_name)[0]
+                group_layer.name = layer["version"]
+                groups[layer["version"]] = group_layer
+
+            # Move the data layer into the group layer
+            data_layer = user_map.addDataFromPath(layer["path"])
+            user_map.addLayerToGroup(groups[layer["version"]], data_layer)
+            user_map.removeLayer(data_layer)
+    added = time.perf_counter()
+    aprx.save()
+    log.debug((f"Added {len(layers)} layers to {len(owners)} maps in "
+               f"{added - start:.2f}s and saved the project in "
+               f"{time.perf_counter() - added:.2f}s..."))
+
+
+def save_layer_file(user: str, lyr_file_name: str, aprx=None):
     """Saves a layer file based on the user and version name.
 
     Parameters
@@ -215,16 +340,23 @@ def save_layer_file(user: str, lyr_file_name: str):
         The user whose map contains the specified layer file
     lyr_file_name : str
         The name of the layer file that needs to be saved
+    aprx : ArcGISProject, optional
+        The project holding the user's map, by default the project in
+        the config file is opened
     """
 
-    aprx = ArcGISProject(config.aprx)
+    if aprx is None:
+        aprx = get_backend().project(config.aprx)
     user_map = aprx.listMaps(user)[0]
     lyr = user_map.listLayers(lyr_file_name)[0]
-    lyr.saveACopy(f".\\.esri\\{lyr_file_name}.lyrx")
+    lyr_file = os.path.join(".", ".esri", f"{lyr_file_name}.lyrx")
+    lyr.saveACopy(lyr_file)
+    Artifacts.record(lyr_file, user)
 
 
 def post_and_save_layer_files(user: str, version_info: dict):
 
+    aprx = None
     for version, info in version_info.items():
         if user in config.post_edits:
             succeeded = reconcile_post(info["parent"], version)
@@ -233,12 +365,93 @@ def post_and_save_layer_files(user: str, version_info: dict):
         else:
             if user in config.versioned_edits or not info["posted"]:
                 log.info(f"Saving layer file for {version}...")
-                save_layer_file(user, version)
+                if aprx is None:
+                    aprx = get_backend().project(config.aprx)
+                save_layer_file(user, version, aprx)
 
 
-def write_to_csv(csv_file: str, rows: list):
+class Artifacts:
+    """Keeps track of the files a run writes, by owner and file type, so
+    that they can be looked up and deleted without walking the working
+    directory.
+    """
+
+    # The only folders that connection, layer, and csv files are written to
+    folders = {".sde": os.path.join(".", ".esri"),
+               ".lyrx": os.path.join(".", ".esri"),
+               ".csv": os.path.join(".", "facilityid", "log")}
+    written = dict()  # Paths written during this run, by (owner, type)
+
+    @classmethod
+    def record(cls, path: str, owner: str = None):
+        """Records a file written during this run.
+
+        Parameters
+        ----------
+        path : str
+            The system path to the file
+        owner : str, optional
+            The data owner the file was written for, by default None
+        """
+
+        key = (owner, os.path.splitext(path)[1])
+        paths = cls.written.setdefault(key, list())
+        if path not in paths:
+            paths.append(path)
+
+    @classmethod
+    def find(cls, owner: str, extension: str) -> list:
+        """Lists the files of a type written for an owner during this run.
+
+        Parameters
+        ----------
+        owner : str
+            The data owner the files were written for
+        extension : str
+            The file type, e.g. ".csv"
+
+        Returns
+        -------
+        list
+            System paths to the files, in the order they were written
+        """
+
+        return list(cls.written.get((owner, extension), list()))
+
+    @classmethod
+    def delete(cls, extensions: list, exclude: list = []):
+        """Deletes files of the given types from the folders they are
+        written to, along with any written during this run.
+
+        Parameters
+        ----------
+        extensions : list
+            File types to delete, e.g. [".sde", ".csv"]
+        exclude : list
+            If any keyword in this parameter appears in the file name, it
+            will not be deleted
+        """
+
+        for ext in extensions:
+            paths = [p for (_, e), written in cls.written.items() if e == ext
+                     for p in written]
+            folder = cls.folders[ext]
+            if os.path.isdir(folder):
+                paths += [x.path for x in os.scandir(folder)
+                          if x.is_file() and x.name.endswith(ext)]
+            for path in dict.fromkeys(paths):
+                if any(arg in os.path.basename(path) for arg in exclude):
+                    continue
+                if os.path.exists(path):
+                    os.remove(path)
+            for key in [k for k in cls.written if k[1] == ext]:
+                del cls.written[key]
+
+
+def write_to_csv(csv_file: str, rows: list, owner: str = None):
     """Write dict-like rows to a csv file. Append if the file exists,
-    create a new file if it does not already exist.
+    create a new file if it does not already exist. The file stays open
+    until CsvLog.close is called.
 
     Parameters
     ----------
@@ -246,52 +459,13 @@ def write_to_csv(csv_file: str, rows: list):
         File path to the csv file
     rows : list
         Each item in the list is a dictionary representing a row
+    owner : str, optional
+        The data owner to record the file for, so that it can be
+        attached to their email, by default the file isn't recorded
     """
-    fields = list(rows[0].keys())
-    if not os.path.exists(csv_file):
-        with open(csv_file, 'w', newline='') as c:
-            writer = csv.DictWriter(c, fieldnames=fields)
-            writer.writeheader()
-    with open(csv_file, 'a', newline='') as c:
-        writer = csv.DictWriter(c, fieldnames=fields)
-        for row in rows:
-            writer.writerow(row)
-
-
-def list_files(include: list, exclude: list = [], delete: bool = False):
-    """Lists files from the package's root directory based on the
-    filters provided in the positional args.
-
-    Parameters
-    ----------
-    include : list
-        If any string keyword in this parameter appears in the file
-        name, it will be added to the list
-    exclude : list
-        If any keyword in this parameter appears in the file name, it
-        will not be added to the list
-    delete : bool
-        A trigger to delete the files listed
-
-    Returns:
-    --------
-    list
-        A list of system paths to the files that match the spec'd
-        criteria. If the delete flag is raised, an empty list is
-        returned
-    """
-    listed = list()
-    for root, _, files in os.walk(os.getcwd()):
-        for f in files:
-            if any(arg in f for arg in include) and all(
-                   arg not in f for arg in exclude):
-                listed.append(os.path.join(root, f))
-
-    if delete:
-        for d in listed:
-            os.remove(d)
-    else:
-        return listed
+    CsvLog.write(csv_file, rows)
+    if owner:
+        Artifacts.record(csv_file, owner)
 
 
 def create_html_table(data: list) -> str:
@@ -343,7 +517,8 @@ def email_matter(user: str, edited_users: list, posted_successfully: list,
     posted_successfully : list
         A list of bools for whether all versions posted successfully
     attach_list : list
-        List of all files that might need to be emailed
+        All files written for the user during the run, which might need
+        to be emailed
     failed_inspection : list
         A list of dicts, derived from the Identifier class
     failed_versioning : list
@@ -377,13 +552,12 @@ def email_matter(user: str, edited_users: list, posted_successfully: list,
                            "Any versions that were not posted automatically "
                            "are attached as one or more layer files. Open "
                            "those layer files and reconcile/post the changes.")
-                attach += [x for x in attach_list if user in x
-                           and '.lyrx' in x]
+                attach += [x for x in attach_list if x.endswith('.lyrx')]
         else:
             insert += ("You have not authorized versioned edits, but your "
                        "data had irregular Facility IDs. Use the attached csv "
                        "files to edit your data.")
-            attach = [x for x in attach_list if user in x and '.csv' in x]
+            attach = [x for x in attach_list if x.endswith('.csv')]
 
     if counts:
         user_counts = [x for x in counts if user in x["0 - Feature"]]
@@ -411,7 +585,7 @@ def email_matter(user: str, edited_users: list, posted_successfully: list,
                        "version. Make the changes below to fix this issue."
                        "<br><br>")
             insert += create_html_table(user_fail)
-            attach += [x for x in attach_list if user in x and '.csv' in x]
+            attach += [x for x in attach_list if x.endswith('.csv')]
 
     body = f"""\
                 <html>
@@ -448,38 +622,182 @@ def email_matter(user: str, edited_users: list, posted_successfully: list,
     return body, attach
 
 
-def send_email(body: str, recipients: list, *attachments):
-    # from/to addresses
-    sender = 'noreply@bouldercolorado.gov'
-    password = decrypt("key", "token")
+def build_email(body: str, recipients: list, *attachments):
+    """Builds an email from the sender in the config file.
+
+    Parameters
+    ----------
+    body : str
+        The HTML body of the email
+    recipients : list
+        Email addresses to send the email to
+    attachments : str
+        System paths to files attached to the email
+
+    Returns
+    -------
+    MIMEMultipart
+        The email, ready to send
+    """
+
+    from email import encoders
+    from email.mime.base import MIMEBase
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
 
     # message
     msg = MIMEMultipart('alternative')
-    msg['From'] = sender
+    msg['From'] = config.smtp["sender"]
     msg['To'] = "; ".join(recipients)
     msg['Subject'] = "\N{High Voltage Sign} Facility ID \N{High Voltage Sign}"
 
-    if attachments:
-        for item in attachments:
-            a = open(item, 'rb')
-            part = MIMEBase('application', 'octet-stream')
+    for item in attachments:
+        part = MIMEBase('application', 'octet-stream')
+        with open(item, 'rb') as a:
             part.set_payload(a.read())
-            encoders.encode_base64(part)
-            part.add_header('Content-Disposition', 'attachment',
-                            filename=item.split(os.sep).pop())
-            msg.attach(part)
+        encoders.encode_base64(part)
+        part.add_header('Content-Disposition', 'attachment',
+                        filename=os.path.basename(item))
+        msg.attach(part)
 
     msg.attach(MIMEText(body, 'html'))
+    return msg
+
+
+class Mailer:
+    """A single SMTP session that sends every email of a run.
+
+    The session is opened on the first email and kept open until the
+    mailer is closed. An email that fails for a temporary reason is
+    retried on a new session, waiting longer after each failure, as set
+    in the config file.
+
+    Parameters
+    ----------
+    host : str, optional
+        The SMTP server, by default the one in the config file
+    port : int, optional
+        The port of the SMTP server, by default the one in the config
+        file
+    """
+
+    def __init__(self, host: str = None, port: int = None):
+        self.host = host or config.smtp["host"]
+        self.port = port or config.smtp["port"]
+        self.sender = config.smtp["sender"]
+        self.server = None
+        self.connections = 0  # How many sessions have been opened
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connect(self):
+        import smtplib
+
+        # create SMTP object
+        self.server = smtplib.SMTP(host=self.host, port=self.port)
+        self.connections += 1
+        self.server.ehlo()
+        if config.smtp["starttls"] and self.server.has_extn("starttls"):
+            self.server.starttls()
+            self.server.ehlo()
+
+        # log in
+        if self.server.has_extn("auth"):
+            self.server.login(self.sender, decrypt("key", "token"))
+
+    def close(self):
+        """Ends the SMTP session, if one is open."""
+        import smtplib
+
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except smtplib.SMTPException:
+                self.server.close()
+            self.server = None
+
+    def send(self, msg, recipients: list):
+        """Sends an email, retrying temporary failures.
+
+        Parameters
+        ----------
+        msg : MIMEMultipart
+            The email to send
+        recipients : list
+            Email addresses to send the email to
+
+        Raises
+        ------
+        smtplib.SMTPException
+            If the email was refused, or still fails after every retry
+        """
+
+        import smtplib
+
+        retries = config.smtp["retries"]
+        for attempt in range(retries + 1):
+            try:
+                if self.server is None:
+                    self._connect()
+                self.server.send_message(msg, self.sender, recipients)
+                return
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError,
+                    smtplib.SMTPResponseException,
+                    smtplib.SMTPRecipientsRefused, OSError) as e:
+                # Only retry disconnects and temporary (4xx) replies
+                code = getattr(e, "smtp_code", 400)
+                if isinstance(e, smtplib.SMTPRecipientsRefused):
+                    # Every recipient was refused, each with its own reply
+                    code = max(c for c, _ in e.recipients.values())
+                if attempt == retries or not 400 <= code < 500:
+                    raise
+                if self.server is not None:
+                    self.server.close()
+                self.server = None
+                wait = config.smtp["retry_wait"] * 2 ** attempt
+                log.warning(f"Sending an email failed ({e}), retrying in "
+                            f"{wait}s...")
+                time.sleep(wait)
 
-    # create SMTP object
-    server = smtplib.SMTP(host='smtp.office365.com', port=587)
-    server.ehlo()
-    server.starttls()
-    server.ehlo()
 
-    # log in
-    server.login(sender, password)
+def send_email(body: str, recipients: list, *attachments):
+    """Sends a single email in its own SMTP session. Use send_emails to
+    send several emails in one session."""
+    with Mailer() as mailer:
+        mailer.send(build_email(body, recipients, *attachments), recipients)
+
+
+def send_emails(emails: list) -> list:
+    """Sends several emails in one SMTP session. Emails are built on a
+    pool of threads, which read their attachments, while the ones
+    already built are sent in order.
+
+    Parameters
+    ----------
+    emails : list
+        (body, recipients, attachments) tuples, as taken by send_email
+
+    Returns
+    -------
+    list
+        Whether each email was sent
+    """
 
-    # send email
-    server.sendmail(sender, recipients, msg.as_string())
-    server.quit()
+    import smtplib
+
+    sent = list()
+    with ThreadPoolExecutor(4) as pool, Mailer() as mailer:
+        built = [pool.submit(build_email, body, recipients, *attachments)
+                 for body, recipients, attachments in emails]
+        for (_, recipients, _), msg in zip(emails, built):
+            try:
+                mailer.send(msg.result(), recipients)
+                sent.append(True)
+            except (smtplib.SMTPException, OSError):
+                log.exception(f"Could not send an email to {recipients}...")
+                sent.append(False)
+    return sent
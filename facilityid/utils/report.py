@@ -0,0 +1,191 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import facilityid.config as config
+
+# Where the report of the last run is written
+REPORT = os.path.join('.', 'facilityid', 'log', 'run_report.json')
+
+# Backend methods that send a query or open a cursor on the database
+_QUERIES = ('execute', 'search_cursor', 'update_cursor', 'describe',
+            'list_fields', 'walk')
+
+# Initialize the logger for this file
+log = config.logging.getLogger(__name__)
+
+
+class RunReport:
+    """Times the stages of a run in nested spans, and writes them to a
+    JSON report at the end of the run.
+
+    A span records how long its block took, how many queries were sent
+    through the backend while it was open, and any counts the block adds
+    to it, such as the number of rows read. Spans opened inside another
+    span are nested under it. Spans that are not nested are filed under
+    their feature, or under the run itself. Each thread nests its spans
+    separately, and counts only the queries it sends.
+    """
+
+    started = time.perf_counter()
+    started_at = datetime.now()
+    spans = list()  # Spans not nested in another span or a feature
+    features = dict()  # Spans not nested in another span, by feature
+    _local = threading.local()  # Spans open in each thread
+
+    @classmethod
+    def _stack(cls) -> list:
+        """The spans open in the calling thread, innermost last."""
+        try:
+            return cls._local.stack
+        except AttributeError:
+            cls._local.stack = list()
+            return cls._local.stack
+
+    @classmethod
+    @contextmanager
+    def span(cls, name: str, feature: str = None, **counts):
+        """Times a block of code.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage
+        feature : str, optional
+            The feature the stage works on, if it is not nested in a
+            span of that feature, by default None
+        counts : int
+            Initial counts, e.g. rows=0
+
+        Yields
+        ------
+        dict
+            The span, whose counts can be added to inside the block
+        """
+
+        record = {"name": name, "start": time.perf_counter() - cls.started,
+                  "seconds": None, "queries": 0, **counts, "spans": list()}
+        stack = cls._stack()
+        if stack:
+            stack[-1]["spans"].append(record)
+        elif feature:
+            record["feature"] = feature
+            cls.features.setdefault(feature, list()).append(record)
+        else:
+            cls.spans.append(record)
+        stack.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            stack.remove(record)
+
+    @classmethod
+    def count_query(cls):
+        """Adds a query to every span open in the calling thread."""
+        for record in cls._stack():
+            record["queries"] += 1
+
+    @classmethod
+    def adopt(cls, record: dict):
+        """Files a span of a feature that was timed in another process."""
+        spans = cls.features.setdefault(record["feature"], list())
+        if not any(s is record for s in spans):
+            spans.append(record)
+
+    @classmethod
+    def _stages(cls) -> dict:
+        """Totals the spans of every stage by name."""
+        stages = dict()
+
+        def add(records):
+            for record in records:
+                stage = stages.setdefault(record["name"], {"count": 0})
+                stage["count"] += 1
+                for key, value in record.items():
+                    if key not in ("name", "start", "spans") and isinstance(
+                            value, (int, float)):
+                        stage[key] = stage.get(key, 0) + value
+                add(record["spans"])
+
+        add(cls.spans)
+        for records in cls.features.values():
+            add(records)
+        return stages
+
+    @classmethod
+    def summary(cls, top: int = 10) -> dict:
+        """Builds the report of the run so far.
+
+        Parameters
+        ----------
+        top : int, optional
+            How many of the slowest features to list, by default 10
+
+        Returns
+        -------
+        dict
+            When the run started and how long it took, the totals of
+            each stage, the spans of each feature, the slowest
+            features, and the spans of the run itself
+        """
+
+        features = list()
+        for feature, records in cls.features.items():
+            features.append({
+                "feature": feature,
+                "seconds": sum(r["seconds"] or 0 for r in records),
+                "queries": sum(r["queries"] for r in records),
+                "spans": records})
+        slowest = sorted(features, key=lambda x: x["seconds"], reverse=True)
+        keys = ("feature", "seconds", "queries")
+        return {"started_at": cls.started_at.isoformat(),
+                "seconds": time.perf_counter() - cls.started,
+                "stages": cls._stages(),
+                "slowest": [{k: f[k] for k in keys} for f in slowest[:top]],
+                "features": features,
+                "spans": cls.spans}
+
+    @classmethod
+    def write(cls, path: str = REPORT, top: int = 10):
+        """Writes the report of the run to a JSON file.
+
+        Parameters
+        ----------
+        path : str, optional
+            File path to the report, by default REPORT
+        top : int, optional
+            How many of the slowest features to list, by default 10
+        """
+
+        with open(path, 'w') as f:
+            json.dump(cls.summary(top), f, indent=2, default=str)
+        log.info(f"Wrote the run report to {path}...")
+
+
+class CountedBackend:
+    """Passes every call through to a backend, counting the queries in
+    the open spans of the RunReport.
+
+    Parameters
+    ----------
+    backend : Backend
+        The backend to count the queries of
+    """
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    def __getattr__(self, name):
+        attr = getattr(self._backend, name)
+        if name not in _QUERIES:
+            return attr
+
+        def counted(*args, **kwargs):
+            RunReport.count_query()
+            return attr(*args, **kwargs)
+        return counted
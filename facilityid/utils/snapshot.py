@@ -0,0 +1,458 @@
+import json
+import os
+import sqlite3
+from datetime import datetime
+from hashlib import blake2b
+from itertools import islice
+
+# Where the state of each layer from the previous run is stored
+SNAPSHOTS = os.path.join('.', 'facilityid', 'log', 'previous_run.sqlite')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS layers (
+    feature TEXT PRIMARY KEY,
+    digest TEXT,
+    fingerprint TEXT,
+    watermark TEXT,
+    row_count INTEGER,
+    full_scan_at TEXT,
+    stored_at TEXT
+);
+CREATE TABLE IF NOT EXISTS rows (
+    feature TEXT NOT NULL,
+    globalid TEXT NOT NULL,
+    facilityid TEXT NOT NULL,
+    int_id INTEGER,
+    PRIMARY KEY (feature, globalid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rows_facilityid ON rows (feature, facilityid);
+CREATE TABLE IF NOT EXISTS inventory (
+    connection TEXT PRIMARY KEY,
+    signature TEXT,
+    items TEXT,
+    stored_at TEXT
+);
+CREATE TABLE IF NOT EXISTS staged (
+    feature TEXT NOT NULL,
+    globalid TEXT NOT NULL,
+    facilityid TEXT NOT NULL,
+    int_id INTEGER,
+    PRIMARY KEY (feature, globalid)
+) WITHOUT ROWID;
+"""
+
+
+def pair_hash(globalid: str, facilityid: str) -> int:
+    """Hashes a single (GLOBALID, FACILITYID) pair into an integer.
+
+    The digest of a table sums the hashes of its pairs, so that it does
+    not depend on the order of the rows and can be built while streaming
+    them."""
+    h = blake2b(f"{globalid}\x1f{facilityid}".encode('utf-8'), digest_size=8)
+    return int.from_bytes(h.digest(), 'big')
+
+
+def _stored(feature: str, rows):
+    """Prepares (GLOBALID, FACILITYID, int ID) tuples for the rows table.
+
+    SQLite integers are signed 64-bit, so larger IDs are stored as null
+    and parsed back out of their FACILITYID by used_ids."""
+    for globalid, facilityid, int_id in rows:
+        if int_id is not None and not -2 ** 63 <= int_id < 2 ** 63:
+            int_id = None
+        yield feature, globalid, facilityid, int_id
+
+
+class SnapshotStore:
+    """A SQLite store that remembers the state of each layer at the end
+    of the previous run.
+
+    Each layer is keyed by its feature name and holds a digest of its
+    (GLOBALID, FACILITYID) pairs, the fingerprint used to skip unchanged
+    layers, and the latest edit date that was read. Optionally, the rows
+    themselves are stored as an index of GLOBALID, FACILITYID, and
+    integer ID, which allows reporting exactly which records changed
+    between runs and rescanning only the rows edited since then. Rows
+    can be staged while a layer is read and promoted once it is edited,
+    so that they never need to be held in memory. The inventory of
+    feature classes found in each connection is kept as well, along with
+    a signature of the catalog it was read from. Every write to the
+    stored layers happens in a single transaction, so an interrupted run
+    never leaves a layer half stored. Staged rows are written a block at
+    a time, so that the store isn't locked while a layer is read.
+
+    Parameters
+    ----------
+    path : str, optional
+        File path to the SQLite database, by default SNAPSHOTS
+    """
+
+    def __init__(self, path: str = SNAPSHOTS):
+        self.path = path
+        self._conn = None
+
+    def __enter__(self):
+        # Worker processes may stage rows at the same time
+        self._conn = sqlite3.connect(self.path, timeout=60)
+        self._conn.executescript(_SCHEMA)
+        return self
+
+    def __exit__(self, *exc):
+        self._conn.close()
+        self._conn = None
+
+    def layer(self, feature: str) -> dict:
+        """Everything stored about a layer, other than its rows.
+
+        Returns
+        -------
+        dict
+            Stored values keyed by column name, or an empty dict if the
+            layer was never stored
+        """
+
+        cursor = self._conn.execute("SELECT * FROM layers WHERE feature = ?",
+                                    (feature,))
+        row = cursor.fetchone()
+        if row is None:
+            return dict()
+        layer = dict(zip([c[0] for c in cursor.description], row))
+        if layer["fingerprint"]:
+            layer["fingerprint"] = tuple(json.loads(layer["fingerprint"]))
+        return layer
+
+    def digest(self, feature: str):
+        """The stored digest of a layer, or None if it was never stored."""
+        return self.layer(feature).get("digest")
+
+    def fingerprint(self, feature: str):
+        """The stored fingerprint of a layer, or None if there is none."""
+        return self.layer(feature).get("fingerprint")
+
+    def has_rows(self, feature: str) -> bool:
+        """Whether the pairs of a layer were stored."""
+        row = self._conn.execute(
+            "SELECT 1 FROM rows WHERE feature = ? LIMIT 1",
+            (feature,)).fetchone()
+        return row is not None
+
+    def store(self, feature: str, layer_digest: str, fingerprint=None,
+              rows=None, watermark=None):
+        """Replaces everything stored for a layer in one transaction,
+        marking the layer as fully scanned.
+
+        Parameters
+        ----------
+        feature : str
+            The name of the layer
+        layer_digest : str
+            The digest of the layer's (GLOBALID, FACILITYID) pairs
+        fingerprint : tuple, optional
+            The fingerprint of the table, by default None
+        rows : iterable, optional
+            (GLOBALID, FACILITYID, int ID) tuples to store row by row. If
+            None, no rows are stored for the layer, by default None
+        watermark : str, optional
+            The latest edit date read from the layer, by default None
+        """
+
+        stored = json.dumps(fingerprint) if fingerprint else None
+        now = datetime.now().isoformat(timespec='seconds')
+        with self._conn:
+            self._conn.execute("DELETE FROM rows WHERE feature = ?",
+                               (feature,))
+            count = None
+            if rows is not None:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO rows VALUES (?, ?, ?, ?)",
+                    _stored(feature, rows))
+                count = self._conn.execute(
+                    "SELECT COUNT(*) FROM rows WHERE feature = ?",
+                    (feature,)).fetchone()[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO layers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (feature, layer_digest, stored, watermark, count, now, now))
+
+    def update(self, feature: str, rows, fingerprint=None, watermark=None):
+        """Updates the stored rows of a layer in place, adjusting its
+        digest and row count to match, in one transaction.
+
+        Parameters
+        ----------
+        feature : str
+            The name of the layer
+        rows : iterable
+            (GLOBALID, FACILITYID, int ID) tuples of new or changed rows
+        fingerprint : tuple, optional
+            The new fingerprint of the table, by default None
+        watermark : str, optional
+            The latest edit date read from the layer, by default None
+        """
+
+        layer = self.layer(feature)
+        total = int(layer["digest"], 16)
+        count = layer["row_count"] or 0
+        with self._conn:
+            for _, globalid, facilityid, int_id in _stored(feature, rows):
+                old = self._conn.execute(
+                    "SELECT facilityid FROM rows "
+                    "WHERE feature = ? AND globalid = ?",
+                    (feature, globalid)).fetchone()
+                if old is None:
+                    count += 1
+                else:
+                    total -= pair_hash(globalid, old[0])
+                total += pair_hash(globalid, facilityid)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rows VALUES (?, ?, ?, ?)",
+                    (feature, globalid, facilityid, int_id))
+
+            stored = json.dumps(fingerprint) if fingerprint else None
+            self._conn.execute(
+                "UPDATE layers SET digest = ?, fingerprint = ?, "
+                "watermark = ?, row_count = ?, stored_at = ? "
+                "WHERE feature = ?",
+                (format(total % 2 ** 64, '016x'), stored,
+                 watermark or layer["watermark"], count,
+                 datetime.now().isoformat(timespec='seconds'), feature))
+
+    def stage(self, feature: str, rows, block: int = 10000):
+        """Replaces the staged rows of a layer.
+
+        Rows are pulled from the iterable a block at a time, outside of
+        any transaction, and each block is written in its own short
+        transaction. Other processes can write to the store in between,
+        even when the rows come straight from a cursor over the network.
+
+        Parameters
+        ----------
+        feature : str
+            The name of the layer
+        rows : iterable
+            (GLOBALID, FACILITYID, int ID) tuples, as read from the layer
+        block : int, optional
+            How many rows to write per transaction, by default 10000
+        """
+
+        with self._conn:
+            self._conn.execute("DELETE FROM staged WHERE feature = ?",
+                               (feature,))
+        rows = _stored(feature, rows)
+        while True:
+            chunk = list(islice(rows, block))
+            if not chunk:
+                break
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO staged VALUES (?, ?, ?, ?)",
+                    chunk)
+
+    def promote(self, feature: str, layer_digest: str, fingerprint=None,
+                rows=None, watermark=None):
+        """Replaces everything stored for a layer with its staged rows in
+        one transaction, like store.
+
+        Parameters
+        ----------
+        feature : str
+            The name of the layer
+        layer_digest : str
+            The digest of the layer's (GLOBALID, FACILITYID) pairs
+        fingerprint : tuple, optional
+            The fingerprint of the table, by default None
+        rows : iterable, optional
+            (GLOBALID, FACILITYID, int ID) tuples of rows that changed
+            since they were staged, by default None
+        watermark : str, optional
+            The latest edit date read from the layer, by default None
+        """
+
+        stored = json.dumps(fingerprint) if fingerprint else None
+        now = datetime.now().isoformat(timespec='seconds')
+        with self._conn:
+            self._conn.execute("DELETE FROM rows WHERE feature = ?",
+                               (feature,))
+            self._conn.execute("INSERT INTO rows SELECT * FROM staged "
+                               "WHERE feature = ?", (feature,))
+            self._conn.execute("DELETE FROM staged WHERE feature = ?",
+                               (feature,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO rows VALUES (?, ?, ?, ?)",
+                _stored(feature, rows or []))
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM rows WHERE feature = ?",
+                (feature,)).fetchone()[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO layers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (feature, layer_digest, stored, watermark, count, now, now))
+
+    def known(self, feature: str, globalids) -> set:
+        """Finds which GLOBALIDs are already stored for a layer."""
+        found = set()
+        for globalid in globalids:
+            row = self._conn.execute(
+                "SELECT 1 FROM rows WHERE feature = ? AND globalid = ?",
+                (feature, globalid)).fetchone()
+            if row:
+                found.add(globalid)
+        return found
+
+    def lookup(self, feature: str, facilityids) -> dict:
+        """Maps FACILITYIDs to the GLOBALIDs they are stored against.
+
+        Parameters
+        ----------
+        feature : str
+            The name of the layer
+        facilityids : iterable
+            The FACILITYIDs to look up
+
+        Returns
+        -------
+        dict
+            A list of GLOBALIDs for each FACILITYID that was found
+        """
+
+        owners = dict()
+        for facilityid in set(facilityids):
+            globalids = [r[0] for r in self._conn.execute(
+                "SELECT globalid FROM rows "
+                "WHERE feature = ? AND facilityid = ?",
+                (feature, facilityid))]
+            if globalids:
+                owners[facilityid] = globalids
+        return owners
+
+    def used_ids(self, feature: str, exclude=()):
+        """Yields the stored integer IDs of a layer, skipping nulls.
+
+        Parameters
+        ----------
+        feature : str
+            The name of the layer
+        exclude : iterable, optional
+            GLOBALIDs whose stored IDs are skipped, such as rows that
+            were read again since they were stored, by default ()
+        """
+
+        # Imported here, since the table module imports this one
+        from .table import split_facilityids
+
+        exclude = set(exclude)
+        for globalid, int_id in self._conn.execute(
+                "SELECT globalid, int_id FROM rows "
+                "WHERE feature = ? AND int_id IS NOT NULL", (feature,)):
+            if globalid not in exclude:
+                yield int_id
+        # IDs too large for SQLite are stored as null, see _stored
+        wide = [f for g, f in self._conn.execute(
+            "SELECT globalid, facilityid FROM rows WHERE feature = ? "
+            "AND int_id IS NULL AND facilityid <> ''", (feature,))
+            if g not in exclude]
+        for int_id in split_facilityids(wide)[2]:
+            if int_id is not None:
+                yield int_id
+
+    def diff(self, feature: str) -> dict:
+        """Compares the staged rows of a layer to its stored rows.
+
+        Parameters
+        ----------
+        feature : str
+            The name of the layer
+
+        Returns
+        -------
+        dict
+            Lists of GLOBALIDs that were "added", "removed", or
+            "changed" since the rows were stored
+        """
+
+        queries = {
+            "added": ("SELECT s.globalid FROM staged s "
+                      "LEFT JOIN rows r ON r.feature = s.feature "
+                      "AND r.globalid = s.globalid "
+                      "WHERE s.feature = ? AND r.globalid IS NULL"),
+            "removed": ("SELECT r.globalid FROM rows r "
+                        "LEFT JOIN staged s ON s.feature = r.feature "
+                        "AND s.globalid = r.globalid "
+                        "WHERE r.feature = ? AND s.globalid IS NULL"),
+            "changed": ("SELECT s.globalid FROM staged s "
+                        "JOIN rows r ON r.feature = s.feature "
+                        "AND r.globalid = s.globalid "
+                        "WHERE s.feature = ? "
+                        "AND r.facilityid IS NOT s.facilityid")}
+        return {k: [r[0] for r in self._conn.execute(q, (feature,))]
+                for k, q in queries.items()}
+
+    def inventory(self, connection: str, signature: str):
+        """The stored inventory of a connection, if it was stored while
+        the catalog had the same signature.
+
+        Parameters
+        ----------
+        connection : str
+            The file path to the sde connection file
+        signature : str
+            The current signature of the catalog
+
+        Returns
+        -------
+        list
+            Tuples representing (sde, dataset, feature) or (sde,
+            feature), or None if the inventory must be read again
+        """
+
+        row = self._conn.execute(
+            "SELECT items FROM inventory WHERE connection = ? "
+            "AND signature = ?", (connection, signature)).fetchone()
+        if row is None:
+            return None
+        return [tuple(i) for i in json.loads(row[0])]
+
+    def store_inventory(self, connection: str, signature: str, items: list):
+        """Replaces the stored inventory of a connection.
+
+        Parameters
+        ----------
+        connection : str
+            The file path to the sde connection file
+        signature : str
+            The signature of the catalog the items were read from
+        items : list
+            Tuples representing (sde, dataset, feature) or (sde, feature)
+        """
+
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO inventory VALUES (?, ?, ?, ?)",
+                (connection, signature, json.dumps(items),
+                 datetime.now().isoformat()))
+
+    def compact(self, keep=None):
+        """Removes layers that no longer need to be stored and reclaims
+        the space they used.
+
+        Parameters
+        ----------
+        keep : iterable, optional
+            The names of layers to keep. If None, every layer is kept,
+            by default None
+        """
+
+        if keep is not None:
+            keep = set(keep)
+            stored = [r[0] for r in
+                      self._conn.execute("SELECT feature FROM layers")]
+            with self._conn:
+                for feature in stored:
+                    if feature not in keep:
+                        self._conn.execute(
+                            "DELETE FROM layers WHERE feature = ?",
+                            (feature,))
+                        self._conn.execute(
+                            "DELETE FROM rows WHERE feature = ?", (feature,))
+        # Staged rows are only left behind by interrupted runs
+        with self._conn:
+            self._conn.execute("DELETE FROM staged")
+        self._conn.execute("VACUUM")
@@ -0,0 +1,323 @@
+import re
+from array import array
+from collections import deque
+from datetime import datetime, timezone
+from itertools import islice
+
+from .snapshot import pair_hash
+
+# Null edit dates are sorted first, followed by oldest to newest
+_NULL_DATE = datetime(1400, 1, 1, tzinfo=timezone.utc)
+
+# Bounds of the signed 64-bit integers that fit inside array('q')
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+
+
+def _epoch(value) -> float:
+    """Convert an edit date to seconds since the epoch, substituting a
+    very old date for nulls."""
+    return (value or _NULL_DATE).timestamp()
+
+
+# Matches the prefix of a FACILITYID, the digits that follow it, and any
+# trailing characters after the digits
+_FACILITYID = re.compile(r"(\D*)(\d*)(.*)", re.DOTALL)
+
+
+def split_facilityids(values):
+    """Breaks a column of FACILITYIDs apart into prefixes, IDs as
+    strings, and IDs as integers.
+
+    The prefix is everything before the first digit and the ID is
+    everything after the prefix. IDs made up entirely of digits are
+    converted directly; anything else falls back to int(), and IDs with
+    non-numeric characters are treated as missing.
+
+    Parameters
+    ----------
+    values : iterable
+        The raw FACILITYIDs of a column of rows
+
+    Returns
+    -------
+    tuple
+        Lists of (prefixes, str_ids, int_ids), where an int_id is None if
+        the ID does not exist or has non-numeric characters
+    """
+
+    prefixes, str_ids, int_ids = list(), list(), list()
+    match = _FACILITYID.fullmatch
+    for value in values:
+        if not value:
+            pfix, id_str, id_int = "", "", None
+        else:
+            pfix, digits, rest = match(str(value)).groups()
+            id_str = digits + rest
+            if digits and not rest:
+                id_int = int(digits)
+            else:
+                # Convert the string ID to integer
+                try:
+                    id_int = int(id_str)
+                # if id_str has non-numeric chars, assume no ID
+                except ValueError:
+                    id_str = ""
+                    id_int = None
+
+        prefixes.append(pfix)
+        str_ids.append(id_str)
+        int_ids.append(id_int)
+
+    return prefixes, str_ids, int_ids
+
+
+class RowTable:
+    """A column-oriented container for the rows of a feature class or
+    table.
+
+    Rather than representing each row as a dict, every field is stored
+    in its own column and rows are addressed by their position. Prefixes
+    are dictionary-encoded, integer IDs are packed into a signed 64-bit
+    array alongside a null mask, and edit dates are stored as seconds
+    since the epoch.
+
+    Attributes
+    ----------
+    globalids : list
+        The GLOBALID of each row
+    created : array
+        Seconds since the epoch that each row was created
+    edited : array
+        Seconds since the epoch that each row was last edited
+    """
+
+    # Values of the null mask
+    _NULL, _INT, _WIDE = 0, 1, 2
+
+    def __init__(self):
+        self.globalids = list()
+        self.created = array('d')
+        self.edited = array('d')
+
+        self._prefixes = list()  # distinct prefixes, indexed by their code
+        self._codes = dict()  # prefix -> code
+        self._prefix_codes = array('l')
+        self._int_ids = array('q')
+        self._mask = bytearray()
+        self._wide = dict()  # position -> int_id too large for array('q')
+        self._str_ids = dict()  # position -> str_id unlike str(int_id)
+
+    def __len__(self):
+        return len(self.globalids)
+
+    def __iter__(self):
+        return iter(range(len(self)))
+
+    def _encode(self, prefix: str) -> int:
+        """Finds the code of a prefix, adding it if it is new."""
+        try:
+            return self._codes[prefix]
+        except KeyError:
+            code = len(self._prefixes)
+            self._codes[prefix] = code
+            self._prefixes.append(prefix)
+            return code
+
+    def _store_id(self, i: int, str_id: str, int_id):
+        """Writes an ID into the integer column at position i."""
+        self._str_ids.pop(i, None)
+        self._wide.pop(i, None)
+        if int_id is None:
+            self._int_ids[i] = 0
+            self._mask[i] = self._NULL
+            return
+
+        if _INT64_MIN <= int_id <= _INT64_MAX:
+            self._int_ids[i] = int_id
+            self._mask[i] = self._INT
+        else:
+            self._int_ids[i] = 0
+            self._mask[i] = self._WIDE
+            self._wide[i] = int_id
+
+        # Only keep the string form of IDs that cannot be rebuilt from the
+        # integer, like those with leading zeros
+        if str_id != str(int_id):
+            self._str_ids[i] = str_id
+
+    def _append(self, globalids, created, edited, prefixes, str_ids,
+                int_ids):
+        """Adds parsed columns to the end of the table, with edit dates
+        already in seconds since the epoch."""
+        start = len(self.globalids)
+        self.globalids.extend(globalids)
+        self.created.extend(created)
+        self.edited.extend(edited)
+        self._int_ids.frombytes(bytes(8 * len(globalids)))
+        self._mask.extend(bytes(len(globalids)))
+        self._prefix_codes.extend(map(self._encode, prefixes))
+        for i, str_id, int_id in zip(range(start, len(self.globalids)),
+                                     str_ids, int_ids):
+            if int_id is not None:
+                self._store_id(i, str_id, int_id)
+
+    def prefix(self, i: int) -> str:
+        """The prefix of the row at position i."""
+        return self._prefixes[self._prefix_codes[i]]
+
+    def int_id(self, i: int):
+        """The ID of the row at position i as an integer, or None."""
+        flag = self._mask[i]
+        if flag == self._INT:
+            return self._int_ids[i]
+        elif flag == self._WIDE:
+            return self._wide[i]
+        return None
+
+    def str_id(self, i: int) -> str:
+        """The ID of the row at position i as a string."""
+        try:
+            return self._str_ids[i]
+        except KeyError:
+            int_id = self.int_id(i)
+            return "" if int_id is None else str(int_id)
+
+    def merged(self, i: int) -> str:
+        """Concatenate the ID of the row at position i back together."""
+        return self.prefix(i) + self.str_id(i)
+
+    def set_prefix(self, i: int, prefix: str):
+        """Replaces the prefix of the row at position i."""
+        self._prefix_codes[i] = self._encode(prefix)
+
+    def set_id(self, i: int, int_id: int):
+        """Replaces the ID of the row at position i."""
+        self._store_id(i, str(int_id), int_id)
+
+
+def _blocks(rows, block: int):
+    """Groups rows into blocks, yielding the columns of each block."""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, block))
+        if not chunk:
+            break
+        yield tuple(zip(*chunk))
+
+
+class TableScan:
+    """Reads the rows of a table in a single streaming pass, keeping
+    only what is needed to edit it.
+
+    Rows are pulled from a cursor a block at a time and parsed, and each
+    row is either kept in a RowTable for editing or summarized and
+    dropped. Every row adds its integer ID to the used-ID index, its
+    (GLOBALID, FACILITYID) pair to the digest of the table, and its
+    dates to the latest edit date, so memory only grows with the number
+    of kept rows and used IDs.
+
+    Parameters
+    ----------
+    keep : callable, optional
+        Called with the (GLOBALID, prefix, str_id) of each row, returning
+        whether to keep the row. None keeps every row, by default None
+    block : int, optional
+        How many rows to parse at once, by default 10000
+
+    Attributes
+    ----------
+    rows : RowTable
+        The rows that were kept
+    count : int
+        How many rows were read
+    """
+
+    def __init__(self, keep=None, block: int = 10000):
+        self.keep = keep
+        self.block = block
+        self.rows = RowTable()
+        self.count = 0
+        self._used = array('q')
+        self._wide = list()  # used IDs too large for array('q')
+        self._total = 0  # sum of the pair hash of every row read
+        self._kept = 0  # sum of the pair hash of kept rows, as read
+        self._latest = _epoch(None)
+
+    def consume(self, rows):
+        """Reads rows, yielding the (GLOBALID, FACILITYID, int ID) of
+        each as it was read.
+
+        The generator must be exhausted for the rows to be fully
+        recorded, e.g. by writing its output to a SnapshotStore.
+
+        Parameters
+        ----------
+        rows : iterable
+            Sequences of (GLOBALID, FACILITYID, created, edited), such as
+            the rows of a cursor
+
+        Yields
+        ------
+        tuple
+            (GLOBALID, FACILITYID, int ID), with the FACILITYID merged
+            back together from its parsed prefix and ID
+        """
+
+        keep = self.keep
+        for globalids, facilityids, created, edited in _blocks(
+                rows, self.block):
+            created = list(map(_epoch, created))
+            edited = list(map(_epoch, edited))
+            self._latest = max(self._latest, max(created), max(edited))
+            self.count += len(globalids)
+            prefixes, str_ids, int_ids = split_facilityids(facilityids)
+
+            kept = list()
+            for i, globalid in enumerate(globalids):
+                merged = prefixes[i] + str_ids[i]
+                pair = pair_hash(globalid, merged)
+                self._total += pair
+                int_id = int_ids[i]
+                if int_id is not None:
+                    if _INT64_MIN <= int_id <= _INT64_MAX:
+                        self._used.append(int_id)
+                    else:
+                        self._wide.append(int_id)
+                if keep is None or keep(globalid, prefixes[i], str_ids[i]):
+                    kept.append(i)
+                    self._kept += pair
+                yield globalid, merged, int_id
+
+            columns = (globalids, created, edited, prefixes, str_ids,
+                       int_ids)
+            self.rows._append(*([c[i] for i in kept] for c in columns))
+
+    def read(self, rows):
+        """Reads rows without passing them on."""
+        deque(self.consume(rows), maxlen=0)
+
+    def used_ids(self):
+        """Yields every integer ID read, skipping nulls."""
+        yield from self._used
+        yield from self._wide
+
+    def digest(self) -> str:
+        """The digest of every row read, as it stands after any changes
+        made to the kept rows."""
+        current = sum(pair_hash(g, self.rows.merged(i))
+                      for i, g in enumerate(self.rows.globalids))
+        return format((self._total - self._kept + current) % 2 ** 64, '016x')
+
+    def latest(self):
+        """The most recent created or edited date read.
+
+        Returns
+        -------
+        datetime
+            The latest date, or None if every date is null
+        """
+
+        if self._latest <= _epoch(None):
+            return None
+        return datetime.fromtimestamp(self._latest)
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+import facilityid.config as config
+from benchmarks.generate import generate
+from facilityid.utils.edit import Edit
+from facilityid.utils.identifier import Identifier
+
+
+@pytest.fixture(scope="session", autouse=True)
+def settings(tmp_path_factory):
+    """Reads config.yaml once and points the package at the SQLite
+    reference backend. The file handler of the log is opened in a scratch
+    folder, so that nothing is written into the repository."""
+    root = tmp_path_factory.mktemp("config")
+    os.makedirs(root / "facilityid" / "log")
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        config.load()
+    finally:
+        os.chdir(cwd)
+    config.db = 'SQLITE'
+    for name in config.config['LOGGING']['loggers']:
+        config.logging.getLogger(name).setLevel(config.logging.WARNING)
+
+
+@pytest.fixture(autouse=True)
+def workspace(tmp_path, monkeypatch):
+    """Runs each test in a scratch working directory, so that it gets its
+    own store of previous runs, and forgets what earlier tests cached."""
+    os.makedirs(tmp_path / "facilityid" / "log")
+    monkeypatch.chdir(tmp_path)
+    for cache in (Identifier.metadata, Identifier.grants):
+        cache.clear()
+    for entries in (Identifier.inspected_users, Identifier.failures,
+                    Edit.edited_users, Edit.edited_features,
+                    Edit.version_failures, Edit.aprx_layers):
+        entries.clear()
+    return tmp_path
+
+
+@pytest.fixture(scope="session")
+def generated(tmp_path_factory):
+    """Creates synthetic feature classes with benchmarks.generate, which
+    are shared between tests unless a folder is given."""
+    shared = str(tmp_path_factory.mktemp("data"))
+
+    def table(rows: int = 2000, shape: str = 'Polyline', folder=None,
+              **options) -> tuple:
+        return generate(rows, shape, folder=str(folder or shared), **options)
+    return table
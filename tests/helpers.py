@@ -0,0 +1,34 @@
+import re
+
+from facilityid.utils.edit import Edit
+
+
+def split_facilityid(value):
+    """The per-row parsing that split_facilityids replaced."""
+    if not value:
+        return "", "", None
+    f_id = str(value)
+    try:
+        pfix = re.findall(r"^\D+", f_id)[0]
+    except IndexError:
+        pfix = ""
+    id_str = f_id[len(pfix):]
+    try:
+        id_int = int(id_str)
+    except ValueError:
+        id_str = ""
+        id_int = None
+    return pfix, id_str, id_int
+
+
+def analyzed(feature, incremental: bool = False) -> Edit:
+    """Reads a table and works out its edits."""
+    editor = Edit(feature, incremental)
+    editor.analyze()
+    return editor
+
+
+def edits(editor: Edit) -> list:
+    """The edited rows of an analyzed table, without their timestamps."""
+    return [(r["GLOBALID"], r["OLDFACILITYID"], r["NEWFACILITYID"])
+            for r in editor.records]
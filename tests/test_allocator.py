@@ -0,0 +1,17 @@
+import facilityid.config as config
+from facilityid.utils.allocator import IdAllocator
+
+
+def test_default_backfills_every_gap():
+    ids = IdAllocator([1, 5, 50000], True, config.recycle_max_gap)
+    assert [next(ids) for _ in range(5)] == [2, 3, 4, 6, 7]
+
+
+def test_wide_gaps_are_skipped():
+    ids = IdAllocator([1, 3, 50000], True, max_gap=100)
+    assert [next(ids) for _ in range(3)] == [2, 50001, 50002]
+
+
+def test_increments_without_recycling():
+    ids = IdAllocator([3, 1, 3], False)
+    assert [next(ids) for _ in range(2)] == [4, 5]
@@ -0,0 +1,195 @@
+import os
+import tracemalloc
+
+import pytest
+
+import facilityid.config as config
+from facilityid.backends.sqlite import SQLiteBackend
+from facilityid.utils.edit import Edit
+from facilityid.utils.table import _epoch
+
+from .helpers import analyzed, edits, split_facilityid
+
+
+def previous_edits(feature, prefix: str, shape: str) -> tuple:
+    """Works out the edits of a table like _edit did before duplicates
+    were resolved in a single sorted pass, visiting the duplicated IDs in
+    sorted order instead of set order.
+
+    Returns
+    -------
+    tuple
+        The edited rows, as edits returns them, and the count of each
+        kind of edit
+    """
+
+    measure = {'Polygon': 'SHAPE@AREA', 'Polyline': 'SHAPE@LENGTH'}.get(shape)
+    fields = ['GLOBALID', 'FACILITYID', 'created_date', 'last_edited_date']
+    with SQLiteBackend().search_cursor(
+            os.path.join(*feature),
+            fields + ([measure] if measure else [])) as cursor:
+        raw = [list(r) for r in cursor]
+
+    seen = dict()
+    for r in raw:
+        if r[1]:
+            seen[r[1]] = seen.get(r[1], 0) + 1
+    duplicates = {r[0] for r in raw if r[1] and seen[r[1]] > 1}
+
+    rows = list()
+    for r in raw:
+        pfix, str_id, int_id = split_facilityid(r[1])
+        rows.append({"GLOBALID": r[0], "pfix": pfix, "str_id": str_id,
+                     "int_id": int_id, "created": _epoch(r[2]),
+                     "edited": _epoch(r[3]),
+                     "measure": r[4] if measure else None})
+    used = [r["int_id"] for r in rows if r["int_id"] is not None]
+    top = [max(used, default=0)]
+
+    def new_id():
+        top[0] += 1
+        return top[0]
+
+    def merged(r):
+        return r["pfix"] + r["str_id"]
+
+    def sorter(r):
+        third = r["measure"] if measure else -r["created"]
+        return merged(r), -r["edited"], third
+
+    count = {"1 - # Empty IDs": 0, "2 - # Incorrect IDs": 0,
+             "3 - # Duplicated IDs": 0, "4 - Total Edits": 0}
+    edited = list()
+    dup_rows = [r for r in rows if r["GLOBALID"] in duplicates
+                and r["pfix"] == prefix]
+    dup_rows.sort(key=sorter)
+    for i in sorted({merged(r) for r in dup_rows}):
+        chunk = [r for r in dup_rows if merged(r) == i]
+        for c in chunk[:-1]:
+            count["3 - # Duplicated IDs"] += 1
+            count["4 - Total Edits"] += 1
+            c["int_id"] = new_id()
+            c["str_id"] = str(c["int_id"])
+            edited.append((c["GLOBALID"], i, merged(c)))
+
+    for r in rows:
+        changed = False
+        old = merged(r)
+        pfix, str_id = r["pfix"], r["str_id"]
+        empty = not pfix and not str_id
+        if empty:
+            count["1 - # Empty IDs"] += 1
+        if not pfix or not pfix.isupper() or pfix != prefix:
+            r["pfix"] = prefix
+            changed = True
+        if not str_id or (pfix != prefix and pfix):
+            r["int_id"] = new_id()
+            r["str_id"] = str(r["int_id"])
+            changed = True
+        if changed:
+            count["4 - Total Edits"] += 1
+            if not empty:
+                count["2 - # Incorrect IDs"] += 1
+            edited.append((r["GLOBALID"], old, merged(r)))
+    return edited, count
+
+
+@pytest.mark.parametrize("shape", ["Point", "Polyline", "Polygon"])
+@pytest.mark.parametrize("duplicates", [0.3, 0.6])
+def test_duplicates_match_previous_algorithm(generated, shape, duplicates):
+    feature = generated(2000, shape, duplicates=duplicates, nulls=0.05,
+                        noise=0.05)
+    editor = analyzed(feature)
+    expected, count = previous_edits(feature, editor.prefix, shape)
+    assert edits(editor) == expected
+    assert {k: v for k, v in editor.count.items()
+            if k != "0 - Feature"} == count
+    assert count["3 - # Duplicated IDs"] > 100
+
+
+def test_incremental_run_matches_full_scan(generated, workspace):
+    feature = generated(1000, folder=workspace, duplicates=0, nulls=0,
+                        noise=0)
+    first = analyzed(feature)
+    assert not first.records
+    first.store_current()
+
+    # After the run, the largest ID is removed and the next largest is
+    # changed to duplicate another ID, so neither may still count as used
+    changes = {"WF1000": "NULL", "WF999": "'WF5'", "WF998": "'wf998'"}
+    for old, new in changes.items():
+        SQLiteBackend().execute(
+            feature[0], f"""UPDATE UTIL."Bench" SET FACILITYID = {new},
+                            last_edited_date = '2030-01-01 00:00:00'
+                            WHERE FACILITYID = '{old}'""")
+
+    incremental = analyzed(feature, incremental=True)
+    assert incremental.incremental
+    full = analyzed(feature)
+    assert edits(incremental) == edits(full)
+    assert incremental.count == full.count
+    assert {r[2] for r in edits(full)} == {"WF999", "WF1000", "WF1001"}
+
+
+@pytest.mark.parametrize("shape", ["Point", "Polyline", "Polygon"])
+def test_database_engine_matches_python_engine(generated, workspace,
+                                               monkeypatch, shape):
+    feature = generated(3000, shape, folder=workspace, duplicates=0.2,
+                        nulls=0.05, noise=0.1)
+    # Prefixes with trailing spaces, leading zeros, and other odd IDs
+    odd = ["WF 12", "WF 12", "WF ", "wf 7", "WF012", "WF012", "WF1a", "WF"]
+    SQLiteBackend().insert_rows(
+        feature[0], feature[1], ['GLOBALID', 'FACILITYID'],
+        [(f"{{ODD-{i}}}", f) for i, f in enumerate(odd)])
+    python = analyzed(feature)
+    monkeypatch.setattr(config, "id_engine", "database")
+    database = analyzed(feature)
+    assert database.server_side and not python.server_side
+    assert edits(database) == edits(python)
+    assert database.count == python.count
+
+
+def test_database_engine_counts_up_from_64_bit_ids(generated, workspace,
+                                                   monkeypatch):
+    feature = generated(100, folder=workspace, duplicates=0, nulls=0,
+                        noise=0)
+    SQLiteBackend().insert_rows(
+        feature[0], feature[1], ['GLOBALID', 'FACILITYID'],
+        [("{WIDE}", f"WF{10 ** 20}"), ("{EMPTY}", None)])
+    monkeypatch.setattr(config, "id_engine", "database")
+    editor = analyzed(feature)
+    assert edits(editor) == [("{EMPTY}", "", "WF101")]
+
+
+def test_unchanged_table_is_stored_without_analysis(generated, workspace):
+    feature = generated(200, folder=workspace, duplicates=0, nulls=0,
+                        noise=0)
+    analyzed(feature).store_current()
+
+    # Like app.main, a table that equals the last run is stored again
+    # without being analyzed
+    editor = Edit(feature)
+    assert editor.equals_previous()
+    editor.store_current()
+    assert Edit(feature).equals_previous()
+
+
+def test_peak_memory_does_not_grow_with_the_table(generated, workspace):
+    def peak(rows: int) -> int:
+        feature = generated(rows, folder=workspace / str(rows),
+                            duplicates=0, nulls=0, noise=0)
+        SQLiteBackend().insert_rows(
+            feature[0], feature[1], ['GLOBALID', 'FACILITYID'],
+            [(f"{{EMPTY-{i}}}", None) for i in range(20)])
+        tracemalloc.start()
+        try:
+            editor = analyzed(feature)
+            assert len(editor.records) == 20
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    # Both tables span several blocks of rows, and only the index of used
+    # IDs grows with the table, by 8 bytes a row
+    small, large = peak(30000), peak(90000)
+    assert large < small * 1.1
@@ -0,0 +1,92 @@
+import facilityid.utils.identifier as identifier
+from facilityid.backends import ExecuteError
+from facilityid.backends.sqlite import SQLiteBackend
+from facilityid.utils.edit import Edit
+from facilityid.utils.identifier import Identifier
+from facilityid.utils.report import RunReport
+
+
+def test_profile_falls_back_without_fingerprint(generated, monkeypatch,
+                                                caplog):
+    feature = generated(500)
+    query = Identifier._profile_query
+
+    def failing(self, fingerprint=True):
+        broken = " WHERE NO_SUCH_COLUMN = 1" if fingerprint else ""
+        return query(self, fingerprint) + broken
+
+    monkeypatch.setattr(Identifier, "_profile_query", failing)
+    identifier = Identifier(feature)
+    assert identifier.profile["count"] == 500
+    assert identifier.fingerprint() is None
+    assert not identifier.unchanged()
+    assert identifier.essentials()
+    assert "Could not take the fingerprint" in caplog.text
+
+
+def test_failed_profile_leaves_an_empty_profile(generated, monkeypatch,
+                                                caplog):
+    feature = generated(500)
+    execute = SQLiteBackend.execute
+
+    def failing(self, connection, query):
+        if "COUNT(" in query.upper():
+            # Like ArcSDESQLExecute does for some failed queries
+            raise AttributeError("'NoneType' object has no attribute 'rows'")
+        return execute(self, connection, query)
+
+    monkeypatch.setattr(SQLiteBackend, "execute", failing)
+    identifier = Identifier(feature)
+    assert identifier.profile == dict()
+    assert identifier.fingerprint() is None
+    assert "Could not profile" in caplog.text
+
+
+def test_privileges_through_roles_and_public_count(workspace):
+    backend = SQLiteBackend()
+    connection = backend.create_geodatabase(str(workspace))
+    backend.create_connection(str(workspace), "gisscr.sde",
+                              str(workspace / "gis.sqlite"),
+                              username="gisscr")
+    grants = {"UTIL.Direct": ("gisscr", ["UPDATE"]),
+              "UTIL.Role": ("editors", ["UPDATE"]),
+              "UTIL.Public": ("PUBLIC", ["INSERT"]),
+              "UTIL.Other": ("others", ["UPDATE"]),
+              "UTIL.ReadOnly": ("gisscr", ["SELECT"])}
+    for name, (grantee, privileges) in grants.items():
+        backend.create_table(connection, name, "Point")
+        backend.grant(connection, grantee, name, privileges)
+    backend.grant_role(connection, "gisscr", "editors")
+    backend.grant_role(connection, "someone", "others")
+
+    edit = str(workspace / "gisscr.sde")
+    editable = {name for name in grants
+                if Identifier((connection, name)).can_gisscr_edit(edit)}
+    assert editable == {"UTIL.Direct", "UTIL.Role", "UTIL.Public"}
+
+
+def test_failed_privileges_are_reused(monkeypatch):
+    queries = list()
+
+    class Failing:
+        def execute(self, connection, query):
+            queries.append(query)
+            raise ExecuteError("ALL_TAB_PRIVS is not readable")
+
+    monkeypatch.setattr(identifier, "get_backend", Failing)
+    for _ in range(3):
+        assert Identifier._grants("gisscr.sde") == dict()
+    assert len(queries) == 1
+
+
+def test_edit_reuses_the_metadata_of_its_identifier(generated):
+    feature = generated(500, duplicates=0, nulls=0, noise=0)
+    with RunReport.span("identifier") as first:
+        facilityid = Identifier(feature)
+    with RunReport.span("identifier") as again:
+        Identifier(feature)
+    with RunReport.span("edit_init") as edit:
+        Edit(feature, profile=facilityid.profile)
+    assert first["queries"] == 3  # describe, list_fields, and profile
+    assert again["queries"] == 1  # profile
+    assert edit["queries"] == 1  # the rows
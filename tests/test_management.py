@@ -0,0 +1,91 @@
+import socketserver
+import threading
+
+import pytest
+
+import facilityid.config as config
+from facilityid.utils.management import send_emails
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP to accept emails, refusing recipients with
+    the replies queued for them."""
+
+    def reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply("220 localhost")
+        recipients = list()
+        for line in self.rfile:
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 localhost")
+            elif verb in ("MAIL", "RSET"):
+                recipients = list()
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                address = command.split(":", 1)[1].strip("<> ")
+                server.attempts.append(address)
+                queued = server.replies.get(address)
+                code = queued.pop(0) if queued else 250
+                if code == 250:
+                    recipients.append(address)
+                self.reply(f"{code} {address}")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                for data in self.rfile:
+                    if data == b".\r\n":
+                        break
+                server.delivered.extend(recipients)
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    """Runs a local SMTP server and points the config file at it."""
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.attempts, server.delivered = list(), list()
+    server.replies = dict()  # address -> codes for its next RCPTs
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(config, "smtp", {
+        **config.smtp, "host": "127.0.0.1", "port": server.server_address[1],
+        "starttls": False, "retries": 2, "retry_wait": 0})
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_emails_share_one_connection(smtp_server):
+    recipients = [f"user{i}@example.com" for i in range(4)]
+    sent = send_emails([(f"<p>{r}</p>", [r], ()) for r in recipients])
+    assert sent == [True] * 4
+    assert smtp_server.delivered == recipients
+    assert smtp_server.connections == 1
+
+
+def test_only_temporary_failures_are_retried(smtp_server):
+    smtp_server.replies = {"busy@example.com": [451],
+                           "gone@example.com": [550]}
+    recipients = ["first@example.com", "busy@example.com",
+                  "gone@example.com", "last@example.com"]
+    sent = send_emails([(f"<p>{r}</p>", [r], ()) for r in recipients])
+    assert sent == [True, True, False, True]
+    assert smtp_server.attempts == ["first@example.com", "busy@example.com",
+                                    "busy@example.com", "gone@example.com",
+                                    "last@example.com"]
+    assert smtp_server.delivered == ["first@example.com", "busy@example.com",
+                                     "last@example.com"]
+    # Only the retry opened a new connection
+    assert smtp_server.connections == 2
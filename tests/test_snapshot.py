@@ -0,0 +1,52 @@
+import os
+
+from facilityid.backends.sqlite import SQLiteBackend
+from facilityid.utils.snapshot import SNAPSHOTS, SnapshotStore
+
+from .helpers import analyzed
+
+# Larger than the signed 64-bit integers that SQLite can hold
+WIDE = 10 ** 20
+
+
+def test_wide_ids_are_stored():
+    rows = [("{1}", "WF1", 1), ("{2}", f"WF{WIDE}", WIDE), ("{3}", "", None)]
+    with SnapshotStore() as store:
+        store.store("UTIL.Stored", "0", rows=rows)
+        store.stage("UTIL.Staged", rows)
+        store.promote("UTIL.Staged", "0")
+        store.update("UTIL.Stored", [("{4}", f"WF{WIDE + 1}", WIDE + 1)])
+        assert sorted(store.used_ids("UTIL.Stored")) == [1, WIDE, WIDE + 1]
+        assert sorted(store.used_ids("UTIL.Staged")) == [1, WIDE]
+
+
+def test_wide_ids_are_staged_while_reading(generated, workspace):
+    feature = generated(500, folder=workspace)
+    SQLiteBackend().insert_rows(feature[0], feature[1],
+                                ['GLOBALID', 'FACILITYID'],
+                                [("{WIDE}", f"WF{WIDE}")])
+    editor = analyzed(feature)
+    editor.store_current()
+    assert editor.records[0]["NEWFACILITYID"] == f"WF{WIDE + 1}"
+    assert os.path.exists(SNAPSHOTS)
+    new = {int(r["NEWFACILITYID"][2:]) for r in editor.records}
+    with SnapshotStore() as store:
+        used = set(store.used_ids(feature[1]))
+    assert WIDE in used and new <= used
+
+
+def test_store_is_writable_while_rows_are_staged():
+    with SnapshotStore() as store, SnapshotStore() as other:
+        other._conn.execute("PRAGMA busy_timeout = 100")
+
+        def rows():
+            for i in range(25):
+                if i == 15:
+                    # Another worker stores a layer mid-read
+                    other.store("UTIL.Other", "0")
+                yield f"{{{i}}}", f"WF{i}", i
+
+        store.stage("UTIL.Staged", rows(), block=10)
+        store.promote("UTIL.Staged", "0")
+        assert sorted(store.used_ids("UTIL.Staged")) == list(range(25))
+        assert store.digest("UTIL.Other") == "0"
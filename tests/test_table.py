@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+from facilityid.utils.table import TableScan, split_facilityids
+
+from .helpers import split_facilityid
+
+# Characters that FACILITYIDs are drawn from, including digits that int()
+# accepts but aren't ASCII, and characters int() tolerates around digits
+_ALPHABET = ("WFwfXx" + "0123456789" * 3 + "٣５" + " _+-."
+             + "éß")
+
+
+def random_facilityids(seed: int, count: int = 20000):
+    """Yields random FACILITYIDs, mostly shaped like real ones."""
+    rnd = random.Random(seed)
+    for _ in range(count):
+        r = rnd.random()
+        if r < 0.05:
+            yield rnd.choice([None, "", 0, 123])
+        elif r < 0.6:
+            prefix = rnd.choice(["WF", "wf", "XX", "", "W F", "WF-"])
+            digits = "".join(rnd.choices("0123456789", k=rnd.randint(0, 25)))
+            yield prefix + digits
+        else:
+            yield "".join(rnd.choices(_ALPHABET, k=rnd.randint(1, 12)))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_split_matches_per_row_parsing(seed):
+    values = list(random_facilityids(seed))
+    expected = [split_facilityid(v) for v in values]
+    assert list(zip(*split_facilityids(values))) == expected
+
+
+@pytest.mark.parametrize("value", [
+    None, "", "WF", "WF0", "WF007", "wf12", "12", "WF 12", "WF12 ", "WF_1",
+    "WF+1", "WF-1", "WF1.5", "WF12a", "WF٣", "WF" + "9" * 30])
+def test_split_edge_cases(value):
+    assert tuple(c[0] for c in split_facilityids([value])) == \
+        split_facilityid(value)
+
+
+def test_row_table_round_trips_ids():
+    values = ["WF1", "WF007", None, "wf12", "WF" + "9" * 30, "WFabc"]
+    scan = TableScan()
+    scan.read((f"{{{i}}}", v, None, None) for i, v in enumerate(values))
+    table = scan.rows
+    for i, value in enumerate(values):
+        pfix, str_id, int_id = split_facilityid(value)
+        assert (table.prefix(i), table.str_id(i), table.int_id(i)) == \
+            (pfix, str_id, int_id)
+        assert table.merged(i) == pfix + str_id